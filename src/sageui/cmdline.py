@@ -68,6 +68,8 @@ def debug_shell(app):
     ip.shell.user_global_ns['app'] = app
     ip.shell.user_global_ns['repo'] = app.model.repo
     ip.shell.user_global_ns['git'] = app.model.repo.git
+    from sageui.model.diagnostics import diagnostics
+    ip.shell.user_global_ns['diagnostics'] = diagnostics
     def ipy_import(module_name, identifier):
         module = importlib.import_module(module_name)
         ip.shell.user_global_ns[identifier] = getattr(module, identifier) 
@@ -109,11 +111,14 @@ def launch():
                         default=False, 
                         help='doctest')
     parser.add_argument('--log', dest='log', default=None,
-                        help='one of [DEBUG, INFO, ERROR, WARNING, CRITICAL]')
+                        help='one of [DEBUG, INFO, ERROR, WARNING, CRITICAL], also '
+                        'logs all git commands to git_commands.log')
     args = parser.parse_args()
     if args.log is not None:
         level = getattr(logging, args.log)
         logging.basicConfig(level=level)
+        from sageui.model.git_stats import enable_log
+        enable_log()
     if args.doctest:
         run_doctests(args)
     else:
@@ -35,3 +35,77 @@ class cached_property(object):
         result = self.method(instance)
         setattr(instance, self.name, result)
         return result
+
+
+class Generations(object):
+    """
+    Counters for the state that cached values depend on
+
+    Each dependency is a string key, for example ``'refs'`` or
+    ``'config'``. Bumping a key changes its generation and therefore
+    invalidates all :class:`dependent_cached_property` values that
+    depend on it.
+    """
+
+    def __init__(self):
+        self._counters = dict()
+        self._all = 0
+
+    def __getitem__(self, key):
+        return (self._all, self._counters.get(key, 0))
+
+    def bump(self, *keys):
+        """
+        Invalidate the values depending on ``keys``, or all values if none are given
+        """
+        if not keys:
+            self._all += 1
+        for key in keys:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+
+class dependent_cached_property(object):
+    """
+    A read-only cached property that depends on the generation of some state
+
+    The instance must have a method ``generation(key)`` that returns
+    a hashable token for each dependency key, typically from a
+    :class:`Generations`. The value is recomputed whenever one of the
+    tokens changed since it was cached, and is kept otherwise.
+
+    Use it as ``@dependent_cached_property('refs', 'config')``.
+    """
+
+    def __init__(self, *dependencies):
+        self.dependencies = dependencies
+        self.method = None
+
+    def __call__(self, method):
+        self.method = method
+        self.name = method.__name__
+        self.__doc__ = method.__doc__
+        return self
+
+    def _token(self, instance):
+        return tuple(instance.generation(key) for key in self.dependencies)
+
+    def __get__(self, instance, cls):
+        if instance is None:
+            return self
+        token = self._token(instance)
+        cache = instance.__dict__.setdefault('_dependent_cache', dict())
+        entry = cache.get(self.name)
+        if entry is not None and entry[0] == token:
+            return entry[1]
+        result = self.method(instance)
+        cache[self.name] = (token, result)
+        return result
+
+    def __set__(self, instance, value):
+        raise AttributeError("can't set attribute")
+
+    def invalidate(self, instance):
+        """
+        Forget the cached value of ``instance``
+        """
+        instance.__dict__.get('_dependent_cache', dict()).pop(self.name, None)
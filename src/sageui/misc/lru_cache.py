@@ -5,9 +5,16 @@
 
 from __future__ import with_statement
 
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import cPickle
 import threading
 import time
 import uuid
+from collections import OrderedDict
 
 
 _MARKER = object()
@@ -268,15 +275,350 @@ class ExpiringLRUCache(object):
         # else: key was not in cache. Nothing to do.
 
 
+_STRINGS = (str, unicode, bytearray, buffer)
+_CONTAINERS = (list, tuple, set, frozenset)
+
+
+def default_weight(val):
+    """Return the weight of a cached value: its size in bytes
+
+    Strings weigh their length. The items of lists, tuples, sets, and
+    dictionaries are weighed recursively, since sys.getsizeof() only counts
+    the references to them. Objects that are referenced more than once are
+    counted once, so shared items and cycles do not inflate the weight.
+
+    >>> import sys
+    >>> from sageui.misc.lru_cache import default_weight
+    >>> default_weight('x' * 100)
+    100
+    >>> row = ('x' * 1000, 1)
+    >>> default_weight([row]) > 1000
+    True
+    >>> default_weight([row] * 10) < default_weight([row]) + 100
+    True
+    >>> l = []
+    >>> l.append(l)
+    >>> default_weight(l) == sys.getsizeof(l)
+    True
+    """
+    weight = 0
+    seen = set()
+    stack = [val]
+    while stack:
+        val = stack.pop()
+        if id(val) in seen:
+            continue
+        seen.add(id(val))
+        if isinstance(val, _STRINGS):
+            weight += len(val)
+            continue
+        weight += sys.getsizeof(val)
+        if isinstance(val, _CONTAINERS):
+            stack.extend(val)
+        elif isinstance(val, dict):
+            stack.extend(val.iterkeys())
+            stack.extend(val.itervalues())
+    return weight
+
+
+class WeightedLRUCache(object):
+    """ Implements a pseudo-LRU algorithm (CLOCK) with a budget on the total weight
+
+    Each entry has a weight, by default its size in bytes (see
+    default_weight). The CLOCK hand evicts entries until the total weight is
+    within max_weight. Values heavier than the whole budget are not cached.
+
+    The clock is the insertion order of an OrderedDict: the hand is always at
+    its first entry, and an entry gets its second chance by moving it to the
+    end. So eviction and invalidate() take constant time per entry.
+
+    >>> from sageui.misc.lru_cache import WeightedLRUCache
+    >>> cache = WeightedLRUCache(1000)
+    >>> l = []
+    >>> l.append(l)
+    >>> cache.put('cycle', l)
+    >>> cache.get('cycle') is l
+    True
+    """
+    def __init__(self, max_weight, weigh=default_weight):
+        max_weight = int(max_weight)
+        if max_weight < 1:
+            raise ValueError('max_weight must be >0')
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.lock = threading.Lock()
+        self.data = None
+        self.weight = 0
+        self.evictions = 0
+        self.hits = 0
+        self.misses = 0
+        self.lookups = 0
+        self.clear()
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        with self.lock:
+            # self.data contains [val, weight, ref] lists in clock order
+            self.data = OrderedDict()
+            self.weight = 0
+            self.evictions = 0
+            self.hits = 0
+            self.misses = 0
+            self.lookups = 0
+
+    def get(self, key, default=None):
+        """Return value for key. If not in cache, return default"""
+        self.lookups += 1
+        try:
+            entry = self.data[key]
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            return default
+        entry[2] = True
+        return entry[0]
+
+    def put(self, key, val):
+        """Add key to the cache with value val"""
+        weight = self.weigh(val)
+        if weight > self.max_weight:
+            self.invalidate(key)
+            return
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None:
+                self.weight += weight - entry[1]
+                entry[0] = val
+                entry[1] = weight
+                entry[2] = True
+            else:
+                self.data[key] = [val, weight, True]
+                self.weight += weight
+            self._evict(key)
+
+    def _evict(self, keep, max_weight=None):
+        """Move the hand until the weight fits, must hold the lock"""
+        if max_weight is None:
+            max_weight = self.max_weight
+        data = self.data
+        while self.weight > max_weight:
+            key = next(iter(data))
+            entry = data.pop(key)
+            if entry[2] or key == keep:
+                # second chance: move behind the hand
+                entry[2] = False
+                data[key] = entry
+                continue
+            self.weight -= entry[1]
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove key from the cache"""
+        with self.lock:
+            entry = self.data.pop(key, _MARKER)
+            if entry is _MARKER:
+                return
+            self.weight -= entry[1]
+
+    def shrink(self, fraction=0.5):
+        """Evict entries until the total weight is at most fraction of max_weight"""
+        with self.lock:
+            self._evict(None, int(self.max_weight * fraction))
+
+
+class PersistentLRUCache(object):
+    """ Two-tier cache: an LRUCache in memory in front of a directory on disk
+
+    Each value is pickled together with its key into a file named by the
+    SHA-1 of the key's repr, so keys should consist of strings and numbers
+    that identify immutable content (for example, git SHA-1s). Values found
+    on disk are promoted to the memory tier. When the files take up more
+    than max_bytes, the least recently used ones are deleted.
+
+    The memory tier is an LRUCache of the given size, unless another cache
+    (for example a WeightedLRUCache) is passed as memory.
+    """
+    def __init__(self, size, directory, max_bytes=64 * 2**20, memory=None):
+        self.memory = LRUCache(size) if memory is None else memory
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.files = None    # file name -> [last use, size], scanned lazily
+        self.bytes = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_evictions = 0
+
+    def _filename(self, key):
+        name = hashlib.sha1(repr(key)).hexdigest()
+        return name, os.path.join(self.directory, name[:2], name[2:])
+
+    def _scan(self):
+        """Find the files on disk, must hold the lock"""
+        if self.files is not None:
+            return
+        files = {}
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, filename))
+                except OSError:
+                    continue
+                files[os.path.basename(dirpath) + filename] = [st.st_mtime, st.st_size]
+                total += st.st_size
+        self.files = files
+        self.bytes = total
+
+    def _evict(self):
+        """Delete the least recently used files, must hold the lock"""
+        target = self.max_bytes * 9 // 10
+        for name, (used, size) in sorted(self.files.items(), key=lambda item: item[1][0]):
+            if self.bytes <= target:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name[:2], name[2:]))
+            except OSError:
+                pass
+            del self.files[name]
+            self.bytes -= size
+            self.disk_evictions += 1
+
+    def get(self, key, default=None):
+        """Return value for key. If in neither tier, return default"""
+        val = self.memory.get(key, _MARKER)
+        if val is not _MARKER:
+            return val
+        name, filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                stored_key, val = cPickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError, cPickle.UnpicklingError):
+            stored_key = _MARKER
+        if stored_key != key:
+            self.disk_misses += 1
+            return default
+        self.disk_hits += 1
+        now = time.time()
+        try:
+            os.utime(filename, (now, now))
+        except OSError:
+            pass
+        with self.lock:
+            if self.files is not None and name in self.files:
+                self.files[name][0] = now
+        self.memory.put(key, val)
+        return val
+
+    def put(self, key, val):
+        """Add key to both tiers"""
+        self.memory.put(key, val)
+        data = cPickle.dumps((key, val), cPickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        name, filename = self._filename(key)
+        with self.lock:
+            self._scan()
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                return
+        tmp = '{0}.{1}.tmp'.format(filename, uuid.uuid4().hex)
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.rename(tmp, filename)
+        except (IOError, OSError):
+            return
+        with self.lock:
+            old = self.files.get(name)
+            if old is not None:
+                self.bytes -= old[1]
+            self.files[name] = [time.time(), len(data)]
+            self.bytes += len(data)
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def invalidate(self, key):
+        """Remove key from both tiers"""
+        self.memory.invalidate(key)
+        name, filename = self._filename(key)
+        try:
+            os.remove(filename)
+        except OSError:
+            return
+        with self.lock:
+            if self.files is not None and name in self.files:
+                self.bytes -= self.files.pop(name)[1]
+
+    def shrink(self, fraction=0.5):
+        """Shrink the memory tier, the files on disk are kept"""
+        if hasattr(self.memory, 'shrink'):
+            self.memory.shrink(fraction)
+        else:
+            self.memory.clear()
+
+    def clear_memory(self):
+        """Remove all entries from the memory tier, the files on disk are kept"""
+        self.memory.clear()
+
+    def statistics(self):
+        """Return the counters of both tiers as a dictionary"""
+        memory = self.memory
+        with self.lock:
+            self._scan()
+            files, disk_bytes = len(self.files), self.bytes
+        return {'hits': memory.hits, 'misses': memory.misses, 'lookups': memory.lookups,
+                'evictions': memory.evictions, 'size': len(memory.data),
+                'bytes': getattr(memory, 'weight', None),
+                'disk_hits': self.disk_hits, 'disk_misses': self.disk_misses,
+                'disk_evictions': self.disk_evictions, 'disk_size': files,
+                'disk_bytes': disk_bytes}
+
+    def clear(self):
+        """Remove all entries from both tiers"""
+        self.memory.clear()
+        with self.lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.files = {}
+            self.bytes = 0
+            self.disk_hits = 0
+            self.disk_misses = 0
+            self.disk_evictions = 0
+
+
 class lru_cache(object):
     """ Decorator for LRU-cached function
 
     timeout parameter specifies after how many seconds a cached entry should
     be considered invalid.
+
+    maxbytes parameter bounds the total weight of the cached results instead
+    of their number (see WeightedLRUCache), maxsize may then be None.
+
+    >>> from sageui.misc.lru_cache import lru_cache
+    >>> decorator = lru_cache(None, maxbytes=250)
+    >>> @decorator
+    ... def repeat(n):
+    ...     return 'x' * n
+    >>> repeat(100) is repeat(100)
+    True
+    >>> _ = repeat(120), repeat(140)
+    >>> decorator.cache.weight <= 250, decorator.cache.evictions > 0
+    (True, True)
+    >>> repeat(300) is repeat(300)   # heavier than the budget
+    False
     """
-    def __init__(self, maxsize, cache=None, timeout=None): # cache is an arg to serve tests
+    def __init__(self, maxsize, cache=None, timeout=None, maxbytes=None): # cache is an arg to serve tests
         if cache is None:
-            if timeout is None:
+            if maxbytes is not None:
+                if timeout is not None:
+                    raise ValueError('cannot combine timeout and maxbytes')
+                cache = WeightedLRUCache(maxbytes)
+            elif timeout is None:
                 cache = LRUCache(maxsize)
             else:
                 cache = ExpiringLRUCache(maxsize, default_timeout=timeout)
@@ -300,15 +642,18 @@ class lru_cache(object):
 class CacheMaker(object):
     """Generates decorators that can be cleared later
     """
-    def __init__(self, maxsize=None, timeout=_DEFAULT_TIMEOUT):
+    def __init__(self, maxsize=None, timeout=_DEFAULT_TIMEOUT, maxbytes=None):
         """Create cache decorator factory.
 
         - maxsize : the default size for created caches.
 
         - timeout : the defaut expiraiton time for created caches.
+
+        - maxbytes : the default weight budget for created weighted caches.
         """
         self._maxsize = maxsize
         self._timeout = timeout
+        self._maxbytes = maxbytes
         self._cache = {}
 
     def _resolve_setting(self, name=None, maxsize=None, timeout=None):
@@ -360,6 +705,39 @@ class CacheMaker(object):
         cache = self._cache[name] = ExpiringLRUCache(maxsize, timeout)
         return lru_cache(maxsize, cache, timeout)
     
+    def weighted_lrucache(self, name=None, maxbytes=None, weigh=default_weight):
+        """Named arguments:
+
+        - name (optional) is a string, and should be unique amongst all caches
+
+        - maxbytes (optional) is an int, overriding any default value set by
+          the constructor
+
+        - weigh (optional) is a function returning the weight of a value,
+          by default its size in bytes
+
+        >>> from sageui.misc.lru_cache import CacheMaker
+        >>> maker = CacheMaker(maxbytes=1000)
+        >>> calls = []
+        >>> @maker.weighted_lrucache('lines', weigh=len)
+        ... def lines(n):
+        ...     calls.append(n)
+        ...     return ['line'] * n
+        >>> lines(3) == lines(3), calls
+        (True, [3])
+        >>> maker.clear('lines')
+        >>> _ = lines(3)
+        >>> calls
+        [3, 3]
+        """
+        if maxbytes is None:
+            maxbytes = self._maxbytes
+        if maxbytes is None:
+            raise ValueError("Cache must have a maxbytes set")
+        name, _, _ = self._resolve_setting(name, maxbytes)
+        cache = self._cache[name] = WeightedLRUCache(maxbytes, weigh)
+        return lru_cache(None, cache)
+
     def clear(self, *names):
         """Clear the given cache(s).
         
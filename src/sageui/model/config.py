@@ -94,3 +94,43 @@ class Config(object):
     def sage_version(self, value):
         self._data['sage_version'] = value
         self._save()
+
+    @property
+    def git_network_timeout(self):
+        """
+        Seconds after which git commands that download are killed
+        """
+        return self._data.get('git_network_timeout', 300)
+
+    @git_network_timeout.setter
+    def git_network_timeout(self, value):
+        self._data['git_network_timeout'] = value
+        self._save()
+
+    @property
+    def git_worktrees(self):
+        """
+        Whether to check out each ticket branch in its own worktree
+
+        See :mod:`~sageui.model.git_worktree`.
+        """
+        return self._data.get('git_worktrees', False)
+
+    @git_worktrees.setter
+    def git_worktrees(self, value):
+        self._data['git_worktrees'] = value
+        self._save()
+
+    @property
+    def git_preserve_mtimes(self):
+        """
+        Whether checkouts restore the modification times of known contents
+
+        See :mod:`~sageui.model.git_mtime`.
+        """
+        return self._data.get('git_preserve_mtimes', False)
+
+    @git_preserve_mtimes.setter
+    def git_preserve_mtimes(self, value):
+        self._data['git_preserve_mtimes'] = value
+        self._save()
@@ -0,0 +1,249 @@
+r"""
+Diagnostics of the Caches and Model Containers
+
+The caches of the model (git command results, diffs, the persistent
+cache) and the containers that hold model objects (interned commits,
+trac tickets) register themselves with the global
+:data:`diagnostics` registry. It reports their entry counts,
+estimated sizes in bytes, and hit ratios, counts the live instances
+of the tracked model classes, and can shrink or clear all caches on
+demand.
+
+The registry only keeps weak references, so registering does not
+keep anything alive. It is available as ``diagnostics`` in the
+``--debug`` IPython shell.
+
+EXAMPLES::
+
+    sage: from sageui.model.diagnostics import diagnostics
+    sage: repo = test.new_git_repo()
+    sage: history = repo.head.get_history()
+    sage: cache = repo.git.cache
+    sage: report = diagnostics.report(cache)
+    sage: report['name'], report['size'] > 0, report['bytes'] > 0
+    ('git results', True, True)
+    sage: 0 <= report['hit_ratio'] <= 1
+    True
+    sage: diagnostics.report(repo.commits)['size'] == len(repo.commits)
+    True
+    sage: diagnostics.instances()['GitCommit'] >= len(history)
+    True
+
+Shrinking evicts entries from the caches, clearing removes all::
+
+    sage: diagnostics.shrink(0)
+    sage: diagnostics.report(cache)['size']
+    0
+    sage: diagnostics.clear()
+    sage: diagnostics.report(cache)['lookups']
+    0
+
+The whole report is also available as JSON::
+
+    sage: import json
+    sage: data = json.loads(diagnostics.to_json())
+    sage: sorted(data)
+    [u'caches', u'instances']
+    sage: 'git results' in [row['name'] for row in data['caches']]
+    True
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import gc
+import json
+import weakref
+
+
+class Diagnostics(object):
+    """
+    Registry of caches and model containers
+
+    You should not construct this yourself, use the global
+    :data:`diagnostics`.
+
+    A registered object must have a ``statistics()`` method that
+    returns a dictionary. The keys ``size`` (number of entries),
+    ``bytes`` (estimated memory), ``hits``, and ``lookups`` are
+    understood, any others are reported as they are. Objects with a
+    ``shrink(fraction)`` or ``clear()`` method are shrunk or cleared
+    on demand.
+    """
+
+    def __init__(self):
+        self._objects = []
+        self._classes = []
+
+    def __repr__(self):
+        lines = ['{0:<20} {1:>8} {2:>12} {3:>9}'.format('name', 'entries', 'bytes', 'hit ratio')]
+        for row in self.report():
+            ratio = row.get('hit_ratio')
+            lines.append('{0:<20} {1:>8} {2:>12} {3:>9}'.format(
+                row['name'], row.get('size', ''),
+                '' if row.get('bytes') is None else row['bytes'],
+                '' if ratio is None else '{0:.1%}'.format(ratio)))
+        for name, count in sorted(self.instances().items()):
+            lines.append('{0:<20} {1:>8} live'.format(name, count))
+        return '\n'.join(lines)
+
+    def register(self, name, obj):
+        """
+        Register a cache or container
+
+        INPUT:
+
+        - ``name`` -- string. The name in the report.
+
+        - ``obj`` -- an object with a ``statistics()`` method.
+
+        OUTPUT:
+
+        ``obj``.
+        """
+        self._objects.append((name, weakref.ref(obj)))
+        return obj
+
+    def track(self, cls):
+        """
+        Count the live instances of a class in :meth:`instances`
+
+        INPUT:
+
+        - ``cls`` -- a class. Instances of subclasses are counted, too.
+
+        OUTPUT:
+
+        ``cls``, so this can be used as a class decorator.
+        """
+        if cls not in self._classes:
+            self._classes.append(cls)
+        return cls
+
+    def _live(self):
+        """
+        Return the registered ``(name, object)`` pairs that are still alive
+        """
+        result = []
+        alive = []
+        for name, ref in self._objects:
+            obj = ref()
+            if obj is not None:
+                result.append((name, obj))
+                alive.append((name, ref))
+        self._objects = alive
+        return result
+
+    def _row(self, name, obj):
+        row = dict(obj.statistics())
+        row['name'] = name
+        lookups = row.get('lookups')
+        if lookups is not None:
+            row['hit_ratio'] = float(row.get('hits', 0)) / lookups if lookups else None
+        return row
+
+    def report(self, obj=None):
+        """
+        Return the statistics of the registered objects
+
+        INPUT:
+
+        - ``obj`` -- a registered object or ``None`` (default).
+
+        OUTPUT:
+
+        The dictionary of statistics of ``obj`` with its ``name`` and
+        ``hit_ratio`` added, or the list of these dictionaries for
+        all registered objects.
+        """
+        if obj is None:
+            return [self._row(name, o) for name, o in self._live()]
+        for name, o in self._live():
+            if o is obj:
+                return self._row(name, o)
+        raise ValueError('{0!r} is not registered'.format(obj))
+
+    def instances(self):
+        """
+        Count the live instances of the tracked classes
+
+        This looks at all objects known to the garbage collector, so
+        it is slow.
+
+        OUTPUT:
+
+        Dictionary with the class names as keys and the counts as
+        values.
+        """
+        classes = tuple(self._classes)
+        result = dict((cls.__name__, 0) for cls in classes)
+        for obj in gc.get_objects():
+            if isinstance(obj, classes):
+                for cls in classes:
+                    if isinstance(obj, cls):
+                        result[cls.__name__] += 1
+        return result
+
+    def to_json(self, indent=2):
+        """
+        Return the report and the instance counts as JSON string
+        """
+        data = {'caches': self.report(), 'instances': self.instances()}
+        return json.dumps(data, indent=indent, sort_keys=True, default=repr)
+
+    def dump(self, filename):
+        """
+        Write :meth:`to_json` to a file
+        """
+        with open(filename, 'w') as f:
+            f.write(self.to_json())
+
+    def shrink(self, fraction=0.5):
+        """
+        Shrink all caches
+
+        INPUT:
+
+        - ``fraction`` -- number between 0 and 1 (default: 0.5). The
+          fraction of their budget that the caches may keep. Caches
+          without a budget are cleared.
+        """
+        for name, obj in self._live():
+            if hasattr(obj, 'shrink'):
+                obj.shrink(fraction)
+            elif hasattr(obj, 'clear'):
+                obj.clear()
+        gc.collect()
+
+    def clear(self):
+        """
+        Clear all caches and reset their statistics
+
+        Only the memory is cleared, the files of a persistent cache
+        on disk are kept.
+        """
+        for name, obj in self._live():
+            if hasattr(obj, 'clear_memory'):
+                obj.clear_memory()
+            elif hasattr(obj, 'clear'):
+                obj.clear()
+        gc.collect()
+
+
+diagnostics = Diagnostics()
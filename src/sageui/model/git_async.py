@@ -0,0 +1,481 @@
+r"""
+Asynchronous Git Execution
+
+Git commands that are run from GTK signal handlers must not block the
+main loop, otherwise the whole user interface freezes until git is
+done. The :class:`GitAsyncProcess` starts git and reads its output
+through ``gobject.io_add_watch`` callbacks. The result is delivered
+through a :class:`GitDeferred`, which is a stripped-down version of
+the Twisted deferred.
+
+If gobject is not available (or there is no main loop running, like
+in the doctests) then you can call :meth:`GitDeferred.wait` to block
+until the result is available.
+
+EXAMPLES::
+
+    sage: repo = test.git_repo()
+    sage: d = repo.git.execute_async('rev-parse', 'master')
+    sage: d.add_callback(lambda stdout: stdout.strip() == repo.master.commit.sha1)
+    <GitDeferred pending>
+    sage: d.wait()
+    True
+
+Errors are passed to the errbacks::
+
+    sage: d = repo.git.execute_async('rev-parse', '--verify', 'nonexisting')
+    sage: d.add_errback(lambda error: error.exit_code)
+    <GitDeferred pending>
+    sage: d.wait()
+    128
+
+If a callback returns another deferred then the callback chain waits
+for it::
+
+    sage: d = repo.git.execute_async('rev-parse', 'master')
+    sage: d.add_callback(lambda sha1: repo.git.execute_async('log', sha1.strip(), format='%s', max_count=1))
+    <GitDeferred pending>
+    sage: d.wait()
+    'initial commit\n'
+
+Long-running commands can be cancelled, or killed after a timeout::
+
+    sage: d = repo.git.run_async('fetch', (repo.git.git_dir,), {'upload_pack':'sleep 10 #'}, timeout=0.1)
+    sage: d.wait()
+    Traceback (most recent call last):
+    ...
+    GitCancelledError: timeout after 0.1 seconds when executing "git fetch --upload-pack=sleep 10 # ..."
+    sage: d = repo.git.run_async('fetch', (repo.git.git_dir,), {'upload_pack':'sleep 10 #'})
+    sage: d.cancel()
+    sage: d.wait()
+    Traceback (most recent call last):
+    ...
+    GitCancelledError: cancelled "git fetch --upload-pack=sleep 10 # ..."
+
+An error that no errback handled is logged when the deferred is
+garbage collected, so that it does not disappear without a trace::
+
+    sage: import logging
+    sage: class PrintHandler(logging.Handler):
+    ....:     def emit(self, record):
+    ....:         print(record.getMessage())
+    sage: handler = PrintHandler()
+    sage: logging.getLogger().addHandler(handler)
+    sage: from sageui.model.git_async import GitDeferred
+    sage: d = GitDeferred()
+    sage: d.errback(ValueError('lost'))
+    sage: del d
+    Unhandled error in a deferred: ValueError('lost',)
+    sage: d = GitDeferred().add_errback(lambda error: None)
+    sage: d.errback(ValueError('handled'))
+    sage: del d
+    sage: logging.getLogger().removeHandler(handler)
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import time
+import signal
+import select
+import subprocess
+import logging
+
+from git_error import GitError, GitCancelledError
+from git_stats import GitProcess
+
+
+# All processes that have not finished yet
+_running = set()
+
+# Bytes to read per io watch callback
+_CHUNK_SIZE = 65536
+
+
+class _UnhandledError(object):
+    """
+    Log an error that is still unhandled when it is garbage collected
+
+    This is separate from :class:`GitDeferred`, which is usually part
+    of a reference cycle: objects with a ``__del__`` method in a cycle
+    are never collected.
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+    def __del__(self):
+        if self.error is not None:
+            logging.error('Unhandled error in a deferred: %r', self.error)
+
+
+class GitDeferred(object):
+    """
+    The eventual result of an asynchronous computation.
+
+    Callbacks are called in the order in which they were added, each
+    receives the return value of the previous one. If a callback raises
+    an exception, the next errback is called with it instead. An error
+    at the end of the chain that is neither handled by an errback nor
+    raised by :meth:`wait` is logged when the deferred goes away.
+
+    INPUT:
+
+    - ``canceller`` -- function or ``None`` (default). Called with the
+      deferred if :meth:`cancel` is called before the result is
+      available. It should stop the computation and fire the
+      deferred.
+    """
+
+    def __init__(self, canceller=None):
+        self._callbacks = []
+        self._called = False
+        self._paused = 0
+        self._canceller = canceller
+        self._waiting_for = None
+        self._unhandled = None
+        self.result = None
+        self.failed = False
+
+    def __repr__(self):
+        if not self.called:
+            return '<GitDeferred pending>'
+        elif self.failed:
+            return '<GitDeferred failed: {0!r}>'.format(self.result)
+        else:
+            return '<GitDeferred result: {0!r}>'.format(self.result)
+
+    @property
+    def called(self):
+        """
+        Whether the final result of the callback chain is available
+        """
+        return self._called and not self._paused and not self._callbacks
+
+    def add_callbacks(self, callback, errback=None):
+        """
+        Add a callback/errback pair to the chain
+
+        Either may be ``None`` to pass the result/error through.
+        Returns the deferred itself.
+        """
+        self._callbacks.append((callback, errback))
+        if self._called:
+            self._run_callbacks()
+        return self
+
+    def add_callback(self, callback):
+        return self.add_callbacks(callback, None)
+
+    def add_errback(self, errback):
+        return self.add_callbacks(None, errback)
+
+    def add_both(self, callback):
+        return self.add_callbacks(callback, callback)
+
+    def callback(self, result):
+        """
+        Start the callback chain with a result
+        """
+        self._start(result, False)
+
+    def errback(self, error):
+        """
+        Start the callback chain with an exception
+        """
+        self._start(error, True)
+
+    def cancel(self):
+        """
+        Stop the computation whose result the deferred is waiting for
+
+        If a callback returned another deferred that has not fired
+        yet, then that one is cancelled. Otherwise the canceller is
+        called. Does nothing if there is nothing left to cancel.
+        """
+        if self._waiting_for is not None:
+            self._waiting_for.cancel()
+        elif not self._called and self._canceller is not None:
+            self._canceller(self)
+
+    def _start(self, result, failed):
+        if self._called:
+            raise RuntimeError('deferred was already called')
+        self._called = True
+        self.result = result
+        self.failed = failed
+        self._run_callbacks()
+
+    def _handled(self):
+        """
+        Mark the error at the end of the chain as handled
+        """
+        if self._unhandled is not None:
+            self._unhandled.error = None
+            self._unhandled = None
+
+    def _run_callbacks(self):
+        self._handled()
+        while self._callbacks and not self._paused:
+            callback, errback = self._callbacks.pop(0)
+            function = errback if self.failed else callback
+            if function is None:
+                continue
+            try:
+                result = function(self.result)
+            except Exception as error:
+                self.result, self.failed = error, True
+                continue
+            if isinstance(result, GitDeferred):
+                self._paused += 1
+                self._waiting_for = result
+                result.add_callbacks(self._continue, self._continue_failed)
+                return
+            self.result, self.failed = result, False
+        if self.failed and not self._paused:
+            self._unhandled = _UnhandledError(self.result)
+
+    def _continue(self, result):
+        self._paused -= 1
+        self._waiting_for = None
+        self.result, self.failed = result, False
+        self._run_callbacks()
+        return result
+
+    def _continue_failed(self, error):
+        self._paused -= 1
+        self._waiting_for = None
+        self.result, self.failed = error, True
+        self._run_callbacks()
+        return error
+
+    def wait(self):
+        """
+        Block until the callback chain has finished.
+
+        This does not need a main loop, the output of pending git
+        processes is read directly.
+
+        OUTPUT:
+
+        The final result. If the chain ends with an error, it is
+        raised.
+        """
+        while not self.called:
+            if len(_running) == 0:
+                raise RuntimeError('deferred is waiting for something other than git')
+            process = next(iter(_running))
+            process.wait()
+        if self.failed:
+            self._handled()
+            raise self.result
+        return self.result
+
+
+def _io_add_watch(fd, callback):
+    """
+    Register ``callback`` with the main loop, return the source id or ``None``
+    """
+    try:
+        import gobject
+    except ImportError:
+        return None
+    condition = gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR
+    return gobject.io_add_watch(fd, condition, callback)
+
+
+def _timeout_add(seconds, callback):
+    """
+    Call ``callback`` from the main loop, return the source id or ``None``
+    """
+    try:
+        import gobject
+    except ImportError:
+        return None
+    return gobject.timeout_add(int(seconds * 1000), callback)
+
+
+def _source_remove(source_id):
+    import gobject
+    gobject.source_remove(source_id)
+
+
+class GitAsyncProcess(object):
+    """
+    A git subprocess whose output is collected on the main loop
+
+    You should not construct this yourself, use
+    :meth:`GitInterface.execute_async
+    <sageui.model.git_interface.GitInterface.execute_async>`.
+
+    INPUT:
+
+    - ``git`` -- the :class:`~sageui.model.git_interface.GitInterface`.
+
+    - ``cmd_line`` -- list of strings. The complete command line.
+
+    - ``cwd`` -- string or ``None``. The working directory for git.
+
+    - ``invalidate_cache`` -- boolean. Whether to invalidate the
+      result cache of ``git`` when the process has finished.
+
+    - ``progress`` -- function or ``None``. Called with each
+      :class:`~sageui.model.git_records.ProgressRecord` that git
+      writes to stderr.
+
+    - ``timeout`` -- number or ``None``. Kill git if it has not
+      finished after that many seconds.
+
+    Git runs in its own process group, so that :meth:`cancel` also
+    kills helpers like ``ssh`` or ``git-remote-http``.
+    """
+
+    def __init__(self, git, cmd_line, cwd=None, invalidate_cache=False,
+                 progress=None, timeout=None):
+        self._git = git
+        self._invalidate_cache = invalidate_cache
+        self._cmd_line = cmd_line
+        self.cmd = ' '.join(cmd_line)
+        self.deferred = GitDeferred(canceller=lambda deferred: self.cancel())
+        self._timer = git.statistics.timer(cmd_line)
+        with open(os.devnull, 'rb') as devnull:
+            self._process = GitProcess(
+                cmd_line, stdin=devnull, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                env=git._environment(), cwd=cwd, close_fds=True, preexec_fn=os.setpgrp)
+        self._stdout_fd = self._process.stdout.fileno()
+        self._stderr_fd = self._process.stderr.fileno()
+        self._buffers = {self._stdout_fd: [], self._stderr_fd: []}
+        self._open = set([self._stdout_fd, self._stderr_fd])
+        self._watches = dict()
+        if progress is None:
+            self._progress = None
+        else:
+            from git_records import ProgressParser
+            self._progress = ProgressParser(progress)
+        self._killed = False
+        self._killed_by_timeout = None
+        self._timeout = timeout
+        self._deadline = None if timeout is None else time.time() + timeout
+        self._timeout_source = None
+        _running.add(self)
+        for fd in self._open:
+            source_id = _io_add_watch(fd, self._on_io)
+            if source_id is not None:
+                self._watches[fd] = source_id
+        if timeout is not None:
+            self._timeout_source = _timeout_add(timeout, self._on_timeout)
+
+    def _on_timeout(self):
+        self._timeout_source = None
+        self._kill(self._timeout)
+        return False
+
+    def cancel(self):
+        """
+        Kill git
+
+        The errbacks of the deferred are called with a
+        :class:`~sageui.model.git_error.GitCancelledError`. Does
+        nothing if git has already finished.
+        """
+        self._kill(None)
+
+    def _kill(self, timeout):
+        if self._buffers is None or self._killed:
+            return
+        self._killed = True
+        self._killed_by_timeout = timeout
+        logging.debug('killing git: %s', self.cmd)
+        try:
+            os.killpg(self._process.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    def _on_io(self, fd, condition):
+        keep_watching = self._read(fd)
+        if not keep_watching:
+            self._watches.pop(fd, None)
+        return keep_watching
+
+    def _read(self, fd):
+        """
+        Read from ``fd``, return whether there might be more data
+        """
+        data = os.read(fd, _CHUNK_SIZE)
+        if data:
+            self._buffers[fd].append(data)
+            if self._progress is not None and fd == self._stderr_fd:
+                self._progress.feed(data)
+            return True
+        self._open.discard(fd)
+        if len(self._open) == 0:
+            self._finish()
+        return False
+
+    def wait(self):
+        """
+        Block until git has finished.
+        """
+        for source_id in self._watches.values():
+            _source_remove(source_id)
+        self._watches.clear()
+        while self._open:
+            if self._deadline is None or self._killed:
+                timeout = None
+            else:
+                timeout = max(0, self._deadline - time.time())
+            readable, _, _ = select.select(list(self._open), [], [], timeout)
+            if not readable and timeout is not None:
+                self._kill(self._timeout)
+            for fd in readable:
+                self._read(fd)
+
+    def _finish(self):
+        _running.discard(self)
+        if self._timeout_source is not None:
+            _source_remove(self._timeout_source)
+            self._timeout_source = None
+        if self._progress is not None:
+            self._progress.close()
+        self._process.stdout.close()
+        self._process.stderr.close()
+        try:
+            exit_code = self._process.wait()
+        except OSError as error:
+            # reaped elsewhere, so we cannot tell whether git succeeded
+            logging.warning('cannot reap %s: %s', self.cmd, error)
+            exit_code = None
+        stdout = ''.join(self._buffers[self._stdout_fd])
+        stderr = ''.join(self._buffers[self._stderr_fd])
+        self._buffers = None
+        self._timer.stop(exit_code, len(stdout), len(stderr), self._process.cpu_time)
+        self._git._record('run', self._cmd_line, (exit_code, stdout, stderr))
+        if self._invalidate_cache:
+            self._git.cache.invalidate()
+        self._git._log('stdout', stdout)
+        self._git._log('stderr', stderr)
+        result = {'exit_code':exit_code, 'stdout':stdout, 'stderr':stderr, 'cmd':self.cmd}
+        if self._killed and exit_code != 0:
+            self.deferred.errback(GitCancelledError(result, self._killed_by_timeout))
+        elif exit_code != 0:
+            logging.debug('git failed: %s', self.cmd)
+            self.deferred.errback(GitError(result))
+        else:
+            self.deferred.callback(stdout)
@@ -32,34 +32,67 @@ EXAMPLES::
 
 
 from git_commit import GitCommit
+from git_error import GitObjectMissingError
 
 
-def GitBranch(git_repository, name, commit=None):
+def parse_branch_name(prefix, prefix_nonumber, name):
     """
-    Construct a branch object given the name as a string
+    Split a local branch name into its managed-branch fields
+
+    INPUT:
+
+    - ``prefix``, ``prefix_nonumber`` -- strings. The prefixes of
+      managed branches with and without ticket number.
+
+    - ``name`` -- string. The full branch name.
+
+    OUTPUT:
+
+    A triple ``(managed, ticket_number, description)`` or ``None``
+    if the branch is neither a local nor a managed branch.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_branch import parse_branch_name
+        sage: parse_branch_name('sageui/', 'sageui/none/', 'master')
+        (False, None, 'master')
+        sage: parse_branch_name('sageui/', 'sageui/none/', 'sageui/1234/u/user/work')
+        (True, 1234, 'u/user/work')
+        sage: parse_branch_name('sageui/', 'sageui/none/', 'sageui/none/u/user/work')
+        (True, None, 'u/user/work')
+        sage: parse_branch_name('sageui/', 'sageui/none/', 'other/branch') is None
+        True
     """
-    if commit is not None:
-        commit = GitCommit(git_repository, commit)
-    prefix = git_repository.prefix
-    prefix_nonumber = git_repository.prefix_nonumber
     if '/' not in name:
-        return GitLocalBranch(git_repository, name, commit)
+        return (False, None, name)
     elif name.startswith(prefix_nonumber):
-        description = name[len(prefix_nonumber):]
-        return GitManagedBranch(git_repository, description, None, commit)
+        return (True, None, name[len(prefix_nonumber):])
     elif name.startswith(prefix):
         start = len(prefix)
         end = name.find('/', start+1)
         number = name[start:end]
         description = name[end+1:]
         try:
-            number = int(number)
-            return GitManagedBranch(git_repository, description, number, commit)
+            return (True, int(number), description)
         except ValueError:
             pass
-    
 
 
+def GitBranch(git_repository, name, commit=None):
+    """
+    Construct a branch object given the name as a string
+    """
+    if commit is not None:
+        commit = GitCommit(git_repository, commit)
+    fields = parse_branch_name(git_repository.prefix, git_repository.prefix_nonumber, name)
+    if fields is None:
+        return None
+    managed, number, description = fields
+    if managed:
+        return GitManagedBranch(git_repository, description, number, commit)
+    return GitLocalBranch(git_repository, name, commit)
+    
+
 class GitBranchABC(object):
     """
     Base class for git branches
@@ -100,11 +133,40 @@ class GitBranchABC(object):
             '087e1fdd0fe6f4c596f5db22bc54567b032f5d2b'
         """
         if self._commit is None:
-            sha1 = self.repository.git.show_ref(
-                'refs/heads/'+self.full_branch_name, verify=True, hash=True)
+            refname = 'refs/heads/'+self.full_branch_name
+            sha1 = self.repository.git.refs.resolve(refname)
+            if sha1 is None:
+                raise GitObjectMissingError(refname)
             self._commit = GitCommit(self.repository, sha1)
         return self._commit
 
+    def ahead_behind(self, base=None):
+        """
+        Return the number of commits ahead and behind ``base``
+
+        The counts of all local branches are computed together and
+        cached until the references change, see
+        :meth:`GitRepository.ahead_behind
+        <sageui.model.git_repository.GitRepository.ahead_behind>`.
+
+        INPUT:
+
+        - ``base`` -- a :class:`~sageui.model.git_commit.GitCommit`
+          or ``None`` (default). The commit to compare with. By
+          default, ``master``.
+
+        OUTPUT:
+
+        A pair ``(ahead, behind)`` of integers.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: repo.current_branch().ahead_behind()
+            (5, 0)
+        """
+        return self.repository.ahead_behind(base)[self.full_branch_name]
+
     def __hash__(self):
         key = (self.full_branch_name, self.commit.sha1)
         return hash(key)
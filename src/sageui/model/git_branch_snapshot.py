@@ -0,0 +1,256 @@
+r"""
+Snapshot of All Local Branches
+
+The branch combo box, the ticket lookups, and the comparisons with the
+current branch all need the commits of many branches. Instead of
+resolving them one by one, a :class:`BranchSnapshot` is loaded with a
+single ``git for-each-ref``. For each branch it holds the commit, the
+committer date, the upstream branch, and the managed-branch fields
+(see :mod:`~sageui.model.git_branch`) in flat arrays, and it indexes
+the branches by name and by ticket number.
+
+The snapshot is immutable. :meth:`GitRepository.branch_snapshot
+<sageui.model.git_repository.GitRepository.branch_snapshot>` loads a
+new one only when the references changed.
+
+EXAMPLES::
+
+    sage: repo = test.new_git_repo()
+    sage: snapshot = repo.branch_snapshot()
+    sage: snapshot
+    <BranchSnapshot of 7 branches>
+    sage: 'my_branch' in snapshot
+    True
+    sage: snapshot.branch('my_branch')
+    Git branch my_branch
+    sage: snapshot.ticket_branches(1001)
+    [Git branch sageui/1001/u/alice/work, Git branch sageui/1001/u/bob/work]
+    sage: snapshot.committer_date('master') == int(repo.git.log('master', format='%ct', max_count=1))
+    True
+    sage: snapshot.sha1('master') == repo.master.commit.sha1
+    True
+    sage: repo.branch_snapshot() is snapshot
+    True
+    sage: repo.git.silent.branch('new_branch')
+    sage: repo.branch_snapshot() is snapshot
+    False
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+from array import array
+from binascii import hexlify, unhexlify
+
+from git_interface import GitQuery
+from git_branch import parse_branch_name, GitLocalBranch, GitManagedBranch
+from git_commit import GitCommit
+
+
+# The ``for-each-ref`` query, one line per branch with NUL-separated fields
+BRANCH_SNAPSHOT_QUERY = GitQuery(
+    'for-each-ref', 'refs/heads/', sort='committerdate',
+    format='%(objectname)%00%(committerdate:raw)%00%(upstream:short)%00%(refname:short)')
+
+
+# Values of the kind array
+_OTHER, _LOCAL, _MANAGED = 0, 1, 2
+
+# Ticket number of branches without ticket
+_NO_TICKET = -1
+
+
+class BranchSnapshot(object):
+    """
+    All local branches at one point in time
+
+    You should not construct this yourself, use
+    :meth:`GitRepository.branch_snapshot
+    <sageui.model.git_repository.GitRepository.branch_snapshot>`.
+
+    INPUT:
+
+    - ``repository`` -- a
+      :class:`~sageui.model.git_repository.GitRepository`.
+
+    - ``output`` -- string. The output of
+      :data:`BRANCH_SNAPSHOT_QUERY`.
+
+    - ``fingerprint`` -- the references fingerprint at the time the
+      output was produced, or ``None`` if unknown.
+    """
+
+    def __init__(self, repository, output, fingerprint=None):
+        self.repository = repository
+        self.fingerprint = fingerprint
+        names = []
+        descriptions = []
+        upstreams = []
+        sha1s = []
+        dates = array('l')
+        tickets = array('l')
+        kinds = array('b')
+        prefix = repository.prefix
+        prefix_nonumber = repository.prefix_nonumber
+        for line in output.splitlines():
+            sha1, date, upstream, name = line.split('\0', 3)
+            names.append(name)
+            sha1s.append(unhexlify(sha1))
+            dates.append(int(date.split(' ', 1)[0]) if date else 0)
+            upstreams.append(upstream or None)
+            fields = parse_branch_name(prefix, prefix_nonumber, name)
+            if fields is None:
+                kinds.append(_OTHER)
+                tickets.append(_NO_TICKET)
+                descriptions.append(name)
+                continue
+            managed, number, description = fields
+            kinds.append(_MANAGED if managed else _LOCAL)
+            tickets.append(_NO_TICKET if number is None else number)
+            descriptions.append(description)
+        self._names = tuple(names)
+        self._descriptions = tuple(descriptions)
+        self._upstreams = tuple(upstreams)
+        self._sha1s = ''.join(sha1s)
+        self._dates = dates
+        self._tickets = tickets
+        self._kinds = kinds
+        self._by_name = dict((name, i) for i, name in enumerate(names))
+        self._ahead_behind = dict()
+        self._by_ticket = dict()
+        for i, number in enumerate(tickets):
+            if number != _NO_TICKET:
+                self._by_ticket.setdefault(number, []).append(i)
+
+    def __repr__(self):
+        return '<BranchSnapshot of {0} branches>'.format(len(self))
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def _index(self, name):
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise KeyError('no branch named ' + name)
+
+    def names(self):
+        """
+        Return the names of all branches, oldest commit first
+        """
+        return list(self._names)
+
+    def sha1(self, name):
+        """
+        Return the SHA-1 of the commit of branch ``name``
+        """
+        i = self._index(name)
+        return hexlify(self._sha1s[20*i:20*i+20])
+
+    def committer_date(self, name):
+        """
+        Return the committer date of branch ``name`` in seconds since the epoch
+        """
+        return self._dates[self._index(name)]
+
+    def upstream(self, name):
+        """
+        Return the upstream of branch ``name`` or ``None``
+        """
+        return self._upstreams[self._index(name)]
+
+    def _branch(self, i):
+        kind = self._kinds[i]
+        if kind == _OTHER:
+            return None
+        commit = GitCommit(self.repository, hexlify(self._sha1s[20*i:20*i+20]))
+        if kind == _LOCAL:
+            return GitLocalBranch(self.repository, self._names[i], commit)
+        number = self._tickets[i]
+        if number == _NO_TICKET:
+            number = None
+        return GitManagedBranch(self.repository, self._descriptions[i], number, commit)
+
+    def branch(self, name):
+        """
+        Return the branch object for ``name``
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_branch.GitLocalBranch` or
+        :class:`~sageui.model.git_branch.GitManagedBranch` whose
+        commit is already known, or ``None`` if the branch is neither.
+        """
+        return self._branch(self._index(name))
+
+    def branches(self):
+        """
+        Return the local and managed branches, oldest commit first
+
+        See :meth:`GitRepository.local_branches
+        <sageui.model.git_repository.GitRepository.local_branches>`.
+        """
+        return [self._branch(i) for i in range(len(self._names)) if self._kinds[i] != _OTHER]
+
+    def ticket_branches(self, ticket_number):
+        """
+        Return the managed branches for a ticket, oldest commit first
+        """
+        return [self._branch(i) for i in self._by_ticket.get(ticket_number, [])]
+
+    def ahead_behind(self, base):
+        """
+        Return the number of commits ahead and behind ``base`` for all branches
+
+        The counts are computed in a single walk of the commit graph
+        (see :meth:`GitCommitGraph.ahead_behind
+        <sageui.model.git_commit_graph.GitCommitGraph.ahead_behind>`)
+        and cached for the lifetime of the snapshot.
+
+        INPUT:
+
+        - ``base`` -- a :class:`~sageui.model.git_commit.GitCommit`.
+
+        OUTPUT:
+
+        Dictionary with the branch names as keys and pairs
+        ``(ahead, behind)`` as values.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: snapshot = repo.branch_snapshot()
+            sage: counts = snapshot.ahead_behind(repo.master.commit)
+            sage: counts['master'], counts['sageui/1002/public/anything']
+            ((0, 0), (5, 0))
+            sage: snapshot.ahead_behind(repo.master.commit) is counts
+            True
+        """
+        base = str(base)
+        try:
+            return self._ahead_behind[base]
+        except KeyError:
+            pass
+        tips = [hexlify(self._sha1s[20*i:20*i+20]) for i in range(len(self._names))]
+        counts = self.repository.commit_graph(base).ahead_behind(base, tips)
+        result = self._ahead_behind[base] = dict(zip(self._names, counts))
+        return result
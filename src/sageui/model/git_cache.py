@@ -0,0 +1,313 @@
+r"""
+Result Cache for Read-Only Git Commands
+
+Many user interface actions re-run the same read-only git command
+with the same arguments. Their output only changes if the repository
+changes, so we cache it. The cache key consists of the complete
+command line and a cheap fingerprint of the repository state:
+
+* the state of the references: while the repository watcher runs
+  (see :attr:`GitResultCache.refs_tracked`), a references generation
+  that it increases and the modification time of ``packed-refs``.
+  Otherwise, the target of ``HEAD`` and the modification times of
+  all directories holding loose references and of ``packed-refs``,
+
+* the modification time of the index,
+
+* a mutation counter that is increased whenever a command that is not
+  read-only runs through the :class:`~sageui.model.git_interface.GitInterface`,
+
+* for commands that look at the work tree (``status``, ``diff``, ...)
+  a work tree generation. Files in the work tree can change behind
+  our back, so these commands are only cached if someone (for example
+  the repository watcher) takes responsibility for calling
+  :meth:`GitResultCache.touch_worktree` whenever the work tree
+  changes and sets :attr:`GitResultCache.worktree_tracked`.
+
+* for commands whose output depends on the configuration (``log``,
+  ``show``), the modification times of the configuration files and
+  of ``.mailmap``.
+
+EXAMPLES::
+
+    sage: repo = test.new_git_repo()
+    sage: git = repo.git
+    sage: sorted(git.cache.statistics().items())
+    [('bytes', 0), ('evictions', 0), ('hits', 0), ('lookups', 0), ('misses', 0), ('size', 0)]
+    sage: log = git.log('master', format='%s')
+    sage: git.log('master', format='%s') == log
+    True
+    sage: sorted(git.cache.statistics().items())
+    [('bytes', 15), ('evictions', 0), ('hits', 1), ('lookups', 2), ('misses', 1), ('size', 1)]
+
+Changing the repository invalidates the cached result::
+
+    sage: git.silent.branch('new_branch')
+    sage: git.log('master', format='%s') == log
+    True
+    sage: git.cache.statistics()['misses']
+    2
+
+Work tree queries are not cached unless the work tree is tracked::
+
+    sage: files = git.ls_files(z=True)
+    sage: git.ls_files(z=True) == files
+    True
+    sage: git.cache.statistics()['hits']
+    1
+    sage: git.cache.worktree_tracked = True
+    sage: files = git.ls_files(z=True)
+    sage: git.ls_files(z=True) == files
+    True
+    sage: git.cache.statistics()['hits']
+    2
+    sage: git.cache.touch_worktree()
+    sage: files = git.ls_files(z=True)
+    sage: git.cache.statistics()['hits']
+    2
+
+While the references are tracked, they are not scanned for each
+lookup; :meth:`~GitResultCache.touch_refs` invalidates instead::
+
+    sage: git.cache.refs_tracked = True
+    sage: log = git.log('master', format='%s')
+    sage: git.log('master', format='%s') == log
+    True
+    sage: git.cache.statistics()['hits']
+    3
+    sage: git.cache.touch_refs()
+    sage: git.log('master', format='%s') == log
+    True
+    sage: git.cache.statistics()['hits']
+    3
+    sage: git.cache.refs_tracked = False
+
+Changing the configuration invalidates the ``log`` output::
+
+    sage: import time
+    sage: log = git.log('master', format='%ad', max_count=1)
+    sage: time.sleep(0.01)
+    sage: git.silent.config('log.date', 'raw')
+    sage: git.log('master', format='%ad', max_count=1) == log
+    False
+    sage: git.silent.config('--unset', 'log.date')
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+
+from sageui.misc.lru_cache import WeightedLRUCache
+from diagnostics import diagnostics
+
+
+# Commands whose output depends on the work tree and not only on the
+# object database and refs
+_WORKTREE_COMMANDS = ('diff', 'grep', 'ls_files', 'status')
+
+# Commands whose output depends on the configuration (log.date,
+# mailmap, i18n.logOutputEncoding, ...)
+_CONFIG_COMMANDS = ('log', 'show')
+
+
+class GitResultCache(object):
+    """
+    Cache the output of read-only git commands
+
+    You should not construct this yourself, use
+    :attr:`GitInterface.cache
+    <sageui.model.git_interface.GitInterface.cache>`.
+
+    INPUT:
+
+    - ``git`` -- the :class:`~sageui.model.git_interface.GitInterface`.
+
+    - ``max_bytes`` -- integer. The maximal total size of the cached
+      outputs.
+    """
+
+    def __init__(self, git, max_bytes=8 * 2**20):
+        self._git = git
+        self._lru = WeightedLRUCache(max_bytes)
+        self._mutation_generation = 0
+        self._worktree_generation = 0
+        self._refs_generation = 0
+        self.worktree_tracked = False
+        self.refs_tracked = False
+        diagnostics.register('git results', self)
+
+    def invalidate(self):
+        """
+        Forget all cached results
+
+        This is called whenever a git command that is not read-only
+        runs.
+        """
+        self._mutation_generation += 1
+
+    @property
+    def mutation_generation(self):
+        """
+        The number of git commands so far that were not read-only
+        """
+        return self._mutation_generation
+
+    def touch_worktree(self):
+        """
+        Forget the cached results that depend on the work tree
+        """
+        self._worktree_generation += 1
+
+    def touch_refs(self):
+        """
+        Forget the cached results that depend on the references
+
+        Only needed while :attr:`refs_tracked` is set; the repository
+        watcher calls it whenever a reference or ``HEAD`` changes.
+        """
+        self._refs_generation += 1
+
+    def refs_fingerprint(self):
+        """
+        Return a cheap fingerprint of the references
+
+        If :attr:`refs_tracked` is set, someone (the repository
+        watcher) calls :meth:`touch_refs` whenever a reference
+        changes, so only ``packed-refs`` is looked at. Otherwise, all
+        directories of loose references are scanned, see
+        :meth:`GitRefReader.fingerprint
+        <sageui.model.git_refs.GitRefReader.fingerprint>`.
+
+        OUTPUT:
+
+        A hashable value or ``None`` if the repository layout is not
+        understood.
+        """
+        refs = self._git.refs
+        if self.refs_tracked:
+            try:
+                packed = os.stat(os.path.join(refs.common_dir, 'packed-refs')).st_mtime
+            except OSError:
+                packed = None
+            return (self._mutation_generation, self._refs_generation, packed)
+        try:
+            return refs.fingerprint()
+        except NotImplementedError:
+            return None
+
+    def _config_fingerprint(self):
+        """
+        Return the modification times of the files that configure ``git log``
+        """
+        git = self._git
+        paths = [os.path.join(git.refs.common_dir, 'config'),
+                 os.environ.get('GIT_CONFIG_GLOBAL', os.path.expanduser('~/.gitconfig')),
+                 os.path.join(git.work_tree, '.mailmap')]
+        result = []
+        for path in paths:
+            try:
+                result.append(os.stat(path).st_mtime)
+            except OSError:
+                result.append(None)
+        return tuple(result)
+
+    def fingerprint(self):
+        """
+        Return a cheap fingerprint of the repository state
+
+        OUTPUT:
+
+        A hashable value or ``None`` if the repository layout is not
+        understood.
+        """
+        refs = self.refs_fingerprint()
+        if refs is None:
+            return None
+        index = os.path.join(self._git.refs.git_dir, 'index')
+        try:
+            index_mtime = os.stat(index).st_mtime
+        except OSError:
+            index_mtime = None
+        return (self._mutation_generation, refs, index_mtime)
+
+    def key(self, cmd_line):
+        """
+        Return the cache key for a command line
+
+        INPUT:
+
+        - ``cmd_line`` -- list of strings, the complete git command
+          line.
+
+        OUTPUT:
+
+        The cache key or ``None`` if the command must not be cached.
+        """
+        name = cmd_line[1].replace('-', '_')
+        if name not in self._git._read_only_commands:
+            return None
+        if name in _WORKTREE_COMMANDS:
+            if not self.worktree_tracked:
+                return None
+            worktree = self._worktree_generation
+        else:
+            worktree = None
+        fingerprint = self.fingerprint()
+        if fingerprint is None:
+            return None
+        if name in _CONFIG_COMMANDS:
+            fingerprint += self._config_fingerprint()
+        return (tuple(cmd_line), fingerprint, worktree)
+
+    def get(self, key, default=None):
+        """
+        Return the cached output for ``key`` or ``default``
+        """
+        return self._lru.get(key, default)
+
+    def put(self, key, stdout):
+        """
+        Store the output for ``key``
+        """
+        self._lru.put(key, stdout)
+
+    def shrink(self, fraction=0.5):
+        """
+        Evict entries until at most ``fraction`` of ``max_bytes`` is used
+        """
+        self._lru.shrink(fraction)
+
+    def clear(self):
+        """
+        Remove all entries and reset the statistics
+        """
+        self._lru.clear()
+
+    def statistics(self):
+        """
+        Return the hit/miss counters
+
+        OUTPUT:
+
+        Dictionary.
+        """
+        lru = self._lru
+        return {'hits': lru.hits, 'misses': lru.misses, 'lookups': lru.lookups,
+                'evictions': lru.evictions, 'size': len(lru.data), 'bytes': lru.weight}
@@ -0,0 +1,326 @@
+r"""
+Persistent Git Object Server
+
+Instead of forking a new git process for each lookup, we keep a
+long-lived ``git cat-file --batch`` (and ``--batch-check``) coprocess
+around and talk to it over its stdin/stdout pipes. A request is a
+single revision per line, the answer is a header line optionally
+followed by the raw object contents.
+
+The coprocesses are started on demand and restarted automatically if
+they die. Requests from different threads are serialized by a lock,
+so the same server can safely be shared.
+
+EXAMPLES::
+
+    sage: repo = test.git_repo()
+    sage: objects = repo.git.objects
+    sage: sha1, obj_type, size = objects.info('master')
+    sage: obj_type
+    'commit'
+    sage: objects.commit('master')['message']
+    'initial commit\n'
+    sage: objects.tree('master')
+    [('100644', 'blob', '190a18037c64c43e6b11489df4bf0b9eb6d2c9bf', 'foo1.txt')]
+    sage: objects.blob('master:foo1.txt')
+    '123\n'
+    sage: objects.info('nonexisting')
+    Traceback (most recent call last):
+    ...
+    GitObjectMissingError: 'no such git object: nonexisting'
+
+The coprocess is restarted if it goes away::
+
+    sage: objects._batch._process.kill()
+    sage: objects.blob('master:foo1.txt')
+    '123\n'
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import subprocess
+import threading
+import binascii
+
+from git_error import GitObjectMissingError
+
+
+class GitCatFileProcess(object):
+    """
+    A single ``git cat-file`` coprocess.
+
+    INPUT:
+
+    - ``git`` -- a :class:`~sageui.model.git_interface.GitInterface`.
+
+    - ``batch_option`` -- either ``'--batch'`` (header and contents)
+      or ``'--batch-check'`` (header only).
+    """
+
+    def __init__(self, git, batch_option):
+        self._git = git
+        self._batch_option = batch_option
+        self._with_contents = (batch_option == '--batch')
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        cmd = [self._git.git_cmd, 'cat-file', self._batch_option]
+        self._git._log('cmd', ' '.join(cmd))
+        with open(os.devnull, 'wb') as devnull:
+            self._process = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=devnull,
+                env=self._git._environment(), close_fds=True)
+
+    def _is_running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _stop(self):
+        process = self._process
+        self._process = None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except (IOError, OSError):
+            pass
+        if process.poll() is None:
+            try:
+                process.kill()
+            except OSError:
+                pass
+        process.wait()
+
+    def close(self):
+        """
+        Terminate the coprocess.
+
+        It will be restarted transparently by the next request.
+        """
+        with self._lock:
+            self._stop()
+
+    def _request_unlocked(self, revision):
+        process = self._process
+        process.stdin.write(revision + '\n')
+        process.stdin.flush()
+        header = process.stdout.readline()
+        if not header.endswith('\n'):
+            raise EOFError('git cat-file closed its output')
+        fields = header.split()
+        if len(fields) != 3:
+            # "<revision> missing" or "<revision> ambiguous"
+            raise GitObjectMissingError(revision)
+        sha1, obj_type, size = fields[0], fields[1], int(fields[2])
+        if not self._with_contents:
+            return (sha1, obj_type, size)
+        contents = process.stdout.read(size + 1)
+        if len(contents) != size + 1:
+            raise EOFError('git cat-file closed its output')
+        return (sha1, obj_type, contents[:-1])
+
+    def request(self, revision):
+        """
+        Look up a single revision.
+
+        INPUT:
+
+        - ``revision`` -- string. Anything that ``git rev-parse``
+          understands, for example a SHA-1 or ``'HEAD:path/to/file'``.
+
+        OUTPUT:
+
+        A triple ``(sha1, type, size)`` for ``--batch-check`` or
+        ``(sha1, type, contents)`` for ``--batch``.
+        """
+        if '\n' in revision:
+            raise ValueError('revision must not contain a newline')
+        try:
+            result = self._request(revision)
+        except GitObjectMissingError:
+            self._git._record('cat-file', [self._batch_option, revision], None)
+            raise
+        self._git._record('cat-file', [self._batch_option, revision], result)
+        return result
+
+    def _request(self, revision):
+        with self._lock:
+            for attempt in range(2):
+                if not self._is_running():
+                    self._stop()
+                    self._start()
+                try:
+                    return self._request_unlocked(revision)
+                except (IOError, OSError, EOFError):
+                    # coprocess died underneath us, try once more
+                    self._stop()
+                    if attempt > 0:
+                        raise
+
+
+class GitObjectServer(object):
+    """
+    Read commits, trees, and blobs through persistent coprocesses.
+
+    You should not construct this yourself, use
+    :attr:`GitInterface.objects
+    <sageui.model.git_interface.GitInterface.objects>`.
+    """
+
+    def __init__(self, git):
+        self._batch = GitCatFileProcess(git, '--batch')
+        self._batch_check = GitCatFileProcess(git, '--batch-check')
+
+    def close(self):
+        """
+        Terminate the coprocesses.
+        """
+        self._batch.close()
+        self._batch_check.close()
+
+    def info(self, revision):
+        """
+        Return ``(sha1, type, size)`` of the object named by ``revision``.
+
+        This does not transfer the object contents.
+        """
+        return self._batch_check.request(revision)
+
+    def sha1(self, revision):
+        """
+        Resolve ``revision`` to the full 40-digit SHA-1.
+        """
+        return self.info(revision)[0]
+
+    def read(self, revision):
+        """
+        Return ``(sha1, type, contents)`` of the object named by ``revision``.
+        """
+        return self._batch.request(revision)
+
+    def _read_type(self, revision, expected_type):
+        sha1, obj_type, contents = self.read(revision)
+        if obj_type != expected_type:
+            raise ValueError('{0} is a {1}, not a {2}'.format(revision, obj_type, expected_type))
+        return sha1, contents
+
+    def blob(self, revision):
+        """
+        Return the contents of a blob as a string.
+        """
+        return self._read_type(revision, 'blob')[1]
+
+    def commit(self, revision):
+        """
+        Return the parsed commit object.
+
+        OUTPUT:
+
+        A dictionary with the keys ``sha1``, ``tree``, ``parents``
+        (a list), ``author``, ``committer``, ``message``, and
+        ``headers`` (all header lines as a list of ``(key, value)``
+        pairs).
+        """
+        sha1, contents = self._read_type(revision + '^{commit}', 'commit')
+        return parse_commit(sha1, contents)
+
+    def tree(self, revision):
+        """
+        Return the entries of a tree object.
+
+        OUTPUT:
+
+        List of quadruples ``(mode, type, sha1, name)``, just like
+        ``git ls-tree`` would print them.
+        """
+        sha1, contents = self._read_type(revision + '^{tree}', 'tree')
+        return parse_tree(contents)
+
+
+def parse_commit(sha1, contents):
+    r"""
+    Parse a raw commit object.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_cat_file import parse_commit
+        sage: raw = ('tree 4b825dc642cb6eb9a060e54bf8d69288fbee4904\n'
+        ....:        'author A U Thor <a@u.thor> 1376145400 +0200\n'
+        ....:        'committer A U Thor <a@u.thor> 1376145400 +0200\n'
+        ....:        '\n'
+        ....:        'title\n')
+        sage: c = parse_commit('0'*40, raw)
+        sage: c['author'], c['parents'], c['message']
+        ('A U Thor <a@u.thor> 1376145400 +0200', [], 'title\n')
+    """
+    end_of_headers = contents.find('\n\n')
+    if end_of_headers == -1:
+        header_block, message = contents, ''
+    else:
+        header_block, message = contents[:end_of_headers], contents[end_of_headers+2:]
+    headers = []
+    for line in header_block.split('\n'):
+        if line.startswith(' ') and headers:
+            # continuation line of a multi-line header (gpgsig, mergetag)
+            key, value = headers[-1]
+            headers[-1] = (key, value + '\n' + line[1:])
+        else:
+            key, _, value = line.partition(' ')
+            headers.append((key, value))
+    result = {'sha1': sha1, 'parents': [], 'headers': headers, 'message': message,
+              'tree': None, 'author': None, 'committer': None}
+    for key, value in headers:
+        if key == 'parent':
+            result['parents'].append(value)
+        elif key in ('tree', 'author', 'committer'):
+            result[key] = value
+    return result
+
+
+def parse_tree(contents):
+    r"""
+    Parse a raw tree object.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_cat_file import parse_tree
+        sage: parse_tree('100644 foo\0' + '\x12'*20 + '40000 bar\0' + '\x34'*20)
+        [('100644', 'blob', '1212121212121212121212121212121212121212', 'foo'),
+         ('040000', 'tree', '3434343434343434343434343434343434343434', 'bar')]
+    """
+    result = []
+    pos = 0
+    end = len(contents)
+    while pos < end:
+        space = contents.index(' ', pos)
+        nul = contents.index('\0', space)
+        mode = contents[pos:space].rjust(6, '0')
+        name = contents[space+1:nul]
+        sha1 = binascii.hexlify(contents[nul+1:nul+21])
+        if mode == '040000':
+            obj_type = 'tree'
+        elif mode == '160000':
+            obj_type = 'commit'
+        else:
+            obj_type = 'blob'
+        result.append((mode, obj_type, sha1, name))
+        pos = nul + 21
+    return result
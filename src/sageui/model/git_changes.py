@@ -0,0 +1,257 @@
+r"""
+Incremental Computation of the Changed Files
+
+The list of changed files relative to a base commit combines the
+committed, staged, and unstaged changes (see
+:meth:`GitRepository.changes
+<sageui.model.git_repository.GitRepository.changes>`). On a large
+tree, recomputing it from scratch after each edit is expensive. The
+:class:`GitChanges` engine keeps the previous result and, if it is
+told which paths were touched (for example by the
+:mod:`~sageui.model.git_watcher`), only asks git about those paths.
+Each query runs two git processes concurrently, ``git diff --numstat``
+against the base commit and ``git status``, whose outputs are then
+merged in one pass. Each update returns a :class:`GitChangesDelta` that the view can
+apply to its file list.
+
+EXAMPLES::
+
+    sage: import os
+    sage: repo = test.new_git_repo()
+    sage: repo.changes()
+    [unstaged:+1-0:foo4.txt, staged:+0-0:staged_file, untracked:untracked_file]
+    sage: with open(os.path.join(repo.git.work_tree, 'foo1.txt'), 'a') as f:
+    ....:     f.write('one more line\n')
+    sage: with open(os.path.join(repo.git.work_tree, 'foo4.txt'), 'a') as f:
+    ....:     f.write('yet another line\n')
+    sage: os.remove(os.path.join(repo.git.work_tree, 'untracked_file'))
+    sage: delta = repo.update_changes(['foo1.txt', 'foo4.txt', 'untracked_file'])
+    sage: delta
+    GitChangesDelta(added=[unstaged:+1-0:foo1.txt],
+                    removed=[untracked:untracked_file],
+                    changed=[unstaged:+2-0:foo4.txt])
+    sage: repo.changes()
+    [unstaged:+1-0:foo1.txt, unstaged:+2-0:foo4.txt, staged:+0-0:staged_file]
+    sage: repo.update_changes(['foo1.txt'])
+    GitChangesDelta(added=[], removed=[], changed=[])
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+from collections import namedtuple
+
+from git_interface import GitQuery
+from git_records import iter_records, parse_numstat, parse_status
+
+
+GitChangesDelta = namedtuple('GitChangesDelta', ['added', 'removed', 'changed'])
+
+
+# Above this number of touched paths, a full recomputation is cheaper
+# than passing all of them as pathspecs
+_MAX_PATHSPECS = 500
+
+
+def _state(git_file):
+    """
+    Return what is displayed about ``git_file``
+    """
+    return (git_file.type,
+            getattr(git_file, 'added', None),
+            getattr(git_file, 'subed', None),
+            getattr(git_file, 'binary', None))
+
+
+def _affects(name, path):
+    """
+    Whether a change of ``path`` can change the entry ``name``
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_changes import _affects
+        sage: _affects('foo/bar', 'foo/bar'), _affects('foo/bar', 'foo')
+        (True, True)
+        sage: _affects('foo/', 'foo/bar'), _affects('foo/bar', 'foo/b')
+        (True, False)
+    """
+    return (name == path or
+            name.startswith(path + '/') or
+            (name.endswith('/') and path.startswith(name)))
+
+
+class GitChanges(object):
+    """
+    The changed files relative to a base commit
+
+    You should not construct this yourself, use
+    :meth:`GitRepository.changes
+    <sageui.model.git_repository.GitRepository.changes>` and
+    :meth:`GitRepository.update_changes
+    <sageui.model.git_repository.GitRepository.update_changes>`.
+
+    INPUT:
+
+    - ``repository`` -- a
+      :class:`~sageui.model.git_repository.GitRepository`.
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.base_commit = None
+        self._files = dict()
+
+    def files(self):
+        """
+        Return the changed files sorted by name
+        """
+        return [self._files[name] for name in sorted(self._files)]
+
+    def reset(self, base_commit, files, untracked=True):
+        """
+        Replace all changed files
+
+        INPUT:
+
+        - ``base_commit`` -- a :class:`~sageui.model.git_commit.GitCommit`.
+
+        - ``files`` -- list of git files, the changes relative to
+          ``base_commit``.
+
+        - ``untracked`` -- boolean (default: ``True``). Whether
+          ``files`` includes the untracked files. If not, the
+          previously known untracked files are kept until
+          :meth:`update_untracked` is called.
+
+        OUTPUT:
+
+        A :class:`GitChangesDelta` relative to the previous result.
+        """
+        same_base = (self.base_commit is not None and self.base_commit == base_commit)
+        self.base_commit = base_commit
+        old = self._files if same_base else dict()
+        new = dict((f.name, f) for f in files)
+        if not untracked:
+            # untracked files do not depend on the base commit
+            for name, git_file in self._files.iteritems():
+                if git_file.type == 'untracked' and name not in new:
+                    new[name] = git_file
+        self._files = new
+        return self._delta(old, self._files)
+
+    def update_untracked(self, directories, names):
+        """
+        Replace the untracked files in some directories
+
+        INPUT:
+
+        - ``directories`` -- set of directory names relative to the
+          top of the work tree, ``''`` being the top.
+
+        - ``names`` -- list of the untracked files that are directly
+          in one of the ``directories``, see
+          :class:`~sageui.model.git_untracked.GitUntrackedScanner`.
+
+        OUTPUT:
+
+        A :class:`GitChangesDelta` relative to the previous result.
+        """
+        from git_file import GitFileUntracked
+        from git_untracked import _parent
+        old = dict()
+        for name, git_file in self._files.items():
+            if git_file.type == 'untracked' and _parent(name) in directories:
+                old[name] = self._files.pop(name)
+        new = dict()
+        for name in names:
+            if name not in self._files:
+                new[name] = old[name] if name in old else GitFileUntracked(self.repository, name)
+        self._files.update(new)
+        return self._delta(old, new)
+
+    def refresh(self, base_commit, paths=None, untracked=True):
+        """
+        Recompute the changed files
+
+        INPUT:
+
+        - ``base_commit`` -- a :class:`~sageui.model.git_commit.GitCommit`.
+
+        - ``paths`` -- list of paths relative to the top of the work
+          tree, or ``None`` (default). The paths that might have
+          changed since the last call. If ``None``, everything is
+          recomputed.
+
+        - ``untracked`` -- boolean (default: ``True``). Whether to
+          look for untracked files when everything is recomputed. If
+          not, the untracked files are left as they are, see
+          :meth:`reset`.
+
+        OUTPUT:
+
+        A :class:`GitChangesDelta` relative to the previous result.
+        """
+        if (paths is None or self.base_commit is None or self.base_commit != base_commit
+                or len(paths) > _MAX_PATHSPECS):
+            files = self._query(base_commit, [], untracked)
+            return self.reset(base_commit, files, untracked)
+        paths = set(path.rstrip('/') for path in paths)
+        # untracked directories are reported as a whole
+        paths.update([name for name in self._files
+                      if name.endswith('/') and any(path.startswith(name) for path in paths)])
+        if not paths:
+            return GitChangesDelta([], [], [])
+        pathspecs = [':(literal)' + path for path in sorted(paths)]
+        new = dict((f.name, f) for f in self._query(base_commit, pathspecs))
+        old = dict()
+        for name in self._files.keys():
+            if any(_affects(name, path) for path in paths):
+                old[name] = self._files.pop(name)
+        self._files.update(new)
+        return self._delta(old, new)
+
+    def _query(self, base_commit, pathspecs, untracked=True):
+        """
+        Ask git about the changes of the given paths
+
+        This runs two git processes, ``git diff --numstat`` against
+        ``base_commit`` for the committed and staged changes and ``git
+        status`` for the index and the work tree, concurrently with
+        :meth:`GitInterface.execute_batch
+        <sageui.model.git_interface.GitInterface.execute_batch>`.
+        Their records are merged in one pass by
+        :meth:`GitRepository._merge_changes
+        <sageui.model.git_repository.GitRepository._merge_changes>`.
+        """
+        repo = self.repository
+        args = ['--'] + pathspecs if pathspecs else []
+        status_kwds = dict(z=True) if untracked else dict(z=True, untracked_files='no')
+        numstat, status = repo.git.execute_batch([
+            GitQuery('diff', base_commit.sha1, *args, numstat=True, z=True),
+            GitQuery('status', *args, **status_kwds)])
+        return repo._merge_changes(base_commit,
+                                   parse_numstat(iter_records([numstat])),
+                                   parse_status(iter_records([status])))
+
+    def _delta(self, old, new):
+        added = [new[name] for name in sorted(new) if name not in old]
+        removed = [old[name] for name in sorted(old) if name not in new]
+        changed = [new[name] for name in sorted(new)
+                   if name in old and _state(old[name]) != _state(new[name])]
+        return GitChangesDelta(added, removed, changed)
@@ -1,5 +1,26 @@
 """
 Git Commit
+
+Commits are interned in a per-repository :class:`GitCommitTable`,
+which stores each SHA-1 once as a 20-byte digest and its title in
+compact columns. A :class:`GitCommit` is only a small handle (the
+table and an integer index), so listing the same commits again does
+not allocate new copies, and two handles from the same table are
+equal if their indices are.
+
+EXAMPLES::
+
+    sage: repo = test.git_repo()
+    sage: a = repo.head
+    sage: b = repo.head
+    sage: a is b, a == b, a._index == b._index
+    (False, True, True)
+    sage: history = a.get_history()
+    sage: n = len(repo.commits)
+    sage: a.get_history() == history
+    True
+    sage: len(repo.commits) == n
+    True
 """
 
 ##############################################################################
@@ -21,34 +42,165 @@ Git Commit
 ##############################################################################
 
 
+import sys
+from binascii import hexlify, unhexlify
+
+from git_records import parse_rev_list
+from diagnostics import diagnostics
+
+
+class GitCommitTable(object):
+    """
+    All commits of a repository that were handed out so far
+
+    You should not construct this yourself, use
+    :attr:`GitRepository.commits
+    <sageui.model.git_repository.GitRepository.commits>`.
+
+    INPUT:
+
+    - ``repository`` -- a
+      :class:`~sageui.model.git_repository.GitRepository`.
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+        self._index = dict()
+        self._digests = bytearray()
+        self._titles = []
+        diagnostics.register('commits', self)
+
+    def __repr__(self):
+        return '<GitCommitTable of {0} commits>'.format(len(self))
+
+    def __len__(self):
+        return len(self._titles)
+
+    def intern(self, sha1, title=None):
+        """
+        Return the index of the commit, adding it if necessary
+
+        INPUT:
+
+        - ``sha1`` -- string. The 40-digit SHA-1.
+
+        - ``title`` -- string or ``None`` (default). The title, if
+          already known.
+        """
+        digest = unhexlify(sha1)
+        i = self._index.get(digest)
+        if i is None:
+            i = self._index[digest] = len(self._titles)
+            self._digests.extend(digest)
+            self._titles.append(title)
+        elif title is not None and self._titles[i] is None:
+            self._titles[i] = title
+        return i
+
+    def digest(self, i):
+        """
+        Return the binary SHA-1 of the commit with index ``i``
+        """
+        return str(self._digests[20*i:20*i+20])
+
+    def sha1(self, i):
+        """
+        Return the SHA-1 of the commit with index ``i``
+        """
+        return hexlify(self._digests[20*i:20*i+20])
+
+    def title(self, i):
+        """
+        Return the title of the commit with index ``i`` or ``None`` if unknown
+        """
+        return self._titles[i]
+
+    def set_title(self, i, title):
+        self._titles[i] = title
+
+    def statistics(self):
+        """
+        Return the number of commits and the estimated memory
+
+        OUTPUT:
+
+        Dictionary.
+        """
+        titles = sum(sys.getsizeof(title) for title in self._titles)
+        size = (sys.getsizeof(self._index) + sys.getsizeof(self._digests) +
+                sys.getsizeof(self._titles) + titles)
+        return {'size': len(self), 'bytes': size}
+
+
+@diagnostics.track
 class GitCommit(object):
-    
+
+    __slots__ = ('_table', '_index')
+
     def __init__(self, repository, commit_sha1, title=None):
-        self.repository = repository
-        self._sha1 = commit_sha1.strip()
-        assert len(self._sha1) == 40
-        self._title = title
+        sha1 = str(commit_sha1).strip()
+        assert len(sha1) == 40
+        self._table = repository.commits
+        self._index = self._table.intern(sha1, title)
 
     def __repr__(self):
         return 'Commit '+self.short_sha1
 
+    @property
+    def repository(self):
+        return self._table.repository
+
     @property
     def sha1(self):
-        return self._sha1
+        return self._table.sha1(self._index)
+
+    _sha1 = sha1
 
     @property
     def short_sha1(self):
-        return self._sha1[0:6]
+        return self.sha1[0:6]
 
     @property
     def title(self):
-        return str(self._title)
+        r"""
+        The subject of the commit message
+
+        Like git, the lines of the first paragraph are joined.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: repo.master.commit.title
+            'initial commit'
+            sage: from sageui.model.git_commit import _subject
+            sage: _subject('a wrapped  \nsubject\n\nbody\n')
+            'a wrapped subject'
+        """
+        title = self._table.title(self._index)
+        if title is None:
+            message = self.repository.git.objects.commit(self.sha1)['message']
+            title = _subject(message)
+            self._table.set_title(self._index, title)
+        return str(title)
 
     def __str__(self):
-        return self._sha1
+        return self.sha1
 
     def __hash__(self):
-        return hash(self._sha1)
+        return hash(self._table.digest(self._index))
+
+    def __eq__(self, other):
+        if not isinstance(other, GitCommit):
+            return NotImplemented
+        if self._table is other._table:
+            return self._index == other._index
+        return self._table.digest(self._index) == other._table.digest(other._index)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
 
     def __cmp__(self, other):
         """
@@ -60,25 +212,46 @@ class GitCommit(object):
             sage: assert 0 == cmp(*[repo.head, repo.base_commit])
             sage: assert 0 == cmp(repo.head, repo.base_commit)
         """
-        return cmp(self._sha1, other._sha1)
+        return cmp(self.sha1, other.sha1)
+
+    def history(self, upstream=None, page_size=50):
+        """
+        Return the history, loaded lazily
+
+        INPUT:
+
+        - ``upstream`` -- a :class:`GitCommit` or ``None`` (default).
+          The history consists of the commits that are not on
+          ``upstream`` followed by the history of ``upstream`` from
+          the merge base on. By default, ``master``.
+
+        - ``page_size`` -- integer. The number of commits loaded at
+          once.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_history.GitHistory`.
+        """
+        from git_history import GitHistory
+        return GitHistory(self, upstream, page_size)
 
     def get_history(self, limit=20):
         """
         Return the list of (direct and indirect) parent commits
+
+        See :meth:`history` for the complete history.
         """
         master = self.repository.master.commit    # TODO
         result = []
-        rev_list = self.repository.git.rev_list(
-            self.sha1, '^'+master.sha1, format='oneline', max_count=limit)
-        for line in rev_list.splitlines():
-            sha1 = line[0:40]
-            title = line[40:].strip()
-            result.append(GitCommit(self.repository, sha1, title))
+        rev_list = self.repository.git.execute_iter(
+            'rev-list', self.sha1, '^'+master.sha1, format='oneline', max_count=limit)
+        for record in parse_rev_list(rev_list):
+            result.append(GitCommit(self.repository, record.sha1, record.title))
         result.append(master)
         return result
         
     def get_message(self, format='fuller'):
-        """
+        r"""
         Return the log entry for the commit
         
         EXAMPLES::
@@ -94,7 +267,38 @@ class GitCommit(object):
             <BLANKLINE>
                 initial commit
             <BLANKLINE>
+
+        The entry is rendered by ``git log``, so it follows the
+        configuration (``log.date``, ``log.mailmap``, ...). It is kept
+        in the persistent cache of the repository, if there is one,
+        together with the settings that it depends on::
+
+            sage: repo.git.silent.config('log.date', 'iso')
+            sage: commit.get_message() == repo.git.log(commit.sha1, format='fuller', max_count=1)
+            True
+            sage: repo.git.silent.config('--unset', 'log.date')
         """
-        return self.repository.git.log(self.sha1, format=format, max_count=1)
+        repo = self.repository
+        cache = repo.persistent_cache
+        key = ('message', self.sha1, format, repo._log_settings)
+        if cache is not None:
+            message = cache.get(key)
+            if message is not None:
+                return message
+        message = repo.git.log(self.sha1, format=format, max_count=1)
+        if cache is not None:
+            cache.put(key, message)
+        return message
 
-        
+
+def _subject(message):
+    """
+    Return the subject of a raw commit message, like ``%s`` in ``git log``
+    """
+    lines = []
+    for line in message.lstrip('\n').split('\n'):
+        line = line.rstrip()
+        if not line:
+            break
+        lines.append(line)
+    return ' '.join(lines)
@@ -0,0 +1,439 @@
+r"""
+In-Memory Commit Graph
+
+Questions about the ancestry of commits (merge bases, whether a
+branch is merged, the history since the fork point) are answered by
+git with a walk over the commit graph, which costs a subprocess each
+time. The :class:`GitCommitGraph` instead loads the graph once with
+``git rev-list`` and answers them in-process.
+
+The commits are numbered in topological order, parents before
+children. The parent links, committer dates, and titles are stored in
+flat arrays indexed by these numbers. In particular, an ancestor of a
+commit always has a smaller number. Commits that appear later (new
+branches, fetches) are appended, so the numbering of the known
+commits never changes.
+
+The graph is saved in the git directory and loaded again in the next
+session, then only the new commits are read from git.
+
+EXAMPLES::
+
+    sage: repo = test.new_git_repo()
+    sage: graph = repo.commit_graph()
+    sage: graph
+    <GitCommitGraph with 6 commits>
+    sage: head = repo.head.sha1
+    sage: master = repo.master.commit.sha1
+    sage: graph.merge_bases(head, master) == [master]
+    True
+    sage: graph.is_ancestor(master, head), graph.is_ancestor(head, master)
+    (True, False)
+    sage: [c[:7] for c in graph.walk([head], exclude=[master])] == \
+    ....:     [c[:7] for c in repo.git.rev_list(head, '^'+master, topo_order=True).split()]
+    True
+
+New commits are read incrementally::
+
+    sage: repo.git.silent.stash()
+    sage: repo.git.silent.commit(allow_empty=True, message='new commit')
+    sage: graph = repo.commit_graph()
+    sage: len(graph)
+    7
+    sage: graph.title(repo.head.sha1)
+    'new commit'
+
+The graph survives between sessions::
+
+    sage: from sageui.model.git_commit_graph import GitCommitGraph
+    sage: graph = GitCommitGraph.load(repo.git)
+    sage: len(graph)
+    7
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import heapq
+import logging
+import cPickle
+from array import array
+from binascii import hexlify, unhexlify
+
+from git_error import GitError
+
+
+# Name of the file in the git directory
+_FILENAME = 'sageui-commit-graph'
+
+# Increase whenever the file format changes
+_VERSION = 1
+
+# Flags for the graph walks
+_LEFT, _RIGHT, _STALE = 1, 2, 4
+
+
+class GitCommitGraph(object):
+    """
+    The commit graph of all local branches
+
+    You should not construct this yourself, use
+    :meth:`GitRepository.commit_graph
+    <sageui.model.git_repository.GitRepository.commit_graph>`.
+
+    INPUT:
+
+    - ``git`` -- a :class:`~sageui.model.git_interface.GitInterface`.
+    """
+
+    def __init__(self, git):
+        self._git = git
+        self._tips = set()
+        self._index = dict()
+        self._sha1s = []
+        self._dates = array('l')
+        self._titles = []
+        self._parent_start = array('l', [0])
+        self._parents = array('l')
+
+    def __repr__(self):
+        return '<GitCommitGraph with {0} commits>'.format(len(self))
+
+    def __len__(self):
+        return len(self._sha1s)
+
+    def __contains__(self, sha1):
+        return unhexlify(sha1) in self._index
+
+    @classmethod
+    def filename(cls, git):
+        return os.path.join(git.refs.common_dir, _FILENAME)
+
+    @classmethod
+    def load(cls, git):
+        """
+        Load the graph saved by :meth:`save`
+
+        Returns an empty graph if there is none.
+        """
+        graph = cls(git)
+        try:
+            with open(cls.filename(git), 'rb') as f:
+                data = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return graph
+        if data[0] != _VERSION:
+            return graph
+        (graph._tips, sha1s, graph._dates, graph._titles,
+         graph._parent_start, graph._parents) = data[1:]
+        graph._sha1s = [sha1s[i:i+20] for i in range(0, len(sha1s), 20)]
+        graph._index = dict((sha1, i) for i, sha1 in enumerate(graph._sha1s))
+        return graph
+
+    def save(self):
+        """
+        Save the graph in the git directory
+        """
+        data = (_VERSION, self._tips, ''.join(self._sha1s), self._dates, self._titles,
+                self._parent_start, self._parents)
+        filename = self.filename(self._git)
+        with open(filename + '.tmp', 'wb') as f:
+            cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(filename + '.tmp', filename)
+
+    def update(self, tips):
+        """
+        Add the commits reachable from ``tips``
+
+        Only the commits that are not yet known are read from git.
+
+        INPUT:
+
+        - ``tips`` -- iterable of SHA-1s.
+
+        OUTPUT:
+
+        The number of new commits.
+        """
+        tips = set(tips)
+        known = [sha1 for sha1 in self._tips if sha1 in self]
+        new_tips = sorted(tips.difference(known))
+        if not new_tips:
+            return 0
+        args = new_tips + ['--not'] + known if known else new_tips
+        try:
+            records = self._git.execute_iter(
+                'rev-list', *args, topo_order=True, reverse=True, format='%P%x00%ct%x00%s')
+            n = self._add(records)
+        except GitError:
+            # probably a known tip was garbage-collected
+            logging.warning('reading the commit graph again')
+            self.__init__(self._git)
+            records = self._git.execute_iter(
+                'rev-list', *sorted(tips), topo_order=True, reverse=True,
+                format='%P%x00%ct%x00%s')
+            n = self._add(records)
+        self._tips.update(tips)
+        return n
+
+    def _add(self, records):
+        """
+        Append the commits in the output of ``rev-list --reverse --format=...``
+        """
+        index = self._index
+        count = 0
+        sha1 = None
+        for record in records:
+            if sha1 is None:
+                if record.startswith('commit '):
+                    sha1 = unhexlify(record[7:47])
+                continue
+            parents, date, title = record.split('\0', 2)
+            if sha1 not in index:
+                index[sha1] = len(self._sha1s)
+                self._sha1s.append(sha1)
+                self._dates.append(int(date))
+                self._titles.append(title)
+                for parent in parents.split():
+                    i = index.get(unhexlify(parent))
+                    if i is not None:    # else beyond a shallow boundary
+                        self._parents.append(i)
+                self._parent_start.append(len(self._parents))
+                count += 1
+            sha1 = None
+        return count
+
+    def _idx(self, sha1):
+        try:
+            return self._index[unhexlify(str(sha1))]
+        except KeyError:
+            raise KeyError('commit {0} is not in the graph'.format(sha1))
+
+    def _parent_indices(self, i):
+        return self._parents[self._parent_start[i]:self._parent_start[i+1]]
+
+    def parents(self, sha1):
+        """
+        Return the SHA-1s of the parents
+        """
+        return [hexlify(self._sha1s[i]) for i in self._parent_indices(self._idx(sha1))]
+
+    def title(self, sha1):
+        """
+        Return the first line of the commit message
+        """
+        return self._titles[self._idx(sha1)]
+
+    def date(self, sha1):
+        """
+        Return the committer date in seconds since the epoch
+        """
+        return self._dates[self._idx(sha1)]
+
+    def is_ancestor(self, ancestor, descendant):
+        """
+        Whether ``ancestor`` is reachable from ``descendant``
+
+        Every commit is its own ancestor.
+        """
+        target = self._idx(ancestor)
+        start = self._idx(descendant)
+        seen = set([start])
+        stack = [start]
+        while stack:
+            i = stack.pop()
+            if i == target:
+                return True
+            for p in self._parent_indices(i):
+                # ancestors have smaller indices
+                if p >= target and p not in seen:
+                    seen.add(p)
+                    stack.append(p)
+        return False
+
+    def merge_bases(self, sha1, other):
+        """
+        Return the best common ancestors, like ``git merge-base --all``
+
+        OUTPUT:
+
+        List of SHA-1s, empty if there is no common ancestor.
+        """
+        a, b = self._idx(sha1), self._idx(other)
+        flags = {a: _LEFT}
+        flags[b] = flags.get(b, 0) | _RIGHT
+        heap = [-i for i in flags]
+        heapq.heapify(heap)
+        result = []
+        # since parents have smaller indices, the flags of the
+        # largest index in the queue are final
+        while any(not flags[-x] & _STALE for x in heap):
+            i = -heapq.heappop(heap)
+            f = flags[i]
+            if f & (_LEFT | _RIGHT) == _LEFT | _RIGHT and not f & _STALE:
+                result.append(i)
+                f |= _STALE
+            for p in self._parent_indices(i):
+                old = flags.get(p)
+                if old is None:
+                    flags[p] = f
+                    heapq.heappush(heap, -p)
+                else:
+                    flags[p] = old | f
+        result = [i for i in result
+                  if not any(j != i and self._is_ancestor_idx(i, j) for j in result)]
+        return [hexlify(self._sha1s[i]) for i in result]
+
+    def _is_ancestor_idx(self, ancestor, descendant):
+        return self.is_ancestor(hexlify(self._sha1s[ancestor]),
+                                hexlify(self._sha1s[descendant]))
+
+    def first_parents(self, sha1):
+        """
+        Iterate over a commit and its first parents
+
+        Like ``git rev-list --first-parent sha1``.
+
+        OUTPUT:
+
+        Generator yielding SHA-1s.
+        """
+        i = self._idx(sha1)
+        while True:
+            yield hexlify(self._sha1s[i])
+            start, end = self._parent_start[i], self._parent_start[i+1]
+            if start == end:
+                return
+            i = self._parents[start]
+
+    def ahead_behind(self, base, tips):
+        """
+        Count the commits ahead and behind ``base`` for each tip
+
+        Like ``git rev-list --left-right --count base...tip`` for each
+        tip, but in a single walk. Each commit gets a bit mask of the
+        tips that reach it, which is propagated from the children to
+        the parents; bit 0 is the base. A commit whose mask contains
+        the bit of a tip but not bit 0 is ahead of the base, and vice
+        versa. The walk stops as soon as all remaining commits are
+        reachable from every tip.
+
+        INPUT:
+
+        - ``base`` -- string. The SHA-1 of the base commit.
+
+        - ``tips`` -- list of strings. The SHA-1s of the branches.
+
+        OUTPUT:
+
+        List of pairs ``(ahead, behind)``, one for each tip.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: git = repo.git
+            sage: tips = [branch.commit.sha1 for branch in repo.local_branches()]
+            sage: graph = repo.commit_graph()
+            sage: counts = graph.ahead_behind(repo.master.commit.sha1, tips)
+            sage: def count(tip):
+            ....:     output = git.rev_list('master...' + tip, left_right=True, count=True)
+            ....:     behind, ahead = map(int, output.split())
+            ....:     return (ahead, behind)
+            sage: counts == map(count, tips)
+            True
+        """
+        if not tips:
+            return []
+        sha1s = [base] + list(tips)
+        full = (1 << len(sha1s)) - 1
+        masks = dict()
+        for bit, sha1 in enumerate(sha1s):
+            i = self._idx(sha1)
+            masks[i] = masks.get(i, 0) | (1 << bit)
+        heap = [-i for i in masks]
+        heapq.heapify(heap)
+        # number of commits in the queue that are not reachable from every tip
+        active = sum(1 for mask in masks.itervalues() if mask != full)
+        histogram = dict()
+        while active:
+            i = -heapq.heappop(heap)
+            mask = masks[i]
+            if mask != full:
+                active -= 1
+                histogram[mask] = histogram.get(mask, 0) + 1
+            for p in self._parent_indices(i):
+                old = masks.get(p)
+                if old is None:
+                    masks[p] = mask
+                    heapq.heappush(heap, -p)
+                    if mask != full:
+                        active += 1
+                else:
+                    masks[p] = old | mask
+                    if old != full and old | mask == full:
+                        active -= 1
+        result = []
+        for i in range(len(tips)):
+            bit = 1 << (i + 1)
+            ahead = behind = 0
+            for mask, count in histogram.iteritems():
+                if mask & bit and not mask & 1:
+                    ahead += count
+                elif mask & 1 and not mask & bit:
+                    behind += count
+            result.append((ahead, behind))
+        return result
+
+    def walk(self, tips, exclude=()):
+        """
+        Iterate over the commits reachable from ``tips`` but not from ``exclude``
+
+        Like ``git rev-list --topo-order tips --not exclude``, though
+        the order among unrelated commits can differ.
+
+        INPUT:
+
+        - ``tips``, ``exclude`` -- lists of SHA-1s.
+
+        OUTPUT:
+
+        Generator yielding SHA-1s, children before parents. Use
+        :func:`itertools.islice` to page through the result.
+        """
+        flags = dict()
+        for sha1 in exclude:
+            flags[self._idx(sha1)] = _STALE
+        for sha1 in tips:
+            i = self._idx(sha1)
+            flags.setdefault(i, 0)
+        heap = [-i for i in flags]
+        heapq.heapify(heap)
+        while any(not flags[-x] & _STALE for x in heap):
+            i = -heapq.heappop(heap)
+            f = flags[i]
+            if not f & _STALE:
+                yield hexlify(self._sha1s[i])
+            for p in self._parent_indices(i):
+                old = flags.get(p)
+                if old is None:
+                    flags[p] = f
+                    heapq.heappush(heap, -p)
+                else:
+                    flags[p] = old | f
@@ -0,0 +1,333 @@
+r"""
+Prefetching and Caching of File Diffs
+
+Selecting a file in the git window shows its diff. Running ``git
+diff`` once for each file means one subprocess for each selected file.
+Instead, the :class:`GitDiffCache` runs ``git diff`` once for the
+whole range, splits the output into the diffs of the individual files,
+and caches them. The cache keys are ``(from, to, path, algorithm)``. Diffs between two
+commits are also stored in the persistent cache of the repository, if
+there is one.
+
+Diffs against the work tree (the ``to`` commit is missing) are only
+valid as long as the file and the index are unchanged. Their keys
+therefore also contain the modification time and size of the file and
+the repository fingerprint (see :mod:`~sageui.model.git_cache`).
+
+EXAMPLES::
+
+    sage: repo = test.new_git_repo()
+    sage: repo.base_commit = repo.head.get_history()[-1]
+    sage: changes = repo.changes()
+    sage: git = repo.git
+    sage: git.statistics.clear()
+    sage: print changes[3].diff()
+    diff --git a/foo4.txt b/foo4.txt
+    ...
+    +another line
+    <BLANKLINE>
+    sage: diffs = [git_file.diff() for git_file in changes
+    ....:          if git_file.type != 'untracked']
+    sage: git.statistics.histograms()['diff'].count
+    1
+    sage: repo.diffs.statistics()['hits']    # the first lookup after prefetching hits, too
+    7
+
+Editing a file in the work tree invalidates its diff::
+
+    sage: import os
+    sage: with open(os.path.join(git.work_tree, 'foo4.txt'), 'a') as f:
+    ....:     f.write('one more line\n')
+    sage: print changes[3].diff()
+    diff --git a/foo4.txt b/foo4.txt
+    ...
+    +another line
+    +one more line
+    <BLANKLINE>
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import time
+
+from git_refs import is_sha1
+from sageui.misc.lru_cache import LRUCache, WeightedLRUCache
+from diagnostics import diagnostics
+
+
+# Pseudo-algorithm for ``--word-diff=porcelain``
+WORD_DIFF = 'word'
+
+
+def _diff_options(algorithm):
+    if algorithm == WORD_DIFF:
+        return ['--word-diff=porcelain']
+    return ['--diff-algorithm=' + algorithm]
+
+
+def _header_path(line):
+    r"""
+    Return the path in a ``diff --git`` header line
+
+    Renames are switched off, so both sides name the same path.
+
+    OUTPUT:
+
+    String or ``None`` if the line cannot be parsed.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_diff_cache import _header_path
+        sage: _header_path('diff --git a/foo b/bar b/foo b/bar')
+        'foo b/bar'
+        sage: _header_path(r'diff --git "a/t\303\244b\tx" "b/t\303\244b\tx"')
+        't\xc3\xa4b\tx'
+        sage: _header_path('diff --git a/foo b/bar') is None
+        True
+    """
+    both = line[len('diff --git '):]
+    n = (len(both) - 1) // 2
+    old, separator, new = both[:n], both[n:n+1], both[n+1:]
+    if separator != ' ':
+        return None
+    if old.startswith('"a/') and new.startswith('"b/') and old[3:] == new[3:]:
+        return old[3:-1].decode('string_escape')
+    if old.startswith('a/') and new.startswith('b/') and old[2:] == new[2:]:
+        return old[2:]
+    return None
+
+
+def split_diff(output):
+    r"""
+    Split the output of ``git diff --no-renames`` by file
+
+    INPUT:
+
+    - ``output`` -- string.
+
+    OUTPUT:
+
+    Dictionary whose keys are the paths and whose values are the
+    diffs of the individual files.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_diff_cache import split_diff
+        sage: diff = ('diff --git a/foo b/foo\n'
+        ....:         '--- a/foo\n+++ b/foo\n@@ -1 +1 @@\n-diff --git a/x b/x\n+y\n'
+        ....:         'diff --git a/bar b/bar\n'
+        ....:         'Binary files a/bar and b/bar differ\n')
+        sage: sorted(split_diff(diff).items())
+        [('bar', 'diff --git a/bar b/bar\nBinary files a/bar and b/bar differ\n'),
+         ('foo', 'diff --git a/foo b/foo\n--- a/foo\n+++ b/foo\n@@ -1 +1 @@\n-diff --git a/x b/x\n+y\n')]
+    """
+    result = dict()
+    path = None
+    lines = []
+    for line in output.splitlines(True):
+        # removed lines start with '-', so this is always a header
+        if line.startswith('diff --git '):
+            if path is not None:
+                result[path] = ''.join(lines)
+            path = _header_path(line.rstrip('\n'))
+            lines = []
+        lines.append(line)
+    if path is not None:
+        result[path] = ''.join(lines)
+    return result
+
+
+class GitDiffCache(object):
+    """
+    Cache for the diffs of single files
+
+    You should not construct this yourself, use
+    :attr:`GitRepository.diffs
+    <sageui.model.git_repository.GitRepository.diffs>`.
+
+    INPUT:
+
+    - ``git`` -- a :class:`~sageui.model.git_interface.GitInterface`.
+
+    - ``max_bytes`` -- integer. The maximal total size of the cached
+      file diffs.
+
+    - ``persistent`` -- a
+      :class:`~sageui.misc.lru_cache.PersistentLRUCache` or ``None``
+      (default). Where the diffs between two commits are kept across
+      sessions.
+    """
+
+    def __init__(self, git, max_bytes=32 * 2**20, persistent=None):
+        self._git = git
+        self._lru = WeightedLRUCache(max_bytes)
+        self._prefetched = LRUCache(16)
+        self._persistent = persistent
+        diagnostics.register('diffs', self)
+
+    def _is_persistent(self, key):
+        return (self._persistent is not None and key[1] is not None
+                and is_sha1(key[0]) and is_sha1(key[1]))
+
+    def _get(self, key):
+        result = self._lru.get(key)
+        if result is None and self._is_persistent(key):
+            result = self._persistent.get(('diff',) + key)
+            if result is not None:
+                self._lru.put(key, result)
+        return result
+
+    def _put(self, key, diff):
+        self._lru.put(key, diff)
+        if self._is_persistent(key):
+            self._persistent.put(('diff',) + key, diff)
+
+    def _key(self, from_commit, to_commit, path, algorithm, fingerprint):
+        """
+        Return the cache key
+        """
+        if to_commit is not None:
+            return (str(from_commit), str(to_commit), path, algorithm)
+        try:
+            st = os.stat(os.path.join(self._git.work_tree, path))
+            stat = (st.st_mtime, st.st_size)
+        except OSError:
+            stat = None
+        return (str(from_commit), None, path, algorithm, fingerprint, stat)
+
+    def _run(self, from_commit, to_commit, algorithm, path=None):
+        args = [from_commit] if to_commit is None else [from_commit, to_commit]
+        args += _diff_options(algorithm)
+        if path is None:
+            args.append('--no-renames')
+        else:
+            args += ['--', path]
+        return self._git.diff(*args)
+
+    def prefetch(self, from_commit, to_commit=None, algorithm='minimal'):
+        """
+        Cache the diffs of all files in the range
+
+        INPUT:
+
+        - ``from_commit`` -- a :class:`~sageui.model.git_commit.GitCommit`.
+
+        - ``to_commit`` -- a :class:`~sageui.model.git_commit.GitCommit`
+          or ``None`` (default). In the latter case, the diff is
+          against the work tree.
+
+        - ``algorithm`` -- string. The diff algorithm, see
+          :meth:`diff`.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: history = repo.head.get_history()
+            sage: repo.diffs.prefetch(history[-1], history[0])
+            sage: repo.diffs.statistics()['size']
+            5
+
+        The cache is bounded by the total size of the diffs, not by
+        their number::
+
+            sage: from sageui.model.git_diff_cache import GitDiffCache
+            sage: small = GitDiffCache(repo.git, max_bytes=300)
+            sage: small.prefetch(history[-1], history[0])
+            sage: stats = small.statistics()
+            sage: stats['size'], stats['evictions'], stats['bytes'] <= 300
+            (2, 3, True)
+        """
+        fingerprint = self._git.cache.fingerprint()
+        if fingerprint is None:
+            return
+        start = time.time()
+        output = self._run(from_commit, to_commit, algorithm)
+        for path, diff in split_diff(output).iteritems():
+            key = self._key(from_commit, to_commit, path, algorithm, fingerprint)
+            if to_commit is None and (key[-1] is None or key[-1][0] >= start):
+                continue   # the file might have changed while git was running
+            self._put(key, diff)
+        self._prefetched.put((str(from_commit), str(to_commit), algorithm), fingerprint)
+
+    def diff(self, from_commit, to_commit, path, algorithm='minimal'):
+        """
+        Return the diff of a single file
+
+        On the first request for a range, the diffs of all files in
+        the range are fetched (see :meth:`prefetch`).
+
+        INPUT:
+
+        - ``from_commit``, ``to_commit`` -- see :meth:`prefetch`.
+
+        - ``path`` -- string. The file name relative to the top of
+          the work tree.
+
+        - ``algorithm`` -- string. One of ``patience``, ``minimal``,
+          ``histogram``, and ``myers``, see ``git help diff``. Or
+          :data:`WORD_DIFF` for the word diff.
+
+        OUTPUT:
+
+        String.
+        """
+        fingerprint = self._git.cache.fingerprint()
+        if fingerprint is None:
+            return self._run(from_commit, to_commit, algorithm, path)
+        key = self._key(from_commit, to_commit, path, algorithm, fingerprint)
+        result = self._get(key)
+        if result is not None:
+            return result
+        range_key = (str(from_commit), str(to_commit), algorithm)
+        if self._prefetched.get(range_key) != fingerprint:
+            self.prefetch(from_commit, to_commit, algorithm)
+            result = self._lru.get(key)
+            if result is not None:
+                return result
+        result = self._run(from_commit, to_commit, algorithm, path)
+        self._put(key, result)
+        return result
+
+    def shrink(self, fraction=0.5):
+        """
+        Evict entries until at most ``fraction`` of ``max_bytes`` is used
+        """
+        self._lru.shrink(fraction)
+        self._prefetched.clear()
+
+    def clear(self):
+        """
+        Remove all entries and reset the statistics
+        """
+        self._lru.clear()
+        self._prefetched.clear()
+
+    def statistics(self):
+        """
+        Return the hit/miss counters
+
+        OUTPUT:
+
+        Dictionary.
+        """
+        lru = self._lru
+        return {'hits': lru.hits, 'misses': lru.misses, 'lookups': lru.lookups,
+                'evictions': lru.evictions, 'size': len(lru.data), 'bytes': lru.weight}
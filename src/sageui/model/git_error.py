@@ -140,3 +140,80 @@ class UserEmailException(RuntimeError):
         """
         RuntimeError.__init__(self, "user/email is not configured, cannot make commits")
 
+
+class GitObjectMissingError(KeyError):
+    r"""
+    Error raised if a revision cannot be resolved to a git object.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_error import GitObjectMissingError
+        sage: raise GitObjectMissingError('refs/heads/nonexisting')
+        Traceback (most recent call last):
+        ...
+        GitObjectMissingError: 'no such git object: refs/heads/nonexisting'
+    """
+    def __init__(self, revision):
+        r"""
+        Initialization.
+
+        TESTS::
+
+            sage: from sageui.model.git_error import GitObjectMissingError
+            sage: GitObjectMissingError('HEAD~100').revision
+            'HEAD~100'
+        """
+        self.revision = revision
+        KeyError.__init__(self, 'no such git object: ' + revision)
+
+
+class GitReplayMissingError(KeyError):
+    r"""
+    Error raised if a git interaction was not recorded.
+
+    See :mod:`~sageui.model.git_replay`.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_error import GitReplayMissingError
+        sage: raise GitReplayMissingError('no recording of run git status')
+        Traceback (most recent call last):
+        ...
+        GitReplayMissingError: 'no recording of run git status'
+    """
+    pass
+
+
+class GitCancelledError(GitError):
+    r"""
+    Error raised if git was killed before it finished.
+
+    INPUT:
+
+    - ``result`` -- dictionary, see :class:`GitError`.
+
+    - ``timeout`` -- number or ``None`` (default). The timeout in
+      seconds if git was killed because it took too long, or
+      ``None`` if the user cancelled it.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_error import GitCancelledError
+        sage: result = {'exit_code':-15, 'stdout':'', 'stderr':'', 'cmd':'git fetch trac'}
+        sage: raise GitCancelledError(result)
+        Traceback (most recent call last):
+        ...
+        GitCancelledError: cancelled "git fetch trac"
+        sage: raise GitCancelledError(result, timeout=60)
+        Traceback (most recent call last):
+        ...
+        GitCancelledError: timeout after 60 seconds when executing "git fetch trac"
+    """
+    def __init__(self, result, timeout=None):
+        GitError.__init__(self, result)
+        self.timeout = timeout
+        if timeout is None:
+            msg = 'cancelled "{}"'.format(self.cmd)
+        else:
+            msg = 'timeout after {} seconds when executing "{}"'.format(timeout, self.cmd)
+        RuntimeError.__init__(self, msg)
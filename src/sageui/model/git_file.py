@@ -22,6 +22,10 @@ Diffs for Files in the Git Working Tree
 ##############################################################################
 
 
+from diagnostics import diagnostics
+
+
+@diagnostics.track
 class GitFileABC(object):
 
     def __init__(self, repository, filename):
@@ -74,6 +78,10 @@ class GitFileCommitted(GitFileABC):
     def _diff_commits(self):
         return [self.commit]
 
+    def _diff(self, algorithm):
+        commits = self._diff_commits() + [None]
+        return self.repository.diffs.diff(commits[0], commits[1], self.name, algorithm)
+
     def diff(self, algorithm='minimal'):
         """
         Return the diff from `self.commit`
@@ -105,8 +113,7 @@ class GitFileCommitted(GitFileABC):
         """
         if self.binary:
             raise ValueError('cannot diff binary files')
-        args = self._diff_commits() + ['--diff-algorithm='+algorithm, '--', self.name]
-        return self.repository.git.diff(*args)
+        return self._diff(algorithm)
 
     def word_diff(self):
         """
@@ -136,8 +143,8 @@ class GitFileCommitted(GitFileABC):
         """
         if self.binary:
             raise ValueError('cannot diff binary files')
-        args = self._diff_commits() + ['--word-diff=porcelain', '--', self.name]
-        return self.repository.git.diff(*args)
+        from git_diff_cache import WORD_DIFF
+        return self._diff(WORD_DIFF)
 
 
 class GitFileDiff(GitFileCommitted):
@@ -0,0 +1,213 @@
+r"""
+Lazily Loaded Commit History
+
+The base commit of the changes can be any commit in the history of a
+branch. The history can be arbitrarily long, so it is loaded in pages
+when it is accessed. It consists of two parts:
+
+* the commits on the branch that are not on the upstream branch
+  (``git rev-list --topo-order commit ^upstream``), newest first,
+
+* the merge base with the upstream and its first-parent ancestors,
+  that is, the history of the upstream branch from the point where
+  the branch forked off.
+
+Both are walks of the in-memory :mod:`commit graph
+<sageui.model.git_commit_graph>`, so paging does not run git.
+
+EXAMPLES::
+
+    sage: repo = test.git_repo()
+    sage: head = repo.head
+    sage: history = head.history(page_size=2)
+    sage: history
+    <GitHistory of Commit ...: 0 commits loaded>
+    sage: history[0] == head
+    True
+    sage: history.loaded
+    2
+    sage: history[5] == repo.master.commit
+    True
+    sage: history[0:6] == head.get_history()
+    True
+    sage: history.loaded
+    6
+    sage: len(history)
+    6
+    sage: len(list(history))
+    6
+    sage: history[-1].get_message('%s')
+    'initial commit\n'
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+from itertools import islice
+
+from sageui.misc.cached_property import cached_property
+
+
+class GitHistory(object):
+    """
+    The history of a commit relative to an upstream commit
+
+    You should not construct this yourself, use
+    :meth:`GitCommit.history <sageui.model.git_commit.GitCommit.history>`.
+
+    INPUT:
+
+    - ``commit`` -- a :class:`~sageui.model.git_commit.GitCommit`.
+
+    - ``upstream`` -- a :class:`~sageui.model.git_commit.GitCommit`
+      or ``None`` (default). By default, ``master``.
+
+    - ``page_size`` -- integer. The number of commits that are
+      loaded with a single git command.
+
+    The history behaves like a read-only list of
+    :class:`~sageui.model.git_commit.GitCommit`. Indexing and
+    iterating only loads as many pages as necessary. Only the length
+    and negative indices require to count all commits.
+    """
+
+    def __init__(self, commit, upstream=None, page_size=50):
+        self.commit = commit
+        self.repository = commit.repository
+        if upstream is None:
+            upstream = self.repository.master.commit
+        self.upstream = upstream
+        self.page_size = page_size
+        self._commits = []
+        self._branch_done = False
+        self._exhausted = False
+
+    def __repr__(self):
+        return '<GitHistory of {0!r}: {1} commits loaded>'.format(self.commit, self.loaded)
+
+    @property
+    def loaded(self):
+        """
+        The number of commits that are already loaded
+        """
+        return len(self._commits)
+
+    @cached_property
+    def _graph(self):
+        return self.repository.commit_graph(self.commit, self.upstream)
+
+    @cached_property
+    def merge_base(self):
+        """
+        The merge base of the commit and the upstream or ``None``
+        """
+        merge_bases = self.repository.merge_bases(self.commit, self.upstream)
+        return merge_bases[0] if merge_bases else None
+
+    def _branch_walk(self):
+        return self._graph.walk([self.commit.sha1], exclude=[self.upstream.sha1])
+
+    def _upstream_walk(self):
+        return self._graph.first_parents(self.merge_base.sha1)
+
+    @cached_property
+    def _walks(self):
+        """
+        The generators of the SHA-1s of the pages, consumed by :meth:`_load_page`
+        """
+        return [self._branch_walk(), None]
+
+    def _page(self, walk):
+        from git_commit import GitCommit
+        repo = self.repository
+        graph = self._graph
+        return [GitCommit(repo, sha1, graph.title(sha1))
+                for sha1 in islice(walk, self.page_size)]
+
+    def _load_page(self):
+        """
+        Load the next page
+
+        OUTPUT:
+
+        Boolean. Whether there might be more commits.
+        """
+        if self._exhausted:
+            return False
+        walks = self._walks
+        if not self._branch_done:
+            page = self._page(walks[0])
+            self._commits.extend(page)
+            if len(page) < self.page_size:
+                self._branch_done = True
+            return True
+        if walks[1] is None:
+            if self.merge_base is None:
+                self._exhausted = True
+                return False
+            walks[1] = self._upstream_walk()
+        page = self._page(walks[1])
+        self._commits.extend(page)
+        if len(page) < self.page_size:
+            self._exhausted = True
+        return bool(page)
+
+    def _load_until(self, n):
+        while len(self._commits) < n and self._load_page():
+            pass
+
+    @cached_property
+    def _length(self):
+        length = sum(1 for sha1 in self._branch_walk())
+        if self.merge_base is not None:
+            length += sum(1 for sha1 in self._upstream_walk())
+        return length
+
+    def __len__(self):
+        """
+        Return the number of commits
+
+        This counts the commits without loading them.
+        """
+        if self._exhausted:
+            return len(self._commits)
+        return self._length
+
+    def __iter__(self):
+        i = 0
+        while True:
+            self._load_until(i + 1)
+            if i >= len(self._commits):
+                return
+            yield self._commits[i]
+            i += 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.start, key.stop, key.step
+            if stop is None or stop < 0 or (start is not None and start < 0):
+                start, stop, step = key.indices(len(self))
+            self._load_until(stop)
+            return self._commits[start:stop:step]
+        if key < 0:
+            key += len(self)
+        self._load_until(key + 1)
+        if not 0 <= key < len(self._commits):
+            raise IndexError('history index out of range')
+        return self._commits[key]
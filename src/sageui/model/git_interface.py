@@ -54,10 +54,15 @@ EXAMPLES::
 
 import os
 import subprocess
+import tempfile
+import threading
+import Queue
 
 from sageui.misc.cached_property import cached_property
 
 from git_error import GitError, DetachedHeadException, UserEmailException
+from git_cache import GitResultCache
+from git_stats import GitStatistics, GitProcess
 
 
 
@@ -110,6 +115,28 @@ class GitInterfacePrintProxy(object):
 
 
 
+class GitQuery(object):
+    """
+    A git command to be run later, see :meth:`GitInterface.execute_batch`
+
+    The arguments are the same as for :meth:`GitInterface.execute`.
+
+    EXAMPLES::
+
+        >>> GitQuery('diff', 'HEAD', numstat=True, z=True)
+        GitQuery('diff', 'HEAD', numstat=True, z=True)
+    """
+    def __init__(self, cmd, *args, **kwds):
+        self.cmd = cmd
+        self.args = args
+        self.kwds = kwds
+
+    def __repr__(self):
+        args = [repr(self.cmd)] + [repr(arg) for arg in self.args]
+        args += [k + '=' + repr(v) for k, v in sorted(self.kwds.iteritems())]
+        return 'GitQuery(' + ', '.join(args) + ')'
+
+
 class GitInterface(object):
     r"""
     A wrapper around the ``git`` command line tool.
@@ -130,12 +157,21 @@ class GitInterface(object):
         if not os.path.exists(repository_path):
             raise ValueError('{} does not point to an existing directory.'.format(repository_path))
         self._work_tree = os.path.abspath(repository_path)
-        self._git_dir = os.path.join(self._work_tree, '.git') if git_dir is None else git_dir
+        if git_dir is None:
+            git_dir = os.path.join(self._work_tree, '.git')
+            if os.path.isfile(git_dir):
+                # linked worktree, see ``git help worktree``
+                from git_refs import GitRefReader
+                git_dir = GitRefReader(git_dir).git_dir
+        self._git_dir = git_dir
         self._git_cmd = 'git' if git_cmd is None else git_cmd
         self._user_email_set = False
         self.silent = GitInterfaceSilentProxy(self)
         self.exit_code = GitInterfaceExitCodeProxy(self)
         self.echo = GitInterfacePrintProxy(self)
+        self.cache = GitResultCache(self)
+        self.statistics = GitStatistics()
+        self._recorder = None
 
     @property
     def git_cmd(self):
@@ -153,6 +189,9 @@ class GitInterface(object):
     def git_dir(self):
         """
         The git private directory. Usually ``.git``
+
+        In a linked worktree, this is the per-worktree directory that
+        the ``.git`` file points to.
         
         OUTPUT:
 
@@ -181,6 +220,81 @@ class GitInterface(object):
         """
         return self._work_tree
 
+    @cached_property
+    def objects(self):
+        """
+        Read git objects without forking a new git process each time.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_cat_file.GitObjectServer`. It
+        keeps ``git cat-file`` coprocesses running until
+        :meth:`close` is called.
+
+        EXAMPLES::
+
+            >>> git.objects.info('HEAD')    # doctest: +ELLIPSIS
+            ('...', 'commit', ...)
+        """
+        from git_cat_file import GitObjectServer
+        return GitObjectServer(self)
+
+    @cached_property
+    def refs(self):
+        """
+        Resolve references without forking git.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_refs.GitRefs`.
+
+        EXAMPLES::
+
+            >>> git.refs.symbolic_head()
+            'refs/heads/master'
+        """
+        from git_refs import GitRefs
+        return GitRefs(self)
+
+    def close(self):
+        """
+        Terminate any long-lived git coprocesses.
+        """
+        if 'objects' in self.__dict__:
+            self.objects.close()
+        self.stop_recording()
+
+    def start_recording(self, filename):
+        """
+        Record all interactions with git
+
+        INPUT:
+
+        - ``filename`` -- string. The recording is written to this
+          file. It can be replayed with
+          :class:`~sageui.model.git_replay.GitReplayInterface`.
+        """
+        from git_replay import GitRecorder
+        self.stop_recording()
+        self.cache.clear()
+        self._recorder = GitRecorder(self, filename)
+
+    def stop_recording(self):
+        """
+        Stop recording and close the recording file
+        """
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
+    def _record(self, channel, request, response):
+        """
+        Record an interaction if :meth:`start_recording` was called
+        """
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(channel, request, response)
+
     def __repr__(self):
         r"""
         Return a printable representation of this object.
@@ -366,6 +480,40 @@ class GitInterface(object):
             for line in log.splitlines():
                 print 'DEBUG '+prefix+': '+line
 
+    def _environment(self):
+        """
+        Return the environment for git subprocesses
+        """
+        env = dict(os.environ)
+        env['GIT_DIR'] = self.git_dir
+        env['GIT_WORK_TREE'] = self.work_tree
+        return env
+
+    def _command_line(self, cmd, args, kwds):
+        """
+        Return the git command line as a list of strings
+
+        See :meth:`execute` for the meaning of ``args`` and ``kwds``.
+
+        EXAMPLES::
+
+            >>> git._command_line('log', ['HEAD'], {'max_count':1, 'z':True})
+            ['git', 'log', '--max-count=1', '-z', 'HEAD']
+        """
+        s = [self.git_cmd, cmd]
+        for k, v in sorted(kwds.iteritems()):
+            if len(k) == 1:
+                k = '-' + k
+            else:
+                k = '--' + k.replace('_', '-')
+            if v is True:
+                s.append(k)
+            elif v is not False:
+                s.append(k+'='+str(v))
+        if args:
+            s.extend(a for a in args if a is not None)
+        return [str(arg) for arg in s]
+
     def _run_unsafe(self, cmd, args, kwds={}, popen_stdout=None, popen_stderr=None):
         r"""
         Run git
@@ -403,37 +551,26 @@ class GitInterface(object):
             sage: git._run_git('status', (), {}, stdout=False)
             (0, None, None, 'git status')
         """ 
-        s = [self.git_cmd, cmd]
-        for k, v in kwds.iteritems():
-            if len(k) == 1:
-                k = '-' + k
-            else:
-                k = '--' + k.replace('_', '-')
-            if v is True:
-                s.append(k)
-            elif v is not False:
-                s.append(k+'='+str(v))
-        if args:
-            s.extend(a for a in args if a is not None)
-        s = [str(arg) for arg in s]
+        s = self._command_line(cmd, args, kwds)
         complete_cmd = ' '.join(s)
         self._log('cmd', complete_cmd)
 
-        env = dict(os.environ)
-        env['GIT_DIR'] = self.git_dir
-        env['GIT_WORK_TREE'] = self.work_tree
+        env = self._environment()
+        timer = self.statistics.timer(s)
         if cmd == 'stash':
             # bug
             try:
                 cwd = os.getcwd()
                 os.chdir(self.work_tree)
-                process = subprocess.Popen(s, stdout=popen_stdout, stderr=popen_stderr, env=env)
+                process = GitProcess(s, stdout=popen_stdout, stderr=popen_stderr, env=env)
             finally:
                 os.chdir(cwd)
         else:
-            process = subprocess.Popen(s, stdout=popen_stdout, stderr=popen_stderr, env=env)
+            process = GitProcess(s, stdout=popen_stdout, stderr=popen_stderr, env=env)
         stdout, stderr = process.communicate()
         retcode = process.poll()
+        timer.stop(retcode, len(stdout or ''), len(stderr or ''), process.cpu_time)
+        self._record('run', s, (retcode, stdout or '', stderr or ''))
         if stdout is not None and popen_stdout is subprocess.PIPE:
             self._log('stdout', stdout)
         if stderr is not None and popen_stderr is subprocess.PIPE:
@@ -443,15 +580,40 @@ class GitInterface(object):
     # commands that cannot change the working tree even with
     # some crazy flags set - these commands should be safe
     _safe_commands = [
-        'config', 'diff', 'grep', 'log', 'ls_remote', 'remote', 'reset', 'show', 
+        'cat_file', 'config', 'diff', 'for_each_ref', 'grep', 'log', 'ls_files',
+        'ls_remote', 'merge_base', 'remote', 'reset', 'rev_list', 'rev_parse', 'show', 
         'show_ref', 'status', 'symbolic_ref' ]
+
+    # commands that only read from the repository and can therefore
+    # run concurrently with each other, see :meth:`execute_batch`
+    _read_only_commands = [
+        'cat_file', 'diff', 'for_each_ref', 'grep', 'log', 'ls_files', 'merge_base',
+        'rev_list', 'rev_parse', 'show', 'show_ref', 'status', 'symbolic_ref' ]
+
+    def _is_safe(self, cmd):
+        """
+        Whether ``cmd`` cannot change the working tree
+
+        EXAMPLES::
+
+            >>> git._is_safe('show-ref'), git._is_safe('commit')
+            (True, False)
+        """
+        return cmd.replace('-', '_') in self._safe_commands
         
+    def _is_read_only(self, cmd):
+        return cmd.replace('-', '_') in self._read_only_commands
+
     def _run(self, cmd, args, kwds={}, popen_stdout=None, popen_stderr=None, exit_code_to_exception=True):
-        if cmd not in self._safe_commands:
+        if not self._is_safe(cmd):
             self._check_user_email()
+        if not self._is_read_only(cmd):
+            self.cache.invalidate()
         result = self._run_unsafe(cmd, args, kwds,
                                   popen_stdout=popen_stdout,
                                   popen_stderr=popen_stderr)
+        if not self._is_read_only(cmd):
+            self.cache.invalidate()
         if exit_code_to_exception and result['exit_code']:
             raise GitError(result)
         return result
@@ -485,13 +647,240 @@ class GitInterface(object):
             ...
             GitError: git returned with non-zero exit code (129)
         """
+        key = self.cache.key(self._command_line(cmd, args, kwds))
+        if key is not None:
+            stdout = self.cache.get(key)
+            if stdout is not None:
+                return stdout
         result = self._run(cmd, args, kwds,
                            popen_stdout=subprocess.PIPE,
                            popen_stderr=subprocess.PIPE)
+        if key is not None:
+            self.cache.put(key, result['stdout'])
         return result['stdout']
 
     __call__ = execute
 
+    def execute_batch(self, queries, max_workers=4):
+        r"""
+        Run a number of read-only git commands concurrently.
+
+        INPUT:
+
+        - ``queries`` -- list of :class:`GitQuery`. Only commands that
+          do not modify the repository are allowed.
+
+        - ``max_workers`` -- integer. The maximal number of git
+          processes running at the same time.
+
+        OUTPUT:
+
+        List of strings, the stdout of each query in the same order.
+        If any query fails, the :class:`~sageui.model.git_error.GitError`
+        of the first failed query is raised after all have finished.
+
+        EXAMPLES::
+
+            >>> git.execute_batch([GitQuery('rev-parse', 'HEAD'),
+            ...                    GitQuery('status', porcelain=True)])   # doctest: +ELLIPSIS
+            ['...\n', '?? untracked\n']
+        """
+        for query in queries:
+            if not self._is_read_only(query.cmd):
+                raise ValueError('not a read-only git command: ' + query.cmd)
+        results = [None] * len(queries)
+        keys = [self.cache.key(self._command_line(query.cmd, query.args, query.kwds))
+                for query in queries]
+        pending = Queue.Queue()
+        for i, query in enumerate(queries):
+            stdout = None if keys[i] is None else self.cache.get(keys[i])
+            if stdout is None:
+                pending.put((i, query))
+            else:
+                results[i] = {'exit_code':0, 'stdout':stdout}
+        def worker():
+            while True:
+                try:
+                    i, query = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                results[i] = self._run(query.cmd, query.args, query.kwds,
+                                       popen_stdout=subprocess.PIPE,
+                                       popen_stderr=subprocess.PIPE,
+                                       exit_code_to_exception=False)
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(max_workers, pending.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for key, result in zip(keys, results):
+            if result['exit_code']:
+                raise GitError(result)
+            if key is not None:
+                self.cache.put(key, result['stdout'])
+        return [result['stdout'] for result in results]
+
+    def execute_iter(self, cmd, *args, **kwds):
+        r"""
+        Run git and iterate over its output records as they arrive.
+
+        Same arguments as :meth:`execute`. Records are separated by
+        NUL if the ``z=True`` keyword is passed, and by newlines
+        otherwise. Raises an exception at the end of the iteration if
+        git has non-zero exit code.
+
+        OUTPUT:
+
+        Generator yielding strings. Pass it to one of the parsers in
+        :mod:`sageui.model.git_records` to get typed records. If the
+        generator is closed early, git is terminated.
+
+        EXAMPLES::
+
+            >>> list(git.execute_iter('status', porcelain=True, z=True))
+            ['?? untracked']
+        """
+        from git_records import iter_records
+        if not self._is_safe(cmd):
+            self._check_user_email()
+        if not self._is_read_only(cmd):
+            self.cache.invalidate()
+        separator = '\0' if kwds.get('z', False) else '\n'
+        s = self._command_line(cmd, args, kwds)
+        key = self.cache.key(s)
+        if key is not None:
+            stdout = self.cache.get(key)
+            if stdout is not None:
+                for record in iter_records([stdout], separator):
+                    yield record
+                return
+        complete_cmd = ' '.join(s)
+        self._log('cmd', complete_cmd)
+        stderr = tempfile.TemporaryFile()
+        timer = self.statistics.timer(s)
+        process = GitProcess(s, stdout=subprocess.PIPE, stderr=stderr,
+                             env=self._environment(), close_fds=True)
+        fd = process.stdout.fileno()
+        # keep the output for the cache unless it gets too large
+        cached_chunks = [] if key is not None else None
+        recorded_chunks = [] if self._recorder is not None else None
+        stdout_bytes = [0]
+        def chunks():
+            cached_size = 0
+            while True:
+                data = os.read(fd, 65536)
+                if not data:
+                    return
+                stdout_bytes[0] += len(data)
+                if recorded_chunks is not None:
+                    recorded_chunks.append(data)
+                if cached_chunks is not None:
+                    cached_size += len(data)
+                    if cached_size <= self._execute_iter_cache_limit:
+                        cached_chunks.append(data)
+                    else:
+                        del cached_chunks[:]
+                yield data
+        finished = False
+        try:
+            for record in iter_records(chunks(), separator):
+                yield record
+            finished = True
+        finally:
+            process.stdout.close()
+            if not finished and process.poll() is None:
+                try:
+                    process.terminate()
+                except OSError:
+                    pass
+            retcode = process.wait()
+            stderr.seek(0)
+            stderr_data = stderr.read()
+            stderr.close()
+            timer.stop(retcode, stdout_bytes[0], len(stderr_data), process.cpu_time)
+            if recorded_chunks is not None and finished:
+                self._record('run', s, (retcode, ''.join(recorded_chunks), stderr_data))
+        self._log('stderr', stderr_data)
+        if not self._is_read_only(cmd):
+            self.cache.invalidate()
+        if retcode:
+            raise GitError({'exit_code':retcode, 'stdout':'', 'stderr':stderr_data,
+                            'cmd':complete_cmd})
+        if cached_chunks:
+            self.cache.put(key, ''.join(cached_chunks))
+
+    # maximal size of the output of :meth:`execute_iter` that is cached
+    _execute_iter_cache_limit = 2**20
+
+    def execute_async(self, cmd, *args, **kwds):
+        r"""
+        Run git without waiting for it to finish.
+
+        The output is read via ``gobject.io_add_watch`` so the GTK
+        main loop keeps running while git is busy. The same arguments
+        as for :meth:`execute` are accepted.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred`. Its callbacks
+        are called with the stdout of git on the main loop. If git
+        returns with a non-zero exit code, its errbacks are called
+        with a :class:`~sageui.model.git_error.GitError` instead.
+
+        EXAMPLES::
+
+            >>> git.execute_async('status', porcelain=True).wait()
+            '?? untracked\n'
+        """
+        return self.run_async(cmd, args, kwds)
+
+    # commands that talk to a remote repository
+    _network_commands = ['clone', 'fetch', 'pull', 'push']
+
+    def run_async(self, cmd, args=(), kwds={}, progress=None, timeout=None):
+        r"""
+        Run git without waiting for it to finish.
+
+        Like :meth:`execute_async`, but with additional options for
+        long-running commands.
+
+        INPUT:
+
+        - ``cmd``, ``args``, ``kwds`` -- the git command, see
+          :meth:`execute`.
+
+        - ``progress`` -- function or ``None`` (default). For
+          network commands like ``fetch``, git is asked to report its
+          progress. The function is called with each
+          :class:`~sageui.model.git_records.ProgressRecord`.
+
+        - ``timeout`` -- number or ``None`` (default). Kill git if it
+          takes longer than that many seconds.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred`, see
+        :meth:`execute_async`. Calling its ``cancel()`` method kills
+        git. If git is killed, the errbacks are called with a
+        :class:`~sageui.model.git_error.GitCancelledError`.
+        """
+        from git_async import GitAsyncProcess
+        if not self._is_safe(cmd):
+            self._check_user_email()
+        if progress is not None and cmd in self._network_commands:
+            kwds = dict(kwds, progress=True)
+        s = self._command_line(cmd, args, kwds)
+        complete_cmd = ' '.join(s)
+        self._log('cmd', complete_cmd)
+        cwd = self.work_tree if cmd == 'stash' else None
+        read_only = self._is_read_only(cmd)
+        if not read_only:
+            self.cache.invalidate()
+        process = GitAsyncProcess(self, s, cwd=cwd, invalidate_cache=not read_only,
+                                  progress=progress, timeout=timeout)
+        return process.deferred
+
     def _check_user_email(self):
         r"""
         Make sure that a real name and an email are set for git. These will
@@ -547,20 +936,24 @@ git_commands = (
     "ls_files",
     "ls_remote",
     "merge",
+    "merge_base",
     "mv",
+    "pack_refs",
     "pull",
     "push",
     "rebase",
     "remote",
     "reset",
     "rev_list",
+    "rev_parse",
     "rm",
     "show",
     "show_ref",
     "stash",
     "status",
     "symbolic_ref",
-    "tag"
+    "tag",
+    "worktree"
 )
 
 def create_wrapper(git_cmd_underscore):
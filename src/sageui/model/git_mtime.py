@@ -0,0 +1,236 @@
+r"""
+Preserve Modification Times across Checkouts
+
+Git gives every file that it writes during a checkout the current
+time as modification time. When switching back and forth between
+two ticket branches, every file that differs between them therefore
+looks new to ``make`` (and to the Cython build of the Sage library),
+and is rebuilt although its content was already built before.
+
+The :class:`GitMtimeCache` remembers, for each path, the modification
+times of the contents (blob SHA-1s) that were checked out before.
+After a checkout, a file whose content was seen before gets its old
+modification time back. Files whose content is the same in both
+commits are not touched by git in the first place.
+
+.. WARNING::
+
+    Restoring an old modification time is only correct if the build
+    outputs for that content still exist. If the build products of
+    the other branch overwrote them (for example, the same ``.so``
+    file), then ``make`` considers the stale output up to date. Use
+    this together with per-branch build directories, worktrees (see
+    :mod:`~sageui.model.git_worktree`), or a compiler cache.
+
+EXAMPLES::
+
+    sage: import os
+    sage: repo = test.new_git_repo();  repo.git.silent.stash()
+    sage: repo.checkout_branch('my_branch')
+    Git branch my_branch
+    sage: path = os.path.join(repo.git.work_tree, 'foo2.txt')
+    sage: os.utime(path, (1000000000, 1000000000))
+    sage: repo.checkout_branch('u/user/description', preserve_mtimes=True)
+    Git branch sageui/none/u/user/description
+    sage: os.path.exists(path)
+    False
+    sage: repo.checkout_branch('my_branch', preserve_mtimes=True)
+    Git branch my_branch
+    sage: os.stat(path).st_mtime
+    1000000000.0
+
+The recorded times are kept in the git directory::
+
+    sage: from sageui.model.git_mtime import GitMtimeCache
+    sage: GitMtimeCache(repo.git).mtime('foo2.txt', repo.head.sha1 + ':foo2.txt')
+    1000000000.0
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import stat
+import cPickle
+
+from sageui.misc.cached_property import cached_property
+
+
+# Name of the file in the (per-worktree) git directory
+_FILENAME = 'sageui-mtimes'
+
+# Number of contents whose modification time is remembered per path
+_MAX_VERSIONS = 8
+
+# Number of paths per git command
+_CHUNK_PATHS = 200
+
+
+def _chunks(paths):
+    for i in range(0, len(paths), _CHUNK_PATHS):
+        yield paths[i:i+_CHUNK_PATHS]
+
+
+class GitMtimeCache(object):
+    """
+    Modification times of previously checked out file contents
+
+    You should not construct this yourself, use
+    :attr:`GitRepository.mtimes
+    <sageui.model.git_repository.GitRepository.mtimes>`.
+
+    INPUT:
+
+    - ``git`` -- a :class:`~sageui.model.git_interface.GitInterface`.
+    """
+
+    def __init__(self, git):
+        self._git = git
+
+    @property
+    def filename(self):
+        return os.path.join(self._git.git_dir, _FILENAME)
+
+    @cached_property
+    def _data(self):
+        """
+        Dictionary with paths as keys and lists of ``(blob, mtime)`` as values
+        """
+        try:
+            with open(self.filename, 'rb') as f:
+                return cPickle.load(f)
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            return dict()
+
+    def save(self):
+        """
+        Save the recorded times in the git directory
+        """
+        filename = self.filename
+        with open(filename + '.tmp', 'wb') as f:
+            cPickle.dump(self._data, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(filename + '.tmp', filename)
+
+    def _blobs(self, paths):
+        """
+        Return a dictionary with the blob SHA-1s of ``paths`` in the index
+        """
+        result = dict()
+        git = self._git
+        for chunk in _chunks(paths):
+            output = git.ls_files('--', *chunk, stage=True, z=True)
+            for record in output.split('\0'):
+                if not record:
+                    continue
+                info, path = record.split('\t', 1)
+                mode, sha1, stage = info.split(' ')
+                if stage == '0':
+                    result[path] = sha1
+        return result
+
+    def _modified(self, paths):
+        """
+        Return the set of ``paths`` whose content differs from the index
+        """
+        result = set()
+        git = self._git
+        for chunk in _chunks(paths):
+            output = git.diff('--', *chunk, name_only=True, z=True)
+            result.update(path for path in output.split('\0') if path)
+        return result
+
+    def mtime(self, path, blob):
+        """
+        Return the recorded modification time of a content or ``None``
+
+        INPUT:
+
+        - ``path`` -- string. The path relative to the work tree.
+
+        - ``blob`` -- string. The SHA-1 of the content, or any
+          expression that ``git rev-parse`` resolves to it.
+        """
+        if len(blob) != 40 or ':' in blob:
+            blob = self._git.rev_parse(blob).strip()
+        for sha1, mtime in self._data.get(path, []):
+            if sha1 == blob:
+                return mtime
+        return None
+
+    def record(self, paths):
+        """
+        Remember the modification times of ``paths`` in the work tree
+
+        Files with local modifications are skipped, since their
+        content is not known to git.
+
+        INPUT:
+
+        - ``paths`` -- list of strings. Paths relative to the work tree.
+        """
+        paths = list(paths)
+        if not paths:
+            return
+        blobs = self._blobs(paths)
+        modified = self._modified(paths)
+        data = self._data
+        for path, sha1 in blobs.iteritems():
+            if path in modified:
+                continue
+            try:
+                mtime = os.lstat(os.path.join(self._git.work_tree, path)).st_mtime
+            except OSError:
+                continue
+            versions = [v for v in data.get(path, []) if v[0] != sha1]
+            versions.append((sha1, mtime))
+            data[path] = versions[-_MAX_VERSIONS:]
+
+    def restore(self, paths):
+        """
+        Set the recorded modification times of ``paths`` in the work tree
+
+        INPUT:
+
+        - ``paths`` -- list of strings. Paths relative to the work tree.
+
+        OUTPUT:
+
+        The number of files whose modification time was restored.
+        """
+        paths = [path for path in paths if path in self._data]
+        if not paths:
+            return 0
+        count = 0
+        for path, sha1 in self._blobs(paths).iteritems():
+            for blob, mtime in self._data[path]:
+                if blob != sha1:
+                    continue
+                filename = os.path.join(self._git.work_tree, path)
+                try:
+                    st = os.lstat(filename)
+                    if stat.S_ISLNK(st.st_mode):
+                        break
+                    os.utime(filename, (st.st_atime, mtime))
+                except OSError:
+                    break
+                count += 1
+                break
+        if count:
+            self._git.cache.touch_worktree()
+        return count
@@ -0,0 +1,301 @@
+r"""
+Streaming Parsers for Git Output
+
+Git commands like ``diff --numstat -z`` or ``status -z`` can produce
+a lot of output. Instead of reading everything into one string and
+splitting it, the functions in this module work on an iterable of
+chunks as they are read from the pipe (see
+:meth:`GitInterface.execute_iter
+<sageui.model.git_interface.GitInterface.execute_iter>`) and yield
+typed records one at a time. Only the incomplete last record of each
+chunk is carried over to the next one, so memory usage is bounded by
+the largest record and not by the size of the whole output.
+
+EXAMPLES::
+
+    sage: from sageui.model.git_records import iter_records, parse_numstat
+    sage: chunks = ['1\t2\tfoo\0-\t-\tbin', 'ary\0', '3\t0\t\0old\0new\0']
+    sage: list(iter_records(chunks))
+    ['1\t2\tfoo', '-\t-\tbinary', '3\t0\t', 'old', 'new']
+    sage: for record in parse_numstat(iter_records(chunks)):
+    ....:     print record
+    NumstatRecord(added=1, deleted=2, path='foo', old_path=None)
+    NumstatRecord(added=None, deleted=None, path='binary', old_path=None)
+    NumstatRecord(added=3, deleted=0, path='new', old_path='old')
+
+Streaming from a git process::
+
+    sage: repo = test.git_repo()
+    sage: records = repo.git.execute_iter('ls-files', z=True)
+    sage: records
+    <generator object execute_iter at 0x...>
+    sage: list(records)
+    ['bar/foo6.txt', 'foo1.txt', 'foo2_moved.txt', 'foo3.txt', 'foo4.txt', 'foo5.txt', 'staged_file']
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import re
+from collections import namedtuple
+
+
+NumstatRecord = namedtuple('NumstatRecord', ['added', 'deleted', 'path', 'old_path'])
+NumstatRecord.binary = property(lambda self: self.added is None)
+
+StatusRecord = namedtuple('StatusRecord', ['staged', 'unstaged', 'path', 'old_path'])
+
+RevListRecord = namedtuple('RevListRecord', ['sha1', 'title'])
+
+ProgressRecord = namedtuple('ProgressRecord', ['phase', 'percent', 'current', 'total', 'done', 'text'])
+
+
+def iter_records(chunks, separator='\0'):
+    r"""
+    Split a stream of chunks into records
+
+    INPUT:
+
+    - ``chunks`` -- iterable of strings.
+
+    - ``separator`` -- string. The record terminator, usually
+      ``'\0'`` or ``'\n'``.
+
+    OUTPUT:
+
+    Generator yielding the records without the separator. A trailing
+    empty record (git often ends the output with two separators) is
+    not yielded.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_records import iter_records
+        sage: list(iter_records(['a\nb', 'c\n\n', 'd'], '\n'))
+        ['a', 'bc', '', 'd']
+    """
+    remainder = ''
+    for chunk in chunks:
+        if remainder:
+            chunk = remainder + chunk
+        start = 0
+        while True:
+            end = chunk.find(separator, start)
+            if end == -1:
+                break
+            yield chunk[start:end]
+            start = end + 1
+        remainder = chunk[start:]
+    if remainder:
+        yield remainder
+
+
+def _skip_empty(records):
+    for record in records:
+        if record == '':
+            continue
+        yield record
+
+
+def parse_numstat(records):
+    r"""
+    Parse the records of ``git diff --numstat -z``
+
+    OUTPUT:
+
+    Generator yielding :class:`NumstatRecord`. Binary files have
+    ``added`` and ``deleted`` set to ``None``.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_records import parse_numstat
+        sage: list(parse_numstat(['1\t1\tfoo', '']))
+        [NumstatRecord(added=1, deleted=1, path='foo', old_path=None)]
+    """
+    records = iter(records)
+    for record in records:
+        if record == '':
+            continue
+        added, deleted, path = record.split('\t', 2)
+        old_path = None
+        if path == '':
+            # rename/copy: the paths are in the following two records
+            old_path = next(records)
+            path = next(records)
+        if added == '-':
+            yield NumstatRecord(None, None, path, old_path)
+        else:
+            yield NumstatRecord(int(added), int(deleted), path, old_path)
+
+
+def parse_status(records):
+    r"""
+    Parse the records of ``git status --porcelain -z``
+
+    OUTPUT:
+
+    Generator yielding :class:`StatusRecord`. The ``staged`` and
+    ``unstaged`` fields are the single-letter status codes.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_records import parse_status
+        sage: list(parse_status([' M foo', 'R  new', 'old', '?? bar', '']))
+        [StatusRecord(staged=' ', unstaged='M', path='foo', old_path=None),
+         StatusRecord(staged='R', unstaged=' ', path='new', old_path='old'),
+         StatusRecord(staged='?', unstaged='?', path='bar', old_path=None)]
+    """
+    records = iter(records)
+    for record in records:
+        if record == '':
+            continue
+        staged, unstaged, path = record[0], record[1], record[3:]
+        old_path = None
+        if staged in 'RC':
+            old_path = next(records)
+        yield StatusRecord(staged, unstaged, path, old_path)
+
+
+def parse_ls_files(records):
+    r"""
+    Parse the records of ``git ls-files -z``
+
+    OUTPUT:
+
+    Generator yielding the file names.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_records import parse_ls_files
+        sage: list(parse_ls_files(['foo', 'bar/baz', '']))
+        ['foo', 'bar/baz']
+    """
+    return _skip_empty(records)
+
+
+def parse_rev_list(records):
+    r"""
+    Parse the lines of ``git rev-list`` with or without ``--format=oneline``
+
+    OUTPUT:
+
+    Generator yielding :class:`RevListRecord`. The title is ``None``
+    if the output contains only SHA-1s.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_records import parse_rev_list
+        sage: list(parse_rev_list(['a'*40 + ' title', 'b'*40]))
+        [RevListRecord(sha1='aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa', title='title'),
+         RevListRecord(sha1='bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb', title=None)]
+    """
+    for record in records:
+        if record == '':
+            continue
+        title = record[41:] if len(record) > 40 else None
+        yield RevListRecord(record[0:40], title)
+
+
+_PROGRESS_RE = re.compile(
+    r'^(?:remote: )?(?P<phase>[A-Za-z][A-Za-z ]*?):\s+'
+    r'(?:(?P<percent>\d+)% \((?P<current>\d+)/(?P<total>\d+)\)|(?P<count>\d+))')
+
+
+def parse_progress(line):
+    r"""
+    Parse a progress line that git writes to stderr with ``--progress``
+
+    OUTPUT:
+
+    A :class:`ProgressRecord` or ``None`` if the line is not a
+    progress line. The ``percent`` and ``total`` fields are ``None``
+    if git does not know how much work remains.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_records import parse_progress
+        sage: parse_progress('Receiving objects:  45% (450/1000), 1.20 MiB | 500.00 KiB/s')
+        ProgressRecord(phase='Receiving objects', percent=45, current=450, total=1000,
+                       done=False, text='Receiving objects:  45% (450/1000), 1.20 MiB | 500.00 KiB/s')
+        sage: parse_progress('remote: Counting objects: 1234, done.')
+        ProgressRecord(phase='Counting objects', percent=None, current=1234, total=None,
+                       done=True, text='remote: Counting objects: 1234, done.')
+        sage: parse_progress('From git://trac.sagemath.org/sage') is None
+        True
+    """
+    match = _PROGRESS_RE.match(line)
+    if match is None:
+        return None
+    text = line.strip()
+    done = text.endswith('done.')
+    if match.group('count') is not None:
+        return ProgressRecord(match.group('phase'), None, int(match.group('count')),
+                              None, done, text)
+    return ProgressRecord(match.group('phase'), int(match.group('percent')),
+                          int(match.group('current')), int(match.group('total')),
+                          done, text)
+
+
+class ProgressParser(object):
+    r"""
+    Incrementally parse the progress output of git
+
+    Git overwrites the current progress line with carriage returns,
+    so lines are terminated by either ``'\r'`` or ``'\n'``.
+
+    INPUT:
+
+    - ``callback`` -- function that is called with each
+      :class:`ProgressRecord`.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_records import ProgressParser
+        sage: records = []
+        sage: parser = ProgressParser(records.append)
+        sage: parser.feed('remote: Compressing objects:  50% (1/2)   \rremote: Compr')
+        sage: parser.feed('essing objects: 100% (2/2), done.\nFrom /path\n')
+        sage: [(r.phase, r.percent, r.done) for r in records]
+        [('Compressing objects', 50, False), ('Compressing objects', 100, True)]
+    """
+
+    def __init__(self, callback):
+        self._callback = callback
+        self._remainder = ''
+
+    def feed(self, data):
+        """
+        Parse a chunk of stderr output
+        """
+        lines = re.split('[\r\n]', self._remainder + data)
+        self._remainder = lines.pop()
+        for line in lines:
+            self._parse(line)
+
+    def close(self):
+        """
+        Parse the last line, if it was not terminated
+        """
+        if self._remainder:
+            self._parse(self._remainder)
+            self._remainder = ''
+
+    def _parse(self, line):
+        record = parse_progress(line)
+        if record is not None:
+            self._callback(record)
@@ -0,0 +1,407 @@
+r"""
+Reading Git References Without Git
+
+Looking up a branch or ``HEAD`` is a very frequent operation that
+does not need to fork git. References are stored either as loose
+files ``.git/refs/heads/...`` or in the ``.git/packed-refs`` file,
+which is sorted by reference name. The latter is memory-mapped and
+searched by bisection, so lookups are fast even with tens of
+thousands of references.
+
+Exotic repository layouts (for example the reftable backend) are not
+understood by :class:`GitRefReader`; in that case
+:class:`GitRefs` falls back to asking git.
+
+EXAMPLES::
+
+    sage: repo = test.new_git_repo()
+    sage: refs = repo.git.refs
+    sage: refs.symbolic_head()
+    'refs/heads/sageui/1002/public/anything'
+    sage: refs.resolve('refs/heads/master') == repo.master.commit.sha1
+    True
+    sage: refs.resolve('refs/heads/nonexisting') is None
+    True
+
+After packing, the references are found in ``packed-refs``::
+
+    sage: master = refs.resolve('refs/heads/master')
+    sage: repo.git.silent.pack_refs(all=True)
+    sage: import os
+    sage: os.path.exists(os.path.join(repo.git.git_dir, 'refs', 'heads', 'master'))
+    False
+    sage: refs.resolve('refs/heads/master') == master
+    True
+    sage: refs.resolve('refs/heads/sageui/1001/u/bob/work') == repo.git.rev_parse('sageui/1001/u/bob/work').strip()
+    True
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import re
+import mmap
+import threading
+
+from git_error import GitError, GitObjectMissingError
+
+
+_SHA1_RE = re.compile('^[0-9a-f]{40}$')
+
+# References that live in the per-worktree git directory even if
+# there is a common directory shared between worktrees
+_PER_WORKTREE_PREFIXES = ('refs/bisect/', 'refs/worktree/', 'refs/rewritten/')
+
+# Maximal depth of symbolic references
+_MAX_SYMREF_DEPTH = 5
+
+
+def is_sha1(value):
+    """
+    Whether ``value`` is a full (lower case) SHA-1
+
+    Results keyed by full SHA-1s never change, unlike those keyed by
+    reference names.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_refs import is_sha1
+        sage: is_sha1('0123456789abcdef0123456789abcdef01234567'), is_sha1('HEAD')
+        (True, False)
+    """
+    return _SHA1_RE.match(value) is not None
+
+
+class GitRefReader(object):
+    r"""
+    Parse ``HEAD``, loose references and ``packed-refs`` directly.
+
+    Methods raise ``NotImplementedError`` if the repository uses a
+    layout that is not understood.
+
+    INPUT:
+
+    - ``git_dir`` -- string. The ``.git`` directory, or a ``.git``
+      file pointing to it.
+
+    EXAMPLES::
+
+        sage: import os, tempfile
+        sage: from sageui.model.git_refs import GitRefReader
+        sage: git_dir = tempfile.mkdtemp()
+        sage: names = sorted('refs/heads/branch{0}'.format(i) for i in range(1000))
+        sage: with open(os.path.join(git_dir, 'packed-refs'), 'w') as f:
+        ....:     f.write('# pack-refs with: peeled fully-peeled sorted \n')
+        ....:     for i, name in enumerate(names):
+        ....:         f.write('{0:040x} {1}\n'.format(i, name))
+        ....:         if i % 7 == 0:
+        ....:             f.write('^{0:040x}\n'.format(i + 1000))
+        sage: reader = GitRefReader(git_dir)
+        sage: all(int(reader.resolve(name), 16) == i for i, name in enumerate(names))
+        True
+        sage: reader.resolve('refs/heads/branch') is None
+        True
+        sage: reader.resolve('refs/heads/zzz') is None
+        True
+    """
+
+    def __init__(self, git_dir):
+        if os.path.isfile(git_dir):
+            with open(git_dir, 'rb') as f:
+                gitfile = f.read().strip()
+            if not gitfile.startswith('gitdir: '):
+                raise ValueError('{0} is not a git file'.format(git_dir))
+            path = gitfile[len('gitdir: '):]
+            git_dir = os.path.normpath(os.path.join(os.path.dirname(git_dir), path))
+        self.git_dir = git_dir
+        commondir = os.path.join(git_dir, 'commondir')
+        if os.path.isfile(commondir):
+            with open(commondir, 'rb') as f:
+                path = f.read().strip()
+            self.common_dir = os.path.normpath(os.path.join(git_dir, path))
+        else:
+            self.common_dir = git_dir
+        self._lock = threading.Lock()
+        self._packed_stat = None
+        self._packed_map = None
+        self._packed_start = 0
+        self._packed_sorted = False
+        self._packed_dict = None
+
+    def _check_supported(self):
+        if os.path.isdir(os.path.join(self.common_dir, 'reftable')):
+            raise NotImplementedError('reftable backend')
+
+    def _ref_dir(self, refname):
+        if refname == 'HEAD' or refname.startswith(_PER_WORKTREE_PREFIXES):
+            return self.git_dir
+        return self.common_dir
+
+    def _read_loose(self, refname):
+        """
+        Return the contents of a loose ref file or ``None``
+        """
+        path = os.path.join(self._ref_dir(refname), *refname.split('/'))
+        try:
+            with open(path, 'rb') as f:
+                return f.read().strip()
+        except IOError:
+            # does not exist or is a directory
+            return None
+
+    def symbolic_head(self):
+        """
+        Return the reference that ``HEAD`` points to
+
+        OUTPUT:
+
+        String like ``'refs/heads/master'``, or ``None`` if the
+        ``HEAD`` is detached.
+        """
+        self._check_supported()
+        head = self._read_loose('HEAD')
+        if head is None:
+            raise NotImplementedError('HEAD is missing')
+        if head.startswith('ref: '):
+            return head[len('ref: '):].strip()
+        if _SHA1_RE.match(head):
+            return None
+        raise NotImplementedError('cannot parse HEAD')
+
+    def resolve(self, refname):
+        """
+        Return the SHA-1 that the reference points to
+
+        INPUT:
+
+        - ``refname`` -- string. A full reference name like
+          ``'refs/heads/master'`` or ``'HEAD'``.
+
+        OUTPUT:
+
+        String (the SHA-1) or ``None`` if there is no such reference.
+        """
+        self._check_supported()
+        for depth in range(_MAX_SYMREF_DEPTH):
+            value = self._read_loose(refname)
+            if value is None:
+                return self._lookup_packed(refname)
+            if value.startswith('ref: '):
+                refname = value[len('ref: '):].strip()
+                continue
+            if _SHA1_RE.match(value):
+                return value
+            raise NotImplementedError('cannot parse reference ' + refname)
+        raise NotImplementedError('symbolic reference nested too deeply')
+
+    def fingerprint(self):
+        """
+        Return a value that changes whenever any reference changes
+
+        Git updates references by renaming a lock file, so it is
+        enough to look at the modification times of the directories
+        containing loose references and of ``packed-refs``.
+
+        EXAMPLES::
+
+            sage: repo = test.new_git_repo()
+            sage: reader = repo.git.refs._reader
+            sage: before = reader.fingerprint()
+            sage: before == reader.fingerprint()
+            True
+            sage: repo.git.silent.branch('new_branch')
+            sage: before == reader.fingerprint()
+            False
+        """
+        self._check_supported()
+        result = [self._read_loose('HEAD')]
+        directories = [self.common_dir]
+        if self.git_dir != self.common_dir:
+            directories.append(self.git_dir)
+        for directory in directories:
+            try:
+                result.append(os.stat(os.path.join(directory, 'packed-refs')).st_mtime)
+            except OSError:
+                result.append(None)
+            mtimes = []
+            for dirpath, dirnames, filenames in os.walk(os.path.join(directory, 'refs')):
+                mtimes.append(os.stat(dirpath).st_mtime)
+            result.append(len(mtimes))
+            result.append(max(mtimes) if mtimes else None)
+        return tuple(result)
+
+    def _update_packed(self):
+        """
+        (Re-)map ``packed-refs`` if it changed on disk
+        """
+        path = os.path.join(self.common_dir, 'packed-refs')
+        try:
+            st = os.stat(path)
+            key = (st.st_ino, st.st_size, st.st_mtime)
+        except OSError:
+            key = None
+        if key == self._packed_stat:
+            return
+        if self._packed_map is not None:
+            self._packed_map.close()
+        self._packed_stat = key
+        self._packed_map = None
+        self._packed_dict = None
+        self._packed_start = 0
+        self._packed_sorted = False
+        if key is None or st.st_size == 0:
+            return
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._packed_map = data
+        if data[0:1] == '#':
+            end = data.find('\n')
+            header = data[0:end]
+            self._packed_start = end + 1
+            traits = header.split(':', 1)[-1].split()
+            self._packed_sorted = ('sorted' in traits)
+
+    def _lookup_packed(self, refname):
+        with self._lock:
+            self._update_packed()
+            data = self._packed_map
+            if data is None:
+                return None
+            if self._packed_sorted:
+                return self._bisect_packed(data, refname)
+            if self._packed_dict is None:
+                self._packed_dict = self._parse_packed(data)
+            return self._packed_dict.get(refname)
+
+    def _parse_packed(self, data):
+        result = dict()
+        for line in data[self._packed_start:].splitlines():
+            if line.startswith('^') or line.startswith('#') or len(line) < 42:
+                continue
+            result[line[41:]] = line[0:40]
+        return result
+
+    def _bisect_packed(self, data, refname):
+        lo = self._packed_start
+        hi = len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind('\n', lo, mid) + 1
+            if start == 0:
+                start = lo
+            if data[start] == '^':
+                # peeled line, back up to the ref that it belongs to
+                start = data.rfind('\n', lo, start - 1) + 1
+                if start == 0:
+                    start = lo
+            end = data.find('\n', start)
+            if end == -1:
+                end = len(data)
+            name = data[start+41:end]
+            if name == refname:
+                return data[start:start+40]
+            elif name < refname:
+                lo = end + 1
+                if lo < hi and data[lo] == '^':
+                    lo = data.find('\n', lo) + 1 or hi
+            else:
+                hi = start
+        return None
+
+
+class GitRefs(object):
+    """
+    Resolve references, falling back to git if necessary
+
+    You should not construct this yourself, use
+    :attr:`GitInterface.refs
+    <sageui.model.git_interface.GitInterface.refs>`.
+    """
+
+    def __init__(self, git):
+        self._git = git
+        self._reader = GitRefReader(git.git_dir)
+
+    @property
+    def git_dir(self):
+        """
+        The (per-worktree) git directory
+        """
+        return self._reader.git_dir
+
+    @property
+    def common_dir(self):
+        """
+        The git directory that is shared between all worktrees
+        """
+        return self._reader.common_dir
+
+    def fingerprint(self):
+        """
+        Return a value that changes whenever any reference changes
+
+        Raises ``NotImplementedError`` if the repository layout is not
+        understood. See :meth:`GitRefReader.fingerprint`.
+        """
+        return self._reader.fingerprint()
+
+    def symbolic_head(self):
+        """
+        Return the reference that ``HEAD`` points to or ``None`` if detached
+        """
+        result = self._symbolic_head()
+        self._git._record('refs', ['symbolic_head'], result)
+        return result
+
+    def _symbolic_head(self):
+        try:
+            return self._reader.symbolic_head()
+        except NotImplementedError:
+            pass
+        try:
+            return self._git.symbolic_ref('HEAD', quiet=True).strip()
+        except GitError as e:
+            if e.exit_code == 1:
+                return None
+            raise
+
+    def resolve(self, refname):
+        """
+        Return the SHA-1 of a reference or ``None`` if it does not exist
+        """
+        result = self._resolve(refname)
+        self._git._record('refs', ['resolve', refname], result)
+        return result
+
+    def _resolve(self, refname):
+        try:
+            return self._reader.resolve(refname)
+        except NotImplementedError:
+            pass
+        try:
+            return self._git.objects.sha1(refname)
+        except GitObjectMissingError:
+            return None
+
+    def exists(self, refname):
+        """
+        Whether the reference exists
+        """
+        return self.resolve(refname) is not None
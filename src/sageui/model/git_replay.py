@@ -0,0 +1,369 @@
+r"""
+Recording and Replaying Git
+
+To benchmark or regression-test the model layer without being
+dominated by the cost of starting git, you can record all
+interactions with git into a file and later replay them without
+running any subprocess. Recorded are
+
+* the command lines and outputs of all git commands,
+
+* the requests to the ``git cat-file`` coprocesses (see
+  :mod:`~sageui.model.git_cat_file`),
+
+* the lookups of references (see :mod:`~sageui.model.git_refs`).
+
+The recording is a text file with one JSON object per line. When
+replaying, the responses for each request are returned in the order
+in which they were recorded. If a request is repeated more often than
+it was recorded, the last response is returned again.
+
+EXAMPLES::
+
+    sage: import os, tempfile
+    sage: repo = test.new_git_repo()
+    sage: filename = os.path.join(tempfile.mkdtemp(), 'recording.json')
+    sage: repo.git.start_recording(filename)
+    sage: branch = repo.current_branch()
+    sage: history = branch.commit.get_history()
+    sage: message = branch.commit.get_message()
+    sage: changes = repo.changes()
+    sage: repo.git.stop_recording()
+
+Now replay the recording::
+
+    sage: from sageui.model.git_replay import GitReplayInterface
+    sage: git = GitReplayInterface(filename)
+    sage: git
+    Replay of git repo at /.../git_repo
+    sage: git.git_cmd == repo.git.git_cmd
+    True
+    sage: replay = git.repository()
+    sage: replay.current_branch() == branch
+    True
+    sage: replay.current_branch().commit.get_history() == history
+    True
+    sage: replay.current_branch().commit.get_message() == message
+    True
+    sage: str(replay.changes()) == str(changes)
+    True
+
+Requests that were not recorded raise an error::
+
+    sage: git.log('master')
+    Traceback (most recent call last):
+    ...
+    GitReplayMissingError: 'no recording of run git log master'
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import sys
+import json
+import threading
+import subprocess
+
+from sageui.misc.cached_property import cached_property
+
+from git_error import GitError, GitObjectMissingError, GitReplayMissingError
+from git_interface import GitInterface
+from git_cat_file import GitObjectServer
+
+
+def _encode(value):
+    r"""
+    Convert byte strings to unicode so that any output survives JSON
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_replay import _encode, _decode
+        sage: value = ['\xff\x00', ('a', 1, None)]
+        sage: _decode(_encode(value))
+        ['\xff\x00', ['a', 1, None]]
+    """
+    if isinstance(value, str):
+        return value.decode('latin-1')
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _request_key(channel, request):
+    return json.dumps([channel, _encode(request)])
+
+
+class GitRecorder(object):
+    """
+    Write git interactions to a file
+
+    You should not construct this yourself, use
+    :meth:`GitInterface.start_recording
+    <sageui.model.git_interface.GitInterface.start_recording>`.
+
+    INPUT:
+
+    - ``git`` -- the :class:`~sageui.model.git_interface.GitInterface`.
+
+    - ``filename`` -- string. The output file, will be overwritten.
+    """
+
+    def __init__(self, git, filename):
+        self._lock = threading.Lock()
+        self._file = open(filename, 'w')
+        self._write({'work_tree': git.work_tree, 'git_dir': git.git_dir,
+                     'git_cmd': git.git_cmd})
+
+    def _write(self, obj):
+        self._file.write(json.dumps(obj) + '\n')
+
+    def record(self, channel, request, response):
+        """
+        Record a single interaction
+
+        INPUT:
+
+        - ``channel`` -- string. One of ``'run'`` (a git command),
+          ``'cat-file'``, or ``'refs'``.
+
+        - ``request`` -- list of strings.
+
+        - ``response`` -- anything made of strings, integers, lists,
+          tuples, and ``None``.
+        """
+        with self._lock:
+            self._write({'channel': channel,
+                         'request': _encode(request),
+                         'response': _encode(response)})
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class GitReplay(object):
+    """
+    The responses read from a recording
+
+    INPUT:
+
+    - ``filename`` -- string. A file written by :class:`GitRecorder`.
+    """
+
+    def __init__(self, filename):
+        self._lock = threading.Lock()
+        self._responses = dict()
+        self._position = dict()
+        with open(filename, 'r') as f:
+            header = json.loads(f.readline())
+            self.work_tree = _decode(header['work_tree'])
+            self.git_dir = _decode(header['git_dir'])
+            self.git_cmd = _decode(header.get('git_cmd', u'git'))
+            for line in f:
+                obj = json.loads(line)
+                key = json.dumps([obj['channel'], obj['request']])
+                self._responses.setdefault(key, []).append(_decode(obj['response']))
+
+    def response(self, channel, request):
+        """
+        Return the next recorded response
+
+        INPUT:
+
+        - ``channel``, ``request`` -- see :meth:`GitRecorder.record`.
+        """
+        key = _request_key(channel, request)
+        with self._lock:
+            try:
+                responses = self._responses[key]
+            except KeyError:
+                raise GitReplayMissingError(
+                    'no recording of {0} {1}'.format(channel, ' '.join(map(str, request))))
+            n = self._position.get(key, 0)
+            self._position[key] = n + 1
+            return responses[min(n, len(responses) - 1)]
+
+    def rewind(self):
+        """
+        Start again with the first recorded response for each request
+        """
+        with self._lock:
+            self._position.clear()
+
+
+class GitReplayCatFile(object):
+    """
+    Stand-in for :class:`~sageui.model.git_cat_file.GitCatFileProcess`
+    """
+
+    def __init__(self, replay, batch_option):
+        self._replay = replay
+        self._batch_option = batch_option
+
+    def close(self):
+        pass
+
+    def request(self, revision):
+        result = self._replay.response('cat-file', [self._batch_option, revision])
+        if result is None:
+            raise GitObjectMissingError(revision)
+        return tuple(result)
+
+
+class GitReplayObjectServer(GitObjectServer):
+    """
+    Serve git objects from a recording
+    """
+
+    def __init__(self, replay):
+        self._batch = GitReplayCatFile(replay, '--batch')
+        self._batch_check = GitReplayCatFile(replay, '--batch-check')
+
+
+class GitReplayRefs(object):
+    """
+    Resolve references from a recording
+    """
+
+    def __init__(self, replay):
+        self._replay = replay
+        self.git_dir = self.common_dir = replay.git_dir
+
+    def fingerprint(self):
+        raise NotImplementedError('the repository state is not recorded')
+
+    def symbolic_head(self):
+        return self._replay.response('refs', ['symbolic_head'])
+
+    def resolve(self, refname):
+        return self._replay.response('refs', ['resolve', refname])
+
+    def exists(self, refname):
+        return self.resolve(refname) is not None
+
+
+class GitReplayInterface(GitInterface):
+    """
+    A git interface that replays a recording instead of running git
+
+    No subprocess is ever started. Since the repository state is not
+    known, the result cache (see :mod:`~sageui.model.git_cache`) is
+    not used. The recorded work tree must still exist.
+
+    INPUT:
+
+    - ``filename`` -- string. A recording made with
+      :meth:`~sageui.model.git_interface.GitInterface.start_recording`.
+
+    - ``verbose`` -- boolean (default: ``False``).
+    """
+
+    def __init__(self, filename, verbose=False):
+        replay = self._replay = GitReplay(filename)
+        GitInterface.__init__(self, replay.work_tree, verbose,
+                              git_dir=replay.git_dir, git_cmd=replay.git_cmd)
+        # the check was already done while recording
+        self._user_email_set = True
+
+    def __repr__(self):
+        return 'Replay of git repo at ' + self.work_tree
+
+    def repository(self):
+        """
+        Return a :class:`~sageui.model.git_repository.GitRepository`
+        that uses this interface
+        """
+        from git_repository import GitRepository
+        repo = GitRepository(self.work_tree, verbose=self._verbose)
+        repo.git = self
+        return repo
+
+    def rewind(self):
+        """
+        Replay the recording again from the start
+        """
+        self._replay.rewind()
+
+    @cached_property
+    def objects(self):
+        return GitReplayObjectServer(self._replay)
+
+    @cached_property
+    def refs(self):
+        return GitReplayRefs(self._replay)
+
+    def start_recording(self, filename):
+        raise ValueError('cannot record a replay')
+
+    def _replay_run(self, s):
+        self._log('cmd', ' '.join(s))
+        exit_code, stdout, stderr = self._replay.response('run', s)
+        return exit_code, stdout, stderr
+
+    def _run_unsafe(self, cmd, args, kwds={}, popen_stdout=None, popen_stderr=None):
+        s = self._command_line(cmd, args, kwds)
+        exit_code, stdout, stderr = self._replay_run(s)
+        if popen_stdout is subprocess.PIPE:
+            self._log('stdout', stdout)
+        else:
+            sys.stdout.write(stdout)
+            stdout = None
+        if popen_stderr is subprocess.PIPE:
+            self._log('stderr', stderr)
+        else:
+            sys.stderr.write(stderr)
+            stderr = None
+        return {'exit_code':exit_code, 'stdout':stdout, 'stderr':stderr, 'cmd':' '.join(s)}
+
+    def execute_iter(self, cmd, *args, **kwds):
+        from git_records import iter_records
+        if not self._is_safe(cmd):
+            self._check_user_email()
+        separator = '\0' if kwds.get('z', False) else '\n'
+        s = self._command_line(cmd, args, kwds)
+        exit_code, stdout, stderr = self._replay_run(s)
+        for record in iter_records([stdout], separator):
+            yield record
+        if exit_code:
+            raise GitError({'exit_code':exit_code, 'stdout':'', 'stderr':stderr,
+                            'cmd':' '.join(s)})
+
+    def run_async(self, cmd, args=(), kwds={}, progress=None, timeout=None):
+        from git_async import GitDeferred
+        if not self._is_safe(cmd):
+            self._check_user_email()
+        if progress is not None and cmd in self._network_commands:
+            kwds = dict(kwds, progress=True)
+        s = self._command_line(cmd, args, kwds)
+        exit_code, stdout, stderr = self._replay_run(s)
+        d = GitDeferred()
+        if exit_code:
+            d.errback(GitError({'exit_code':exit_code, 'stdout':stdout, 'stderr':stderr,
+                                'cmd':' '.join(s)}))
+        else:
+            d.callback(stdout)
+        return d
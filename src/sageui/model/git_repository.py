@@ -27,23 +27,38 @@ The managed branches are all named `sageui/1234/u/user/description`.
 ##############################################################################
 
 
+import os
 import logging
+from collections import namedtuple
 
 from git_commit import GitCommit
-from git_error import GitError, DetachedHeadException
+from git_error import DetachedHeadException
 from git_branch import GitBranch, GitLocalBranch, GitManagedBranch
-from git_interface import GitInterface
+from git_interface import GitInterface, GitQuery
+from git_changes import GitChanges
+from git_branch_snapshot import BranchSnapshot, BRANCH_SNAPSHOT_QUERY
+from git_refs import is_sha1
+from git_records import iter_records, parse_numstat, parse_status
 from git_file import GitFileDiff, GitFileCommitted, GitFileStaged, GitFileUnstaged, GitFileUntracked
-from sageui.misc.cached_property import cached_property
+from sageui.misc.cached_property import cached_property, dependent_cached_property, Generations
 
 
+GitOverview = namedtuple('GitOverview', ['branches', 'current_branch', 'history', 'changes'])
+
 
 class GitRepository(object):
 
-    def __init__(self, repo_path, verbose=False):
+    def __init__(self, repo_path, verbose=False, cache_dir=None):
         self.repo_path = repo_path
         self._verbose = verbose
+        self._cache_dir = cache_dir
         self._base_commit = None
+        self._watcher = None
+        self.generations = Generations()
+        self._branch_snapshot = None
+        self._commit_graph = None
+        self._commit_graph_fingerprint = None
+        self._changes = GitChanges(self)
 
     @property
     def prefix(self):
@@ -63,6 +78,77 @@ class GitRepository(object):
     def git(self):
         return GitInterface(self.repo_path, verbose=self._verbose)
 
+    @cached_property
+    def commits(self):
+        """
+        The :class:`~sageui.model.git_commit.GitCommitTable` that interns all commits
+        """
+        from git_commit import GitCommitTable
+        return GitCommitTable(self)
+
+    @cached_property
+    def persistent_cache(self):
+        """
+        The on-disk cache for results that only depend on SHA-1s
+
+        Commit messages, diffs, and history pages between fixed
+        commits never change, so they are kept across sessions in
+        the ``cache_dir`` passed to the constructor.
+
+        OUTPUT:
+
+        A :class:`~sageui.misc.lru_cache.PersistentLRUCache`, or
+        ``None`` if no ``cache_dir`` was given.
+
+        EXAMPLES::
+
+            sage: import tempfile
+            sage: cache_dir = tempfile.mkdtemp()
+            sage: repo = test.git_repo()
+            sage: repo = GitRepository(repo.repo_path, cache_dir=cache_dir)
+            sage: history = repo.head.get_history()
+            sage: files = repo.diff_index(history[-1], history[0])
+            sage: diff = files[0].diff()
+            sage: message = history[1].get_message()
+
+        A new session reads them from disk instead of running git::
+
+            sage: repo = GitRepository(repo.repo_path, cache_dir=cache_dir)
+            sage: repo.git.statistics.clear()
+            sage: repo.diff_index(history[-1], history[0]) == files
+            True
+            sage: files[0].diff() == diff
+            True
+            sage: repo.head.get_history()[1].get_message() == message
+            True
+            sage: sorted(repo.git.statistics.histograms())
+            ['rev-list']
+            sage: repo.persistent_cache.disk_hits
+            3
+        """
+        if self._cache_dir is None:
+            return None
+        from sageui.misc.lru_cache import PersistentLRUCache, WeightedLRUCache
+        from diagnostics import diagnostics
+        cache = PersistentLRUCache(None, self._cache_dir, memory=WeightedLRUCache(8 * 2**20))
+        return diagnostics.register('persistent cache', cache)
+
+    @cached_property
+    def diffs(self):
+        """
+        The :class:`~sageui.model.git_diff_cache.GitDiffCache` for the diffs of single files
+        """
+        from git_diff_cache import GitDiffCache
+        return GitDiffCache(self.git, persistent=self.persistent_cache)
+
+    @cached_property
+    def worktrees(self):
+        """
+        The :class:`~sageui.model.git_worktree.GitWorktreeManager` for this repository
+        """
+        from git_worktree import GitWorktreeManager
+        return GitWorktreeManager(self)
+
     @property
     def master(self):
         return GitLocalBranch(self, 'master')
@@ -71,10 +157,159 @@ class GitRepository(object):
     def build_system(self):
         return GitLocalBranch(self, 'build_system')
     
-    @property
+    def generation(self, dependency):
+        """
+        Return a token that changes whenever ``dependency`` changes
+
+        This is used by the
+        :class:`~sageui.misc.cached_property.dependent_cached_property`
+        of the repository. Git commands that are not read-only change
+        all tokens. Changes by other programs are only noticed while
+        the repository is watched (see :meth:`watch`), otherwise the
+        values depending on the references or the index are not
+        cached at all.
+
+        INPUT:
+
+        - ``dependency`` -- string. One of ``'refs'`` (the branches
+          and ``HEAD``), ``'index'``, ``'worktree'``, or ``'config'``.
+
+        OUTPUT:
+
+        A token that can be compared with ``==``.
+
+        EXAMPLES::
+
+            sage: repo = test.new_git_repo()
+            sage: repo.generation('refs') == repo.generation('refs')
+            False
+            sage: watcher = repo.watch(None)
+            sage: token = repo.generation('refs')
+            sage: token == repo.generation('refs')
+            True
+            sage: repo.generations.bump('index')
+            sage: token == repo.generation('refs')
+            True
+            sage: repo.generations.bump('refs')
+            sage: token == repo.generation('refs')
+            False
+
+        Hence :attr:`head` is only looked up again after a change::
+
+            sage: head = repo.head
+            sage: repo.head is head
+            True
+            sage: repo.git.silent.stash()
+            sage: repo.git.silent.commit(allow_empty=True, message='new commit')
+            sage: repo.head == head
+            False
+            sage: repo.unwatch()
+        """
+        token = (self.generations[dependency], self.git.cache.mutation_generation)
+        if dependency == 'config':
+            try:
+                return token + (os.stat(os.path.join(self.git.refs.common_dir, 'config')).st_mtime,)
+            except OSError:
+                return object()
+        if self._watcher is None:
+            return object()
+        return token
+
+    def _on_change(self, event):
+        """
+        Bump the generations that a watcher event invalidates
+        """
+        if event.refs or event.head:
+            self.generations.bump('refs')
+        if event.index:
+            self.generations.bump('index')
+        if event.paths:
+            self.generations.bump('worktree')
+
+    @dependent_cached_property('refs')
     def head(self):
-        head = self.git.show_ref('HEAD', head=True)
-        return GitCommit(self, head[0:40])
+        """
+        The commit that is checked out
+
+        Cached while the references do not change, see :meth:`generation`.
+        """
+        sha1 = self.git.refs.resolve('HEAD')
+        if sha1 is None:
+            sha1 = self.git.objects.sha1('HEAD')
+        return GitCommit(self, sha1)
+
+    @dependent_cached_property('refs')
+    def _symbolic_head(self):
+        return self.git.refs.symbolic_head()
+
+    @dependent_cached_property('config')
+    def _log_settings(self):
+        """
+        The settings that change the output of ``git log``
+
+        Part of the key of the log entries in the :attr:`persistent_cache`.
+        """
+        prefixes = ('log.', 'mailmap.', 'i18n.', 'core.abbrev', 'color.')
+        settings = tuple(line for line in self.git.config('--list').splitlines()
+                         if line.lower().startswith(prefixes))
+        try:
+            mailmap = os.stat(os.path.join(self.git.work_tree, '.mailmap')).st_mtime
+        except OSError:
+            mailmap = None
+        return settings, mailmap
+
+    def close(self):
+        """
+        Release the resources (git coprocesses) held by the repository
+        """
+        self.unwatch()
+        if 'git' in self.__dict__:
+            self.git.close()
+
+    def watch(self, callback):
+        """
+        Watch the repository for changes
+
+        INPUT:
+
+        - ``callback`` -- function. Called from the main loop with a
+          :class:`~sageui.model.git_watcher.GitWatcherEvent` whenever
+          the repository changed.
+
+        OUTPUT:
+
+        The :class:`~sageui.model.git_watcher.GitWatcher`. Any
+        previous watcher is stopped.
+
+        EXAMPLES::
+
+            sage: repo = test.new_git_repo()
+            sage: watcher = repo.watch(None)
+            sage: repo.git.silent.branch('new_branch')
+            sage: watcher.check().refs
+            True
+            sage: repo.unwatch()
+        """
+        from git_watcher import GitWatcher
+        self.unwatch()
+
+        def on_change(event):
+            self._on_change(event)
+            if callback is not None:
+                callback(event)
+        # nothing that was cached before is known to be current
+        self.generations.bump()
+        self._watcher = GitWatcher(self.git, on_change)
+        self._watcher.start()
+        return self._watcher
+
+    def unwatch(self):
+        """
+        Stop watching the repository, see :meth:`watch`
+        """
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
 
     @property
     def base_commit(self):
@@ -116,21 +351,108 @@ class GitRepository(object):
             sage: repo = test.git_repo()
             sage: repo.untracked_files()
             [untracked:untracked_file]
+
+        Untracked directories are listed as a whole, see
+        :mod:`~sageui.model.git_untracked`.
+        """
+        return [GitFileUntracked(self, name) for name in self._untracked.scan()]
+
+    @cached_property
+    def _untracked(self):
+        from git_untracked import GitUntrackedScanner
+        return GitUntrackedScanner(self.git)
+
+    def scan_untracked_async(self, callback):
+        """
+        Add the untracked files to the :meth:`changes` without blocking
+
+        Use this after :meth:`changes` or :meth:`changes_async` with
+        ``untracked=False``.
+
+        INPUT:
+
+        - ``callback`` -- function. Called with a
+          :class:`~sageui.model.git_changes.GitChangesDelta` whenever
+          untracked files are found.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred` that will be
+        called back with the list of untracked files when all have
+        been found.
+
+        EXAMPLES::
+
+            sage: repo = test.new_git_repo()
+            sage: repo.changes(untracked=False)
+            [unstaged:+1-0:foo4.txt, staged:+0-0:staged_file]
+            sage: d = repo.scan_untracked_async(lambda delta: delta)
+            sage: d.wait()
+            [untracked:untracked_file]
+            sage: repo.changes(untracked=False)
+            [unstaged:+1-0:foo4.txt, staged:+0-0:staged_file, untracked:untracked_file]
+        """
+        def found(directories, names):
+            callback(self._changes.update_untracked(directories, names))
+        d = self._untracked.scan_async(found)
+        return d.add_callback(lambda names: [GitFileUntracked(self, name) for name in names])
+
+    def _new_branch(self, branch_name, ticket_number=None):
+        """
+        Return the local branch for a branch name on trac
+        """
+        if '/' in branch_name:
+            return GitManagedBranch(self, branch_name, ticket_number)
+        else:
+            return GitLocalBranch(self, branch_name)
+
+    @cached_property
+    def mtimes(self):
         """
-        log = self.git.ls_files(others=True, exclude_standard=True, z=True)
-        result = []
-        for line in log.split('\0'):
-            if line == '':  # two nulls is the end marker
-                break
-            result.append(GitFileUntracked(self, line))
-        return result
+        The :class:`~sageui.model.git_mtime.GitMtimeCache` of the work tree
+        """
+        from git_mtime import GitMtimeCache
+        return GitMtimeCache(self.git)
 
-    def checkout_branch(self, branch_name, ticket_number=None):
+    def _record_mtimes(self, name):
+        """
+        Record the modification times of the files that differ from branch ``name``
+
+        OUTPUT:
+
+        The list of paths that the checkout of ``name`` will write.
+        """
+        output = self.git.diff('HEAD', 'refs/heads/'+name, name_only=True, no_renames=True, z=True)
+        paths = [path for path in output.split('\0') if path]
+        self.mtimes.record(paths)
+        return paths
+
+    def _restore_mtimes(self, paths):
+        if self.mtimes.restore(paths):
+            logging.debug('restored %s modification times', len(paths))
+        self.mtimes.save()
+
+    def checkout_branch(self, branch_name, ticket_number=None, timeout=None,
+                        preserve_mtimes=False):
         """
         Check out branch.
 
         This modifies the git working tree.
 
+        INPUT:
+
+        - ``branch_name`` -- string. The branch name.
+
+        - ``ticket_number`` -- integer or ``None`` (default).
+
+        - ``timeout`` -- number or ``None`` (default). The maximal
+          number of seconds for downloading the branch.
+
+        - ``preserve_mtimes`` -- boolean (default: ``False``). Whether
+          to give files whose content was checked out before their
+          old modification time back, see
+          :mod:`~sageui.model.git_mtime`.
+
         EXAMPLES::
 
             sage: repo = test.new_git_repo();  repo.git.silent.stash()
@@ -141,19 +463,150 @@ class GitRepository(object):
             sage: _ == repo.current_branch()
             True
         """
-        if '/' in branch_name:
-            branch = GitManagedBranch(self, branch_name, ticket_number)
-        else:
-            branch = GitLocalBranch(self, branch_name)
+        branch = self._new_branch(branch_name, ticket_number)
         name = branch.full_branch_name
-        if self.git.exit_code.show_ref(name) != 0:
+        if not self.git.refs.exists('refs/heads/'+name):
             logging.debug('downloading branch %s', name)
-            self.git.fetch('trac', branch_name)
+            self.git.run_async('fetch', ('trac', branch_name), timeout=timeout).wait()
             self.git.branch(name, 'FETCH_HEAD')
+        if preserve_mtimes:
+            paths = self._record_mtimes(name)
         self.git.checkout(name)
+        if preserve_mtimes:
+            self._restore_mtimes(paths)
         self._base_commit = None
         return branch
 
+    def checkout_branch_async(self, branch_name, ticket_number=None, progress=None, timeout=None,
+                              preserve_mtimes=False):
+        """
+        Like :meth:`checkout_branch` but without blocking
+
+        INPUT:
+
+        - ``branch_name``, ``ticket_number``, ``timeout``,
+          ``preserve_mtimes`` -- see :meth:`checkout_branch`.
+
+        - ``progress`` -- function or ``None`` (default). Called with
+          the :class:`~sageui.model.git_records.ProgressRecord` while
+          the branch is being downloaded.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred` that will be
+        called back with the checked-out branch. Cancelling it stops
+        the download.
+
+        EXAMPLES::
+
+            sage: repo = test.new_git_repo();  repo.git.silent.stash()
+            sage: repo.checkout_branch_async('my_branch').wait()
+            Git branch my_branch
+            sage: repo.current_branch()
+            Git branch my_branch
+        """
+        branch = self._new_branch(branch_name, ticket_number)
+        name = branch.full_branch_name
+        git = self.git
+        paths = []
+        def checkout(_):
+            if preserve_mtimes:
+                paths.extend(self._record_mtimes(name))
+            return git.execute_async('checkout', name)
+        def finished(_):
+            if preserve_mtimes:
+                self._restore_mtimes(paths)
+            self._base_commit = None
+            return branch
+        if git.refs.exists('refs/heads/'+name):
+            d = checkout(None)
+        else:
+            logging.debug('downloading branch %s', name)
+            d = git.run_async('fetch', ('trac', branch_name), progress=progress, timeout=timeout)
+            d.add_callback(lambda _: git.execute_async('branch', name, 'FETCH_HEAD'))
+            d.add_callback(checkout)
+        return d.add_callback(finished)
+
+    def rebuild_estimate(self, commit, build_times=None):
+        """
+        Estimate the rebuild after checking out ``commit``
+
+        Only the committed files are compared, local modifications
+        are ignored.
+
+        INPUT:
+
+        - ``commit`` -- a :class:`~sageui.model.git_commit.GitCommit`.
+
+        - ``build_times`` -- a
+          :class:`~sageui.model.rebuild_estimate.BuildTimes` or
+          ``None`` (default).
+
+        OUTPUT:
+
+        A :class:`~sageui.model.rebuild_estimate.RebuildEstimate`.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: repo.rebuild_estimate(repo.master.commit).summary()
+            'No rebuild needed'
+        """
+        return self.rebuild_estimate_async(commit, build_times).wait()
+
+    def rebuild_estimate_async(self, commit, build_times=None):
+        """
+        Estimate the rebuild without blocking
+
+        See :meth:`rebuild_estimate`.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred` that will be
+        called back with the
+        :class:`~sageui.model.rebuild_estimate.RebuildEstimate`.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: d = repo.rebuild_estimate_async(repo.master.commit)
+            sage: d.wait().requires_compilation
+            False
+        """
+        from rebuild_estimate import RebuildEstimate
+        paths = []
+        def diffed(output):
+            paths.extend(path for path in output.split('\0') if path)
+            return self._cython_dependencies_async(commit)
+        d = self.git.execute_async('diff', self.head.sha1, commit.sha1, name_only=True, z=True)
+        d.add_callback(diffed)
+        return d.add_callback(
+            lambda dependencies: RebuildEstimate(commit, paths, dependencies, build_times))
+
+    def _cython_dependencies_async(self, commit):
+        """
+        Find the dependencies between the Cython sources at ``commit``
+
+        They only depend on the commit, so they are kept in the
+        :attr:`persistent_cache`.
+        """
+        from git_async import GitDeferred
+        from rebuild_estimate import cython_dependencies_async
+        cache = self.persistent_cache
+        key = ('cython_dependencies', commit.sha1)
+        result = None if cache is None else cache.get(key)
+        if result is not None:
+            d = GitDeferred()
+            d.callback(result)
+            return d
+        d = cython_dependencies_async(self.git, commit)
+        if cache is not None:
+            def store(dependencies):
+                cache.put(key, dependencies)
+                return dependencies
+            d.add_callback(store)
+        return d
+
     def local_branches(self):
         """
         Return the list of local branches
@@ -166,16 +619,164 @@ class GitRepository(object):
             sage: repo.local_branches()
             [Git branch master, Git branch my_branch, Git branch sageui/1000/u/user/description, Git branch sageui/1001/u/alice/work, Git branch sageui/1001/u/bob/work, Git branch sageui/1002/public/anything, Git branch sageui/none/u/user/description]
         """
-        branches = self.git.for_each_ref(
-            'refs/heads/', sort='committerdate', format="%(objectname) %(refname:short)")
-        result = []
-        for line in branches.splitlines():
-            sha1 = line[0:40]
-            name = line[41:]
-            branch = GitBranch(self, name, sha1)
-            if branch:
-                result.append(branch)
-        return result
+        return self.branch_snapshot().branches()
+
+    def branch_snapshot(self):
+        """
+        Return the snapshot of all local branches
+
+        The snapshot is only reloaded if the references changed.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_branch_snapshot.BranchSnapshot`.
+        """
+        fingerprint = self._refs_fingerprint()
+        snapshot = self._branch_snapshot
+        if snapshot is None or fingerprint is None or snapshot.fingerprint != fingerprint:
+            query = BRANCH_SNAPSHOT_QUERY
+            output = self.git.for_each_ref(*query.args, **query.kwds)
+            snapshot = self._branch_snapshot = BranchSnapshot(self, output, fingerprint)
+        return snapshot
+
+    def _refs_fingerprint(self):
+        return self.git.cache.refs_fingerprint()
+
+    def ahead_behind(self, base=None):
+        """
+        Return the number of commits ahead and behind ``base`` for all local branches
+
+        All branches are compared in a single walk of the commit
+        graph. The result is cached until the references change.
+
+        INPUT:
+
+        - ``base`` -- a :class:`~sageui.model.git_commit.GitCommit`
+          or ``None`` (default). By default, ``master``.
+
+        OUTPUT:
+
+        Dictionary with the full branch names as keys and pairs
+        ``(ahead, behind)`` as values.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: counts = repo.ahead_behind()
+            sage: counts['sageui/1001/u/alice/work']
+            (5, 0)
+            sage: history = repo.head.get_history()
+            sage: repo.ahead_behind(history[1])['master']
+            (0, 4)
+        """
+        if base is None:
+            base = self.master.commit
+        return self.branch_snapshot().ahead_behind(base)
+
+    def commit_graph(self, *commits):
+        """
+        Return the commit graph of all local branches
+
+        The graph is read from disk the first time, and new commits
+        are added whenever the references changed.
+
+        INPUT:
+
+        - ``commits`` -- :class:`~sageui.model.git_commit.GitCommit`
+          or SHA-1s that must be in the graph, even if they are not
+          reachable from a local branch.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_commit_graph.GitCommitGraph`.
+        """
+        from git_commit_graph import GitCommitGraph
+        fingerprint = self._refs_fingerprint()
+        graph = self._commit_graph
+        if graph is None:
+            graph = self._commit_graph = GitCommitGraph.load(self.git)
+        if fingerprint is None or fingerprint != self._commit_graph_fingerprint:
+            snapshot = self.branch_snapshot()
+            tips = [snapshot.sha1(name) for name in snapshot.names()]
+            tips.append(self.head.sha1)
+            if graph.update(tips):
+                graph.save()
+            self._commit_graph_fingerprint = fingerprint
+        missing = [str(commit) for commit in commits if str(commit) not in graph]
+        if missing and graph.update(missing):
+            graph.save()
+        return graph
+
+    def merge_bases(self, commit, other):
+        """
+        Return the best common ancestors of two commits
+
+        Computed in-process with the :meth:`commit_graph`.
+
+        INPUT:
+
+        - ``commit``, ``other`` -- two
+          :class:`~sageui.model.git_commit.GitCommit`.
+
+        OUTPUT:
+
+        List of :class:`~sageui.model.git_commit.GitCommit`.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: repo.merge_bases(repo.head, repo.master.commit) == [repo.master.commit]
+            True
+        """
+        graph = self.commit_graph(commit, other)
+        return [GitCommit(self, sha1, graph.title(sha1))
+                for sha1 in graph.merge_bases(commit.sha1, other.sha1)]
+
+    def is_merged(self, branch, into=None):
+        """
+        Whether the commit of ``branch`` is contained in another branch
+
+        INPUT:
+
+        - ``branch`` -- a :class:`~sageui.model.git_branch.GitBranchABC`.
+
+        - ``into`` -- a :class:`~sageui.model.git_branch.GitBranchABC`
+          or ``None`` (default). By default, ``master``.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: repo.is_merged(repo.master, repo.current_branch())
+            True
+            sage: repo.is_merged(repo.current_branch())
+            False
+        """
+        if into is None:
+            into = self.master
+        graph = self.commit_graph(branch.commit, into.commit)
+        return graph.is_ancestor(branch.commit.sha1, into.commit.sha1)
+
+    def ticket_branches(self, ticket_number):
+        """
+        Return the managed branches for a ticket
+
+        INPUT:
+
+        - ``ticket_number`` -- integer.
+
+        OUTPUT:
+
+        List of :class:`~sageui.model.git_branch.GitManagedBranch`.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: repo.ticket_branches(1001)
+            [Git branch sageui/1001/u/alice/work, Git branch sageui/1001/u/bob/work]
+            sage: repo.ticket_branches(1)
+            []
+        """
+        return self.branch_snapshot().ticket_branches(ticket_number)
 
     def current_branch(self):
         r"""
@@ -196,13 +797,81 @@ class GitRepository(object):
             DetachedHeadException: unexpectedly, git is in a detached HEAD state
             sage: repo.git.silent.checkout('master')
         """
-        try:
-            branch_string = self.git.symbolic_ref('HEAD', short=True, quiet=True).strip()
-        except GitError as e:
-            if e.exit_code == 1:
-               raise DetachedHeadException()
-            raise
-        return GitBranch(self, branch_string)
+        refname = self._symbolic_head
+        if refname is None:
+            raise DetachedHeadException()
+        return GitBranch(self, refname[len('refs/heads/'):])
+
+    def overview(self, untracked=True):
+        r"""
+        Return everything that the git window shows initially.
+
+        The necessary read-only git commands are run concurrently, so
+        this takes about as long as the slowest of them.
+
+        INPUT:
+
+        - ``untracked`` -- boolean (default: ``True``). Whether to
+          look for untracked files, see :meth:`changes`.
+
+        OUTPUT:
+
+        A :class:`GitOverview` with the fields
+
+        - ``branches`` -- the :meth:`local_branches`.
+
+        - ``current_branch`` -- the :meth:`current_branch` or ``None``
+          if the ``HEAD`` is detached.
+
+        - ``history`` -- the history of ``HEAD`` relative to
+          ``master``, see :meth:`~sageui.model.git_commit.GitCommit.history`.
+          Its first page is already loaded.
+
+        - ``changes`` -- the :meth:`changes` relative to ``HEAD``.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: overview = repo.overview()
+            sage: overview.current_branch
+            Git branch sageui/1002/public/anything
+            sage: overview.history.loaded
+            5
+            sage: overview.history[:6] == repo.head.get_history()
+            True
+            sage: overview.changes
+            [unstaged:+1-0:foo4.txt, staged:+0-0:staged_file, untracked:untracked_file]
+        """
+        head = self.head
+        master = self.master.commit
+        history = head.history(master, page_size=20)
+        fingerprint = self._refs_fingerprint()
+        snapshot = self._branch_snapshot
+        if snapshot is None or fingerprint is None or snapshot.fingerprint != fingerprint:
+            snapshot = None
+        queries = [
+            GitQuery('rev-parse', 'HEAD', symbolic_full_name=True),
+            GitQuery('diff', head.sha1, numstat=True, z=True),
+            self._status_query(untracked)]
+        if snapshot is None:
+            queries.append(BRANCH_SNAPSHOT_QUERY)
+        results = self.git.execute_batch(queries)
+        current, numstat, status = results[:3]
+        if snapshot is None:
+            snapshot = self._branch_snapshot = BranchSnapshot(self, results[3], fingerprint)
+        current = current.strip()
+        if current.startswith('refs/heads/'):
+            name = current[len('refs/heads/'):]
+            current_branch = snapshot.branch(name) if name in snapshot else GitBranch(self, name)
+        else:
+            current_branch = None
+        history._load_page()
+        changes = self._merge_changes(head,
+                                      parse_numstat(iter_records([numstat])),
+                                      parse_status(iter_records([status])))
+        self._changes.reset(head, changes, untracked)
+        changes = self._changes.files()
+        return GitOverview(snapshot.branches(), current_branch, history, changes)
 
     def rename_branch(self, oldname, newname):
         r"""
@@ -239,23 +908,56 @@ class GitRepository(object):
             sage: repo.diff_index(history[-1], history[0])
             [diff_index:+1-0:bar/foo6.txt, diff_index:+1-0:foo2_moved.txt, diff_index:+1-0:foo3.txt, diff_index:+1-0:foo4.txt, diff_index:+1-0:foo5.txt]
         """
-        log = self.git.diff(from_commit, to_commit, numstat=True, z=True)
-        result = []
-        for line in log.split('\0'):
-            if line == '':  # two nulls is the end marker
-                break
-            line = line.split('\t')
-            f = GitFileDiff(self, int(line[0]), int(line[1]), line[-1], from_commit, to_commit)
-            result.append(f)
-        return result
+        return list(self.iter_diff_index(from_commit, to_commit))
+
+    def iter_diff_index(self, from_commit, to_commit):
+        """
+        Iterate over the changed files between the two commits
+
+        Same as :meth:`diff_index`, except that the files are yielded
+        as soon as git reports them.
 
-    def changes(self):
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: history = repo.current_branch().commit.get_history()
+            sage: it = repo.iter_diff_index(history[-1], history[0])
+            sage: next(it)
+            diff_index:+1-0:bar/foo6.txt
+            sage: it.close()
+        """
+        cache = self.persistent_cache
+        key = ('diff_index', str(from_commit), str(to_commit))
+        if cache is not None and is_sha1(key[1]) and is_sha1(key[2]):
+            rows = cache.get(key)
+            if rows is None:
+                records = self.git.execute_iter('diff', from_commit, to_commit, numstat=True, z=True)
+                rows = [(record.added or 0, record.deleted or 0, record.path, record.binary)
+                        for record in parse_numstat(records)]
+                cache.put(key, rows)
+            for added, deleted, path, binary in rows:
+                yield GitFileDiff(self, added, deleted, path, from_commit, to_commit, binary=binary)
+            return
+        records = self.git.execute_iter('diff', from_commit, to_commit, numstat=True, z=True)
+        for record in parse_numstat(records):
+            yield GitFileDiff(self, record.added or 0, record.deleted or 0, record.path,
+                              from_commit, to_commit, binary=record.binary)
+
+    def changes(self, untracked=True):
         """
         List all changes since (and including) :meth:`base_commit`
         
         Note that a file can be both changed in git history and 
         staged/unstaged. The latter takes precedence.
 
+        INPUT:
+
+        - ``untracked`` -- boolean (default: ``True``). Whether to
+          look for untracked files. This is the slowest part on a
+          large work tree. If ``False``, only the untracked files that
+          are already known are listed. Use
+          :meth:`scan_untracked_async` to find them in the background.
+
         EXAMPLES::
         
             sage: repo = test.git_repo() 
@@ -269,36 +971,111 @@ class GitRepository(object):
              staged:+0-0:staged_file, 
              untracked:untracked_file]
         """
+        self._changes.refresh(self.base_commit, untracked=untracked)
+        return self._changes.files()
+
+    def update_changes(self, paths=None, untracked=True):
+        """
+        Update the result of :meth:`changes`
+
+        Only the given paths are recomputed, the other files are
+        taken from the last call to :meth:`changes` (or
+        :meth:`changes_async`, :meth:`overview`). If the
+        :meth:`base_commit` changed in the meantime, everything is
+        recomputed.
+
+        INPUT:
+
+        - ``paths`` -- list of paths relative to the top of the work
+          tree or ``None`` (default). The files that might have
+          changed. If ``None``, everything is recomputed.
+
+        - ``untracked`` -- boolean (default: ``True``). Whether to
+          look for untracked files if everything is recomputed, see
+          :meth:`changes`.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_changes.GitChangesDelta` with
+        the lists of added, removed, and changed git files.
+
+        EXAMPLES::
+
+            sage: repo = test.new_git_repo()
+            sage: repo.changes()
+            [unstaged:+1-0:foo4.txt, staged:+0-0:staged_file, untracked:untracked_file]
+            sage: repo.git.silent.add('foo4.txt')
+            sage: repo.update_changes(['foo4.txt'])
+            GitChangesDelta(added=[], removed=[], changed=[staged:+1-0:foo4.txt])
+        """
+        return self._changes.refresh(self.base_commit, paths, untracked)
+
+    def changes_async(self, untracked=True):
+        """
+        Like :meth:`changes` but without blocking
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred` that will
+        be called back with the list of changes.
+
+        EXAMPLES::
+
+            sage: repo = test.git_repo()
+            sage: repo.base_commit = repo.head.get_history()[-1]
+            sage: repr(repo.changes_async().wait()) == repr(repo.changes())
+            True
+        """
+        base_commit = self.base_commit
+        diff = self.git.execute_async('diff', base_commit, numstat=True, z=True)
+        status_query = self._status_query(untracked)
+        status = self.git.run_async(status_query.cmd, status_query.args, status_query.kwds)
+        def merge(status_log, numstat):
+            files = self._merge_changes(base_commit, numstat, parse_status(iter_records([status_log])))
+            self._changes.reset(base_commit, files, untracked)
+            return self._changes.files()
+        def parse(diff_log):
+            numstat = parse_numstat(iter_records([diff_log]))
+            return status.add_callback(lambda status_log: merge(status_log, numstat))
+        return diff.add_callback(parse)
+
+    def _status_query(self, untracked):
+        if untracked:
+            return GitQuery('status', z=True)
+        return GitQuery('status', z=True, untracked_files='no')
+
+    def _merge_changes(self, base_commit, numstat, status):
+        """
+        Combine the records of ``git diff --numstat`` and ``git status``
+
+        INPUT:
+
+        - ``base_commit`` -- the commit that the diff is relative to.
+
+        - ``numstat`` -- iterable of
+          :class:`~sageui.model.git_records.NumstatRecord`.
+
+        - ``status`` -- iterable of
+          :class:`~sageui.model.git_records.StatusRecord`.
+        """
         files = dict()
-        log = self.git.diff(self.base_commit, numstat=True, z=True)
-        for line in log.split('\0'):
-            if line == '':  # two nulls is the end marker
-                break
-            line = line.split('\t')
-            name = line[-1]
-            if line[0] == line[1] == '-':
-                f = GitFileCommitted(self, 0, 0, name, self.base_commit, binary=True) 
-            else:
-                f = GitFileCommitted(self, int(line[0]), int(line[1]), name, self.base_commit, binary=False) 
-            files[name] = f
-        log = self.git.status(z=True)
-        for line in log.split('\0'):
-            if line == '':  # two nulls is the end marker
-                break
-            status = line[0:2]
-            status_unstaged = line[1]
-            status_staged = line[0]
-            name = line[3:]
-            blank = ' '
-            if status == '??':
+        for record in numstat:
+            files[record.path] = GitFileCommitted(
+                self, record.added or 0, record.deleted or 0, record.path, base_commit,
+                binary=record.binary)
+        blank = ' '
+        for record in status:
+            name = record.path
+            if record.staged == record.unstaged == '?':
                 files[name] = GitFileUntracked(self, name)
-            elif status_unstaged != blank:
-                f = files[name]
+                continue
+            f = files.get(name)
+            if f is None:
+                f = GitFileCommitted(self, 0, 0, name, base_commit)
+            if record.unstaged != blank:
                 files[name] = GitFileUnstaged(self, f.added, f.subed, f.name, f.commit, binary=f.binary)
-            elif status_staged != blank:
-                f = files[name]
+            elif record.staged != blank:
                 files[name] = GitFileStaged(self, f.added, f.subed, f.name, f.commit, binary=f.binary)
             else:
-                raise ValueError('unknown status '+status)
+                raise ValueError('unknown status '+record.staged+record.unstaged)
         return [files[name] for name in sorted(files.keys())]
-
@@ -0,0 +1,347 @@
+r"""
+Instrumentation of Git Commands
+
+Every git subprocess that the
+:class:`~sageui.model.git_interface.GitInterface` runs is timed. For
+each command we record the wall time, the CPU time used by git (taken
+from ``os.wait4`` when the :class:`GitProcess` is reaped, so concurrent
+commands do not disturb it), the number of bytes written to stdout and
+stderr, and the exit code. The records are aggregated per git subcommand in a
+:class:`GitHistogram`, which buckets the wall times by powers of two
+(in milliseconds).
+
+If the Sage UI is started with ``--log``, each record is additionally
+appended as one JSON object per line to ``git_commands.log`` in the
+Sage UI directory (see :func:`enable_log`).
+
+EXAMPLES::
+
+    sage: repo = test.new_git_repo()
+    sage: git = repo.git
+    sage: stats = git.statistics
+    sage: stats.clear()
+    sage: log = git.log('master', format='%s')
+    sage: git.exit_code.rev_parse('--verify', 'nonexisting')
+    128
+    sage: sorted(stats.histograms())
+    ['log', 'rev-parse']
+    sage: h = stats.histograms()['log']
+    sage: h.count, h.failures, h.stdout_bytes == len(log)
+    (1, 0, True)
+    sage: stats.histograms()['rev-parse'].failures
+    1
+    sage: stats.last.subcommand, stats.last.exit_code
+    ('rev-parse', 128)
+    sage: print stats.table()
+    command   count  fail  wall [ms]  cpu [ms]  stdout  stderr
+    log           1     0        ...       ...     ...       0
+    rev-parse     1     1        ...       ...       0     ...
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import json
+import math
+import time
+import errno
+import threading
+import subprocess
+from collections import namedtuple
+
+
+GitCommandRecord = namedtuple('GitCommandRecord', [
+    'timestamp', 'subcommand', 'cmd', 'wall_time', 'cpu_time',
+    'stdout_bytes', 'stderr_bytes', 'exit_code'])
+
+
+# Name of the JSON-lines log file or ``None`` if logging is disabled
+_log_filename = None
+
+
+def enable_log(filename=None):
+    """
+    Append a JSON record for each git command to ``filename``
+
+    INPUT:
+
+    - ``filename`` -- string or ``None`` (default). The log file. By
+      default, ``git_commands.log`` in the Sage UI directory.
+
+    This only affects :class:`GitStatistics` instances that are
+    created afterwards.
+    """
+    global _log_filename
+    if filename is None:
+        from config import Config
+        filename = os.path.join(Config().sageui_directory, 'git_commands.log')
+    _log_filename = filename
+
+
+class GitProcess(subprocess.Popen):
+    """
+    A subprocess that keeps its own resource usage
+
+    The usage is returned by ``os.wait4`` when the process is reaped,
+    so it only contains this process and its children. The resource
+    usage of all children, on the other hand, would include any git
+    command that finished in the meantime.
+
+    If the process was reaped by someone else, its exit code and usage
+    are lost. Then :meth:`wait` raises ``OSError`` instead of
+    reporting a clean exit.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_stats import GitProcess
+        sage: process = GitProcess(['true'])
+        sage: process.cpu_time is None
+        True
+        sage: process.wait()
+        0
+        sage: process.rusage is not None, process.cpu_time >= 0
+        (True, True)
+    """
+
+    rusage = None
+
+    def _reap(self, options):
+        while True:
+            try:
+                pid, status, rusage = os.wait4(self.pid, options)
+                break
+            except OSError as error:
+                if error.errno != errno.EINTR:
+                    raise
+        if pid == self.pid:
+            self.rusage = rusage
+            self._handle_exitstatus(status)
+
+    def poll(self):
+        if self.returncode is None:
+            self._reap(os.WNOHANG)
+        return self.returncode
+
+    def wait(self):
+        while self.returncode is None:
+            self._reap(0)
+        return self.returncode
+
+    @property
+    def cpu_time(self):
+        """
+        The user and system time in seconds, or ``None`` if unknown
+        """
+        if self.rusage is None:
+            return None
+        return self.rusage.ru_utime + self.rusage.ru_stime
+
+
+class GitHistogram(object):
+    """
+    Aggregated statistics of a single git subcommand
+
+    The wall times are sorted into buckets; bucket ``n`` counts the
+    commands that took less than `2^n` milliseconds (and at least
+    `2^{n-1}` for positive ``n``).
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_stats import GitHistogram, GitCommandRecord
+        sage: h = GitHistogram('status')
+        sage: for wall_time in [0.0005, 0.003, 0.003, 0.1]:
+        ....:     h.add(GitCommandRecord(0, 'status', 'git status', wall_time, 0.001, 10, 0, 0))
+        sage: h
+        <GitHistogram status: 4 commands>
+        sage: h.count, h.stdout_bytes
+        (4, 40)
+        sage: sorted(h.buckets.items())
+        [(0, 1), (2, 2), (7, 1)]
+        sage: h.max_wall_time
+        0.1
+    """
+
+    def __init__(self, subcommand):
+        self.subcommand = subcommand
+        self.count = 0
+        self.failures = 0
+        self.wall_time = 0.0
+        self.max_wall_time = 0.0
+        self.cpu_time = 0.0
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+        self.buckets = dict()
+
+    def __repr__(self):
+        return '<GitHistogram {0}: {1} commands>'.format(self.subcommand, self.count)
+
+    @staticmethod
+    def bucket(wall_time):
+        """
+        Return the bucket for a wall time (in seconds)
+        """
+        milliseconds = wall_time * 1000
+        if milliseconds < 1:
+            return 0
+        return int(math.floor(math.log(milliseconds, 2))) + 1
+
+    def add(self, record):
+        """
+        Add a :class:`GitCommandRecord`
+        """
+        self.count += 1
+        if record.exit_code != 0:
+            self.failures += 1
+        self.wall_time += record.wall_time
+        self.max_wall_time = max(self.max_wall_time, record.wall_time)
+        if record.cpu_time is not None:
+            self.cpu_time += record.cpu_time
+        self.stdout_bytes += record.stdout_bytes
+        self.stderr_bytes += record.stderr_bytes
+        n = self.bucket(record.wall_time)
+        self.buckets[n] = self.buckets.get(n, 0) + 1
+
+
+class GitCommandTimer(object):
+    """
+    Measure a single git command
+
+    You should not construct this yourself, use
+    :meth:`GitStatistics.timer`.
+    """
+
+    def __init__(self, statistics, cmd_line):
+        self._statistics = statistics
+        self._cmd_line = cmd_line
+        self._timestamp = time.time()
+
+    def stop(self, exit_code, stdout_bytes, stderr_bytes, cpu_time):
+        """
+        Record the end of the git command
+
+        INPUT:
+
+        - ``exit_code`` -- integer or ``None`` if unknown.
+
+        - ``cpu_time`` -- float or ``None`` if unknown. The CPU time
+          of git, see :attr:`GitProcess.cpu_time`.
+
+        OUTPUT:
+
+        The :class:`GitCommandRecord`.
+        """
+        wall_time = time.time() - self._timestamp
+        cmd_line = self._cmd_line
+        subcommand = cmd_line[1] if len(cmd_line) > 1 else ''
+        record = GitCommandRecord(self._timestamp, subcommand, ' '.join(cmd_line),
+                                  wall_time, cpu_time, stdout_bytes, stderr_bytes, exit_code)
+        self._statistics.add(record)
+        return record
+
+
+class GitStatistics(object):
+    """
+    Collect the :class:`GitCommandRecord` of a git interface
+
+    You should not construct this yourself, use
+    :attr:`GitInterface.statistics
+    <sageui.model.git_interface.GitInterface.statistics>`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = dict()
+        self._log_filename = _log_filename
+        self._log_file = None
+        self.last = None
+
+    def timer(self, cmd_line):
+        """
+        Start timing a git command
+
+        INPUT:
+
+        - ``cmd_line`` -- list of strings. The complete command line.
+
+        OUTPUT:
+
+        A :class:`GitCommandTimer`. Call its ``stop()`` method when
+        git has finished.
+        """
+        return GitCommandTimer(self, cmd_line)
+
+    def add(self, record):
+        """
+        Add a :class:`GitCommandRecord`
+        """
+        with self._lock:
+            self.last = record
+            try:
+                histogram = self._histograms[record.subcommand]
+            except KeyError:
+                histogram = self._histograms[record.subcommand] = GitHistogram(record.subcommand)
+            histogram.add(record)
+            if self._log_filename is not None:
+                self._write_log(record)
+
+    def _write_log(self, record):
+        if self._log_file is None:
+            self._log_file = open(self._log_filename, 'a')
+        self._log_file.write(json.dumps(record._asdict()) + '\n')
+        self._log_file.flush()
+
+    def histograms(self):
+        """
+        Return the histograms
+
+        OUTPUT:
+
+        Dictionary with the git subcommands as keys and
+        :class:`GitHistogram` as values.
+        """
+        with self._lock:
+            return dict(self._histograms)
+
+    def clear(self):
+        """
+        Forget all records
+        """
+        with self._lock:
+            self._histograms.clear()
+            self.last = None
+
+    def table(self):
+        """
+        Return a table of the histograms
+
+        OUTPUT:
+
+        String.
+        """
+        histograms = sorted(self.histograms().values(), key=lambda h: h.subcommand)
+        width = max([len('command')] + [len(h.subcommand) for h in histograms])
+        row = '{0:<' + str(width) + '} {1:>6} {2:>5} {3:>10} {4:>9} {5:>7} {6:>7}'
+        lines = [row.format('command', 'count', 'fail', 'wall [ms]', 'cpu [ms]',
+                            'stdout', 'stderr')]
+        for h in histograms:
+            lines.append(row.format(h.subcommand, h.count, h.failures,
+                                    int(h.wall_time * 1000), int(h.cpu_time * 1000),
+                                    h.stdout_bytes, h.stderr_bytes))
+        return '\n'.join(lines)
@@ -0,0 +1,345 @@
+r"""
+Scanning for Untracked Files
+
+Listing the untracked files (``git status`` without ``-uno``) walks
+the whole work tree, which in Sage includes a lot of build output.
+This dominates the time to list the changes. The
+:class:`GitUntrackedScanner` instead lists the untracked files one
+directory at a time. Only directories that contain tracked files can
+contain untracked files that are reported individually, untracked
+directories are reported as a whole (``name/``). The result for each
+directory is cached until its modification time changes, which
+happens whenever an entry is created, removed, or renamed in it, or
+until the tracked entries in it change (for example, by ``git add``).
+
+The scan can run in the background (see :meth:`GitUntrackedScanner.scan_async`)
+while the tracked changes are already displayed, see
+:meth:`GitRepository.changes
+<sageui.model.git_repository.GitRepository.changes>` with
+``untracked=False``.
+
+EXAMPLES::
+
+    sage: import os
+    sage: from sageui.model.git_untracked import GitUntrackedScanner
+    sage: repo = test.new_git_repo()
+    sage: scanner = GitUntrackedScanner(repo.git)
+    sage: scanner.scan()
+    ['untracked_file']
+    sage: os.mkdir(os.path.join(repo.git.work_tree, 'bar', 'new'))
+    sage: os.mkdir(os.path.join(repo.git.work_tree, 'bar', 'empty'))
+    sage: open(os.path.join(repo.git.work_tree, 'bar', 'new', 'file'), 'w').close()
+    sage: found = []
+    sage: d = scanner.scan_async(lambda directories, names: found.append(names))
+    sage: d.wait()
+    ['bar/new/', 'untracked_file']
+    sage: found
+    [['untracked_file'], ['bar/new/']]
+
+Only the directory ``bar`` had to be asked about again. Nothing has
+changed since, so nothing needs to be asked about now::
+
+    sage: git = repo.git
+    sage: git.statistics.clear()
+    sage: scanner.scan()
+    ['bar/new/', 'untracked_file']
+    sage: sorted(git.statistics.histograms())
+    ['ls-files']
+    sage: git.statistics.histograms()['ls-files'].count    # only the tracked files
+    1
+
+Adding a file to the index does not change its directory, but the
+file is not untracked any more::
+
+    sage: git.silent.add('untracked_file')
+    sage: scanner.scan()
+    ['bar/new/']
+    sage: git.silent.add('bar/new/file')
+    sage: scanner.scan()
+    []
+    sage: git.ls_files(others=True, exclude_standard=True, directory=True, no_empty_directory=True)
+    ''
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import re
+
+from git_records import iter_records, parse_ls_files
+
+
+# Number of directories that are asked about in a single git command
+_CHUNK_DIRECTORIES = 200
+
+
+def _glob_escape(path):
+    r"""
+    Escape the glob special characters
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_untracked import _glob_escape
+        sage: _glob_escape('foo/b[a]r*?')
+        'foo/b\\[a\\]r\\*\\?'
+    """
+    return re.sub(r'([\\*?\[\]])', r'\\\1', path)
+
+
+def _parent(name):
+    """
+    Return the directory that contains the entry ``name``
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_untracked import _parent
+        sage: _parent('foo'), _parent('foo/bar'), _parent('foo/bar/')
+        ('', 'foo', 'foo')
+    """
+    return os.path.dirname(name.rstrip('/'))
+
+
+def _pathspecs(directory):
+    """
+    Return the pathspecs that match the direct entries of ``directory``
+
+    The second one is needed for untracked subdirectories.
+
+    EXAMPLES::
+
+        sage: from sageui.model.git_untracked import _pathspecs
+        sage: _pathspecs(''), _pathspecs('foo')
+        ([':(glob)*', ':(glob)*/'], [':(glob)foo/*', ':(glob)foo/*/'])
+    """
+    prefix = ':(glob)' + (_glob_escape(directory) + '/' if directory else '')
+    return [prefix + '*', prefix + '*/']
+
+
+class GitUntrackedScanner(object):
+    """
+    List the untracked files, cached per directory
+
+    You should not need to construct this yourself, use
+    :meth:`GitRepository.untracked_files
+    <sageui.model.git_repository.GitRepository.untracked_files>` and
+    :meth:`GitRepository.scan_untracked_async
+    <sageui.model.git_repository.GitRepository.scan_untracked_async>`.
+
+    INPUT:
+
+    - ``git`` -- a :class:`~sageui.model.git_interface.GitInterface`.
+    """
+
+    # ``--no-empty-directory`` would hide the untracked directories
+    # matched by the ``*/`` pathspecs, see :meth:`_is_empty`
+    _ls_files_kwds = {'others': True, 'exclude_standard': True, 'directory': True, 'z': True}
+
+    def __init__(self, git):
+        self._git = git
+        self._ignore_key = None
+        # directory -> ((modification time, tracked entries), list of untracked names)
+        self._cache = dict()
+
+    def clear(self):
+        """
+        Forget all cached results
+        """
+        self._ignore_key = None
+        self._cache.clear()
+
+    def _directories(self):
+        """
+        Return the directories that contain tracked files and the ignore files
+
+        OUTPUT:
+
+        A triple consisting of the directories, sorted with the
+        top-level ones first, a dictionary with the directories as
+        keys and a hash of their tracked entries as values, and the
+        tracked ``.gitignore`` files.
+        """
+        records = self._git.execute_iter('ls-files', z=True)
+        entries = {'': []}
+        ignore_files = []
+        for name in parse_ls_files(records):
+            if os.path.basename(name) == '.gitignore':
+                ignore_files.append(name)
+            dirname = os.path.dirname(name)
+            new = []
+            while dirname not in entries:
+                entries[dirname] = []
+                new.append(dirname)
+                dirname = os.path.dirname(dirname)
+            for dirname in new:
+                entries[os.path.dirname(dirname)].append(dirname + '/')
+            entries[os.path.dirname(name)].append(name)
+        directories = sorted(entries, key=lambda d: (d.count('/') + bool(d), d))
+        tracked = dict((d, hash(tuple(names))) for d, names in entries.iteritems())
+        return directories, tracked, ignore_files
+
+    def _mtime(self, path):
+        try:
+            return os.stat(os.path.join(self._git.work_tree, path)).st_mtime
+        except OSError:
+            return None
+
+    def _is_empty(self, name):
+        """
+        Whether ``name`` is an empty directory, which git does not report
+        """
+        if not name.endswith('/'):
+            return False
+        try:
+            return not os.listdir(os.path.join(self._git.work_tree, name))
+        except OSError:
+            return False
+
+    def _check_ignore_files(self, ignore_files):
+        """
+        Clear the cache if the exclude rules might have changed
+
+        Editing a ``.gitignore`` in place does not change the
+        modification time of its directory, but can change the
+        untracked files of all its subdirectories.
+        """
+        exclude = os.path.join(self._git.refs.common_dir, 'info', 'exclude')
+        key = [(name, self._mtime(name)) for name in ignore_files]
+        key.append((exclude, self._mtime(exclude)))
+        if key != self._ignore_key:
+            self._cache.clear()
+            self._ignore_key = key
+
+    def _plan(self):
+        """
+        Split the directories into cached and stale ones
+
+        OUTPUT:
+
+        A triple ``(directories, names, chunks)``. The untracked
+        files in ``directories`` are cached and are ``names``. The
+        other directories must be asked about, they are grouped
+        into ``chunks`` of pairs ``(directory, key)``, where the key
+        consists of the modification time and the tracked entries.
+        """
+        directories, tracked_entries, ignore_files = self._directories()
+        self._check_ignore_files(ignore_files)
+        tracked = set(directories)
+        # untracked files of directories that are gone are gone too
+        cached = set(d for d in self._cache if d not in tracked)
+        for directory in cached:
+            del self._cache[directory]
+        names = []
+        stale = []
+        for directory in directories:
+            key = self._mtime(directory)
+            if key is not None:
+                key = (key, tracked_entries[directory])
+            entry = self._cache.get(directory)
+            if entry is not None and entry[0] == key:
+                cached.add(directory)
+                names.extend(entry[1])
+            else:
+                stale.append((directory, key))
+        chunks = [stale[i:i+_CHUNK_DIRECTORIES]
+                  for i in range(0, len(stale), _CHUNK_DIRECTORIES)]
+        return cached, names, chunks
+
+    def _query(self, chunk):
+        """
+        Return the arguments of ``git ls-files`` for a chunk of directories
+        """
+        args = ['--']
+        for directory, key in chunk:
+            args.extend(_pathspecs(directory))
+        return args
+
+    def _store(self, chunk, output):
+        """
+        Cache the output of git for a chunk of directories
+
+        OUTPUT:
+
+        The pair ``(directories, names)`` of the directories in the
+        chunk and the untracked files that were found in them.
+        """
+        found = dict((directory, []) for directory, key in chunk)
+        names = []
+        for name in parse_ls_files(iter_records([output])):
+            if self._is_empty(name):
+                continue
+            found.setdefault(_parent(name), []).append(name)
+            names.append(name)
+        for directory, key in chunk:
+            if key is not None:
+                self._cache[directory] = (key, found[directory])
+        return set(found), names
+
+    def scan(self):
+        """
+        Return the untracked files
+
+        OUTPUT:
+
+        Sorted list of the names of the untracked files relative to
+        the top of the work tree. Untracked directories are listed
+        as a whole, their name ends with a slash.
+        """
+        cached, names, chunks = self._plan()
+        for chunk in chunks:
+            output = self._git.execute('ls-files', *self._query(chunk), **self._ls_files_kwds)
+            names.extend(self._store(chunk, output)[1])
+        return sorted(names)
+
+    def scan_async(self, callback):
+        """
+        Find the untracked files without blocking
+
+        INPUT:
+
+        - ``callback`` -- function. Called with the arguments
+          ``(directories, names)`` as soon as the untracked files
+          ``names`` in the set ``directories`` are known. First with
+          the cached directories, then for each chunk of directories
+          that git was asked about.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred` that is
+        called back with the sorted list of all untracked files when
+        the scan has finished. Cancelling it stops the scan.
+        """
+        from git_async import GitDeferred
+        cached, names, chunks = self._plan()
+        all_names = list(names)
+        callback(cached, names)
+        def next_chunk(_):
+            if not chunks:
+                return sorted(all_names)
+            chunk = chunks.pop(0)
+            def found(output):
+                directories, names = self._store(chunk, output)
+                all_names.extend(names)
+                callback(directories, names)
+            d = self._git.run_async('ls-files', self._query(chunk), self._ls_files_kwds)
+            return d.add_callback(found).add_callback(next_chunk)
+        d = GitDeferred()
+        d.add_callback(next_chunk)
+        d.callback(None)
+        return d
@@ -0,0 +1,588 @@
+r"""
+Watching the Repository for Changes
+
+Instead of re-running git whenever the user might have changed
+something, the :class:`GitWatcher` watches the git directory (``HEAD``,
+the references, the index) and the work tree, and reports what
+changed. On Linux it uses inotify, elsewhere (or if inotify is not
+available, for example because the limit on the number of watches is
+reached) it polls file modification times.
+
+Events are collected until nothing happened for a short delay and then
+reported together as a single :class:`GitWatcherEvent`.
+
+Only directories that contain tracked files (and directories created
+while watching) are watched in the work tree. In particular, ignored
+build directories are not watched.
+
+EXAMPLES::
+
+    sage: import os
+    sage: from sageui.model.git_watcher import GitWatcher
+    sage: repo = test.new_git_repo()
+    sage: events = []
+    sage: watcher = GitWatcher(repo.git, events.append)
+    sage: watcher.start()
+    sage: watcher.backend in ['inotify', 'polling']
+    True
+    sage: with open(os.path.join(repo.git.work_tree, 'bar', 'foo6.txt'), 'a') as f:
+    ....:     f.write('more content\n')
+    sage: watcher.check()
+    GitWatcherEvent(refs=False, head=False, index=False, paths=frozenset(['bar/foo6.txt']))
+    sage: watcher.check() is None
+    True
+    sage: repo.git.silent.branch('new_branch')
+    sage: watcher.check()
+    GitWatcherEvent(refs=True, head=False, index=False, paths=frozenset([]))
+    sage: repo.git.silent.checkout('new_branch')
+    sage: watcher.check()
+    GitWatcherEvent(refs=False, head=True, index=True, paths=frozenset([]))
+    sage: events == []    # the callback is only called from the main loop
+    True
+    sage: watcher.stop()
+
+While the watcher runs, the result cache may cache work tree queries::
+
+    sage: repo.git.cache.worktree_tracked
+    False
+    sage: watcher.start()
+    sage: repo.git.cache.worktree_tracked
+    True
+    sage: watcher.stop()
+    sage: repo.git.cache.worktree_tracked
+    False
+
+and the references are not scanned for every cached result::
+
+    sage: watcher.start()
+    sage: token = repo.git.cache.refs_fingerprint()
+    sage: token == repo.git.cache.refs_fingerprint()
+    True
+    sage: with open(os.path.join(repo.git.git_dir, 'refs', 'heads', 'other'), 'w') as f:
+    ....:     f.write(repo.head.sha1 + '\n')
+    sage: watcher.check().refs
+    True
+    sage: token == repo.git.cache.refs_fingerprint()
+    False
+    sage: watcher.stop()
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import stat
+import time
+import errno
+import struct
+import logging
+from collections import namedtuple
+
+from git_records import parse_ls_files
+
+
+# What changed in the repository. The ``refs``, ``head``, and
+# ``index`` fields are booleans. The ``paths`` field is the frozenset
+# of work tree paths (relative to the top of the work tree) that were
+# touched, or ``None`` if events were lost and anything might have
+# changed.
+GitWatcherEvent = namedtuple('GitWatcherEvent', ['refs', 'head', 'index', 'paths'])
+
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+               IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify(object):
+    """
+    Minimal ctypes binding to the Linux inotify API
+
+    Raises ``OSError`` if inotify is not available.
+    """
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        name = ctypes.util.find_library('c')
+        if name is None:
+            raise OSError(errno.ENOSYS, 'no C library')
+        libc = ctypes.CDLL(name, use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._get_errno = ctypes.get_errno
+        self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = self._get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask):
+        wd = self._add_watch(self.fd, path, mask)
+        if wd < 0:
+            error = self._get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read(self):
+        """
+        Return the list of pending ``(wd, mask, name)``
+        """
+        result = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return result
+                raise
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, pos)
+                pos += _EVENT_HEADER.size
+                name = data[pos:pos+length].rstrip('\0')
+                pos += length
+                result.append((wd, mask, name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class GitWatcher(object):
+    """
+    Watch a git repository
+
+    INPUT:
+
+    - ``git`` -- a :class:`~sageui.model.git_interface.GitInterface`.
+
+    - ``callback`` -- function. Called from the GTK main loop with a
+      :class:`GitWatcherEvent` after the repository changed.
+
+    - ``delay`` -- number (default: 0.2). Seconds without further
+      changes before the callback is called.
+
+    - ``interval`` -- number (default: 2). Seconds between polls if
+      inotify is not available.
+
+    - ``use_inotify`` -- boolean (default: ``True``). Whether to try
+      inotify at all.
+
+    EXAMPLES::
+
+        sage: import os
+        sage: from sageui.model.git_watcher import GitWatcher
+        sage: repo = test.new_git_repo()
+        sage: watcher = GitWatcher(repo.git, None, use_inotify=False)
+        sage: watcher.start();  watcher.backend
+        'polling'
+        sage: os.remove(os.path.join(repo.git.work_tree, 'foo1.txt'))
+        sage: os.mkdir(os.path.join(repo.git.work_tree, 'new_dir'))
+        sage: watcher.check()
+        GitWatcherEvent(refs=False, head=False, index=False, paths=frozenset(['foo1.txt']))
+        sage: with open(os.path.join(repo.git.work_tree, 'new_dir', 'new_file'), 'w') as f:
+        ....:     f.write('content')
+        sage: watcher.check()
+        GitWatcherEvent(refs=False, head=False, index=False, paths=frozenset(['new_dir/new_file']))
+        sage: repo.git.silent.add('new_dir/new_file')
+        sage: watcher.check()
+        GitWatcherEvent(refs=False, head=False, index=True, paths=frozenset([]))
+        sage: watcher.stop()
+    """
+
+    def __init__(self, git, callback, delay=0.2, interval=2, use_inotify=True):
+        self._git = git
+        self._callback = callback
+        self._delay = delay
+        self._interval = interval
+        self._use_inotify = use_inotify
+        self._git_dir = os.path.abspath(git.refs.git_dir)
+        self._work_tree = os.path.abspath(git.work_tree)
+        self.backend = None
+        self._inotify = None
+        self._watches = dict()
+        self._snapshot = None
+        self._sources = []
+        self._debounce_source = None
+        self._last_event = 0
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self._pending = False
+        self._refs = False
+        self._head = False
+        self._index = False
+        self._paths = set()
+
+    ###################################################################
+    # Classification of changed files
+
+    def _git_dir_changed(self, relpath):
+        """
+        Record a change of a file in the git directory
+        """
+        if relpath.endswith('.lock'):
+            return
+        if relpath == 'HEAD':
+            self._head = self._pending = True
+        elif relpath == 'index':
+            self._index = self._pending = True
+        elif relpath == 'packed-refs' or relpath.startswith('refs'):
+            self._refs = self._pending = True
+
+    def _path_changed(self, path):
+        """
+        Record a change of the file or directory ``path``
+        """
+        path = os.path.abspath(path)
+        git_dir = self._git_dir + os.sep
+        if path.startswith(git_dir):
+            self._git_dir_changed(path[len(git_dir):])
+            return
+        work_tree = self._work_tree + os.sep
+        if not path.startswith(work_tree):
+            return
+        relpath = path[len(work_tree):]
+        if relpath == '.git' or relpath.startswith('.git' + os.sep):
+            return
+        self._pending = True
+        if self._paths is not None:
+            self._paths.add(relpath)
+
+    def _everything_changed(self):
+        self._pending = self._refs = self._head = self._index = True
+        self._paths = None
+
+    def _event(self):
+        """
+        Return the pending event and reset
+        """
+        if not self._pending:
+            return None
+        paths = None if self._paths is None else frozenset(self._paths)
+        event = GitWatcherEvent(self._refs, self._head, self._index, paths)
+        self._reset_pending()
+        return event
+
+    ###################################################################
+    # Directories to watch
+
+    def _git_directories(self):
+        """
+        Return the directories in the git directory that are watched
+        """
+        result = [self._git_dir]
+        for dirpath, dirnames, filenames in os.walk(os.path.join(self._git_dir, 'refs')):
+            result.append(dirpath)
+        return result
+
+    def _work_tree_directories(self):
+        """
+        Return the directories that contain tracked files
+        """
+        records = self._git.execute_iter('ls-files', z=True)
+        result = set([self._work_tree])
+        for name in parse_ls_files(records):
+            dirname = os.path.dirname(name)
+            while dirname and dirname not in result:
+                result.add(dirname)
+                dirname = os.path.dirname(dirname)
+        return sorted(os.path.join(self._work_tree, d) for d in result)
+
+    ###################################################################
+    # inotify backend
+
+    def _start_inotify(self):
+        self._inotify = _Inotify()
+        try:
+            for directory in self._git_directories() + self._work_tree_directories():
+                self._inotify_add(directory)
+        except OSError:
+            self._stop_inotify()
+            raise
+
+    def _inotify_add(self, directory):
+        try:
+            wd = self._inotify.add_watch(directory, _WATCH_MASK)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                return   # already gone
+            raise
+        self._watches[wd] = directory
+
+    def _stop_inotify(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._watches.clear()
+
+    def _read_inotify(self):
+        for wd, mask, name in self._inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                self._everything_changed()
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_new_directory(path)
+                if not path.startswith(self._git_dir + os.sep):
+                    continue   # only report files
+            self._path_changed(path)
+
+    def _add_new_directory(self, path):
+        """
+        Watch a newly created directory and report the files in it
+        """
+        for dirpath, dirnames, filenames in os.walk(path):
+            if '.git' in dirnames:
+                dirnames.remove('.git')
+            try:
+                self._inotify_add(dirpath)
+            except OSError:
+                logging.warning('cannot watch %s, too many directories', dirpath)
+                self._everything_changed()
+            for name in filenames:
+                self._path_changed(os.path.join(dirpath, name))
+
+    ###################################################################
+    # Polling backend
+
+    def _stat_git(self):
+        try:
+            refs = self._git.refs.fingerprint()
+        except NotImplementedError:
+            refs = None
+        result = dict()
+        for name in ['HEAD', 'index']:
+            try:
+                st = os.stat(os.path.join(self._git_dir, name))
+                result[name] = (st.st_mtime, st.st_size, st.st_ino)
+            except OSError:
+                result[name] = None
+        result['refs'] = refs
+        return result
+
+    def _stat_directory(self, directory, files, directories):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        for name in names:
+            if name == '.git':
+                continue
+            path = os.path.join(directory, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                directories.add(path)
+            else:
+                files[path] = (st.st_mtime, st.st_size, st.st_mode)
+
+    def _take_snapshot(self, watched):
+        """
+        Return the snapshot of the watched directories
+        """
+        files = dict()
+        directories = set()
+        for directory in watched:
+            self._stat_directory(directory, files, directories)
+        return (self._stat_git(), files, directories)
+
+    def _start_polling(self):
+        self._polled = set(self._work_tree_directories())
+        self._snapshot = self._take_snapshot(self._polled)
+        self._known_directories = set(self._snapshot[2])
+
+    def _poll(self):
+        old_git, old_files, old_directories = self._snapshot
+        git, files, directories = snapshot = self._take_snapshot(self._polled)
+        new_directories = directories.difference(self._known_directories)
+        self._known_directories.intersection_update(directories)
+        self._known_directories.update(directories)
+        for directory in new_directories:
+            # created after the watcher started
+            for dirpath, dirnames, filenames in os.walk(directory):
+                if '.git' in dirnames:
+                    dirnames.remove('.git')
+                self._polled.add(dirpath)
+                self._known_directories.add(dirpath)
+                self._stat_directory(dirpath, files, set())
+        self._snapshot = snapshot
+        if git['HEAD'] != old_git['HEAD']:
+            self._git_dir_changed('HEAD')
+        if git['index'] != old_git['index']:
+            self._git_dir_changed('index')
+        if git['refs'] != old_git['refs']:
+            self._git_dir_changed('refs')
+        for path, stat in files.iteritems():
+            if old_files.get(path) != stat:
+                self._path_changed(path)
+        for path in old_files:
+            if path not in files:
+                self._path_changed(path)
+
+    ###################################################################
+    # Public interface
+
+    def start(self):
+        """
+        Start watching
+        """
+        if self.backend is not None:
+            return
+        self.backend = 'polling'
+        if self._use_inotify:
+            try:
+                self._start_inotify()
+                self.backend = 'inotify'
+            except OSError as e:
+                logging.info('inotify is not available, falling back to polling: %s', e)
+        if self.backend == 'polling':
+            self._start_polling()
+        cache = self._git.cache
+        cache.worktree_tracked = True
+        cache.touch_worktree()
+        # the references of a linked worktree are in the common
+        # directory, which is not watched
+        cache.refs_tracked = (os.path.abspath(self._git_dir) ==
+                              os.path.abspath(self._git.refs.common_dir))
+        cache.touch_refs()
+        self._add_main_loop_sources()
+
+    def stop(self):
+        """
+        Stop watching
+        """
+        if self.backend is None:
+            return
+        self._remove_main_loop_sources()
+        self._stop_inotify()
+        self._snapshot = None
+        self._reset_pending()
+        self.backend = None
+        self._git.cache.worktree_tracked = False
+        self._git.cache.refs_tracked = False
+
+    def check(self):
+        """
+        Look for changes now
+
+        This does not wait for the debounce delay and does not call
+        the callback.
+
+        OUTPUT:
+
+        A :class:`GitWatcherEvent` or ``None`` if nothing changed
+        since the last check.
+        """
+        self._collect()
+        return self._event()
+
+    def _collect(self):
+        if self.backend == 'inotify':
+            self._read_inotify()
+        elif self.backend == 'polling':
+            self._poll()
+        if self._pending:
+            self._last_event = time.time()
+            if self._paths is None or self._paths:
+                self._git.cache.touch_worktree()
+            if self._refs or self._head:
+                self._git.cache.touch_refs()
+
+    ###################################################################
+    # Main loop integration
+
+    def _add_main_loop_sources(self):
+        try:
+            import gobject
+        except ImportError:
+            return
+        if self.backend == 'inotify':
+            source = gobject.io_add_watch(self._inotify.fd, gobject.IO_IN, self._on_inotify)
+        else:
+            source = gobject.timeout_add(int(self._interval * 1000), self._on_poll)
+        self._sources.append(source)
+
+    def _remove_main_loop_sources(self):
+        if not self._sources and self._debounce_source is None:
+            return
+        import gobject
+        for source in self._sources:
+            gobject.source_remove(source)
+        del self._sources[:]
+        if self._debounce_source is not None:
+            gobject.source_remove(self._debounce_source)
+            self._debounce_source = None
+
+    def _on_inotify(self, fd, condition):
+        self._collect()
+        self._schedule()
+        return True
+
+    def _on_poll(self):
+        self._collect()
+        self._schedule()
+        return True
+
+    def _schedule(self):
+        if not self._pending or self._debounce_source is not None:
+            return
+        import gobject
+        self._debounce_source = gobject.timeout_add(int(self._delay * 1000), self._on_debounce)
+
+    def _on_debounce(self):
+        self._debounce_source = None
+        remaining = self._last_event + self._delay - time.time()
+        if remaining > 0:
+            import gobject
+            self._debounce_source = gobject.timeout_add(int(remaining * 1000) + 1, self._on_debounce)
+            return False
+        event = self._event()
+        if event is not None and self._callback is not None:
+            self._callback(event)
+        return False
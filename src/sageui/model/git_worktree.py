@@ -0,0 +1,321 @@
+r"""
+Worktrees for Ticket Branches
+
+Checking out another ticket branch in ``SAGE_ROOT`` touches many files
+and therefore forces a long rebuild of Sage. Instead, each ticket
+branch can be checked out in its own ``git worktree``. All worktrees
+share the object store and the branches of the main repository, but
+each has its own files and hence its own build.
+
+The :class:`GitWorktreeManager` creates, lists, removes, and prunes
+these worktrees. By default they are directories next to the main
+work tree, for example ``sage-worktrees/1002-public-anything`` for
+the managed branch ``sageui/1002/public/anything`` of ``sage``.
+
+EXAMPLES::
+
+    sage: import os
+    sage: repo = test.new_git_repo();  repo.git.silent.stash()
+    sage: manager = repo.worktrees
+    sage: manager.list()
+    [<GitWorktree .../git_repo on sageui/1002/public/anything>]
+    sage: worktree = manager.create_async('my_branch').wait()
+    sage: worktree
+    <GitWorktree .../git_repo-worktrees/my_branch on my_branch>
+    sage: len(manager.list())
+    2
+    sage: manager.disk_usage(worktree) > 0
+    True
+    sage: other = manager.open(worktree)
+    sage: other.current_branch()
+    Git branch my_branch
+    sage: other.git.git_dir == os.path.join(repo.git.git_dir, 'worktrees', 'my_branch')
+    True
+    sage: other.worktrees.directory == manager.directory
+    True
+
+A branch that is already checked out is not checked out again::
+
+    sage: manager.create_async('my_branch').wait() == worktree
+    True
+    sage: manager.find('sageui/1002/public/anything').is_main
+    True
+
+Worktrees that were deleted by hand are pruned::
+
+    sage: import shutil
+    sage: shutil.rmtree(worktree.path)
+    sage: manager.prune()
+    [<GitWorktree .../git_repo-worktrees/my_branch on my_branch>]
+    sage: manager.list()
+    [<GitWorktree .../git_repo on sageui/1002/public/anything>]
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import logging
+
+from git_async import GitDeferred
+
+
+class GitWorktree(object):
+    """
+    A worktree as listed by ``git worktree list``
+
+    INPUT:
+
+    - ``path`` -- string. The directory of the worktree.
+
+    - ``sha1`` -- string or ``None``. The commit that is checked out.
+
+    - ``branch`` -- string or ``None``. The full name of the branch
+      that is checked out, ``None`` if detached.
+
+    - ``is_main`` -- boolean. Whether this is the main worktree.
+
+    - ``locked``, ``prunable`` -- boolean.
+    """
+
+    def __init__(self, path, sha1=None, branch=None, is_main=False,
+                 locked=False, prunable=False):
+        self.path = path
+        self.sha1 = sha1
+        self.branch = branch
+        self.is_main = is_main
+        self.locked = locked
+        self.prunable = prunable
+
+    def __repr__(self):
+        return '<GitWorktree {0} on {1}>'.format(
+            self.path, 'detached HEAD' if self.branch is None else self.branch)
+
+    def __eq__(self, other):
+        return isinstance(other, GitWorktree) and self.path == other.path
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+def parse_worktree_list(output):
+    """
+    Parse the output of ``git worktree list --porcelain``
+
+    OUTPUT:
+
+    List of :class:`GitWorktree`, the main worktree first.
+    """
+    result = []
+    for block in output.strip().split('\n\n'):
+        fields = dict()
+        for line in block.splitlines():
+            key, _, value = line.partition(' ')
+            fields[key] = value
+        if 'worktree' not in fields:
+            continue
+        branch = fields.get('branch')
+        if branch is not None and branch.startswith('refs/heads/'):
+            branch = branch[len('refs/heads/'):]
+        result.append(GitWorktree(
+            fields['worktree'], fields.get('HEAD'), branch, is_main=not result,
+            locked='locked' in fields, prunable='prunable' in fields))
+    return result
+
+
+class GitWorktreeManager(object):
+    """
+    Create and manage the worktrees of a repository
+
+    You should not construct this yourself, use
+    :attr:`GitRepository.worktrees
+    <sageui.model.git_repository.GitRepository.worktrees>`.
+
+    INPUT:
+
+    - ``repository`` -- a
+      :class:`~sageui.model.git_repository.GitRepository`.
+
+    - ``directory`` -- string or ``None`` (default). The directory
+      where new worktrees are created. By default, the directory of
+      the main worktree with ``-worktrees`` appended.
+    """
+
+    def __init__(self, repository, directory=None):
+        self.repository = repository
+        self._directory = directory
+
+    @property
+    def directory(self):
+        """
+        The directory where new worktrees are created
+        """
+        if self._directory is None:
+            main = self.list()[0].path.rstrip(os.sep)
+            self._directory = main + '-worktrees'
+        return self._directory
+
+    def list(self):
+        """
+        Return all worktrees, the main worktree first
+        """
+        output = self.repository.git.worktree('list', '--porcelain')
+        return parse_worktree_list(output)
+
+    def find(self, branch_name):
+        """
+        Return the worktree where a branch is checked out, or ``None``
+
+        INPUT:
+
+        - ``branch_name`` -- string. The full name of the local branch.
+        """
+        for worktree in self.list():
+            if worktree.branch == branch_name:
+                return worktree
+        return None
+
+    def path(self, branch):
+        """
+        Return the directory for a new worktree of ``branch``
+
+        INPUT:
+
+        - ``branch`` -- a :class:`~sageui.model.git_branch.GitBranchABC`.
+        """
+        name = branch.full_branch_name
+        prefix = self.repository.prefix
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+        return os.path.join(self.directory, name.replace('/', '-'))
+
+    def create_async(self, branch_name, ticket_number=None, progress=None, timeout=None):
+        """
+        Check out a branch in its own worktree
+
+        The branch is downloaded first if necessary, like in
+        :meth:`GitRepository.checkout_branch_async
+        <sageui.model.git_repository.GitRepository.checkout_branch_async>`.
+        If the branch is already checked out in some worktree, then
+        that one is used.
+
+        INPUT:
+
+        - ``branch_name``, ``ticket_number``, ``progress``,
+          ``timeout`` -- see :meth:`GitRepository.checkout_branch_async
+          <sageui.model.git_repository.GitRepository.checkout_branch_async>`.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred` that will be
+        called back with the :class:`GitWorktree`.
+        """
+        repo = self.repository
+        git = repo.git
+        branch = repo._new_branch(branch_name, ticket_number)
+        name = branch.full_branch_name
+        worktree = self.find(name)
+        if worktree is not None:
+            d = GitDeferred()
+            d.callback(worktree)
+            return d
+        path = self.path(branch)
+        if git.refs.exists('refs/heads/'+name):
+            d = git.execute_async('worktree', 'add', path, name)
+        else:
+            logging.debug('downloading branch %s', name)
+            d = git.run_async('fetch', ('trac', branch_name), progress=progress, timeout=timeout)
+            d.add_callback(lambda _: git.execute_async('branch', name, 'FETCH_HEAD'))
+            d.add_callback(lambda _: git.execute_async('worktree', 'add', path, name))
+        return d.add_callback(lambda _: self.find(name))
+
+    def remove(self, worktree, force=False):
+        """
+        Delete a worktree, but not its branch
+
+        INPUT:
+
+        - ``worktree`` -- a :class:`GitWorktree`.
+
+        - ``force`` -- boolean (default: ``False``). Whether to delete
+          the worktree even if it has local modifications.
+        """
+        if worktree.is_main:
+            raise ValueError('cannot remove the main worktree')
+        args = ['remove', worktree.path]
+        if force:
+            args.insert(1, '--force')
+        self.repository.git.worktree(*args)
+
+    def prune(self):
+        """
+        Forget the worktrees whose directory was deleted
+
+        OUTPUT:
+
+        List of the pruned :class:`GitWorktree`.
+        """
+        pruned = [worktree for worktree in self.list() if worktree.prunable]
+        self.repository.git.worktree('prune')
+        return pruned
+
+    def disk_usage(self, worktree):
+        """
+        Return the disk space used by a worktree in bytes
+
+        This includes the build products in the worktree, but not the
+        shared git directory.
+
+        INPUT:
+
+        - ``worktree`` -- a :class:`GitWorktree`.
+        """
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(worktree.path):
+            if dirpath == worktree.path and '.git' in dirnames:
+                dirnames.remove('.git')
+            for name in dirnames + filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_blocks * 512
+                except OSError:
+                    pass
+        return total
+
+    def open(self, worktree):
+        """
+        Return the repository for a worktree
+
+        INPUT:
+
+        - ``worktree`` -- a :class:`GitWorktree`.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_repository.GitRepository` whose
+        work tree is the worktree.
+        """
+        from git_repository import GitRepository
+        repo = GitRepository(worktree.path, verbose=self.repository._verbose,
+                             cache_dir=self.repository._cache_dir)
+        # the configuration is shared between all worktrees
+        repo.git._user_email_set = self.repository.git._user_email_set
+        return repo
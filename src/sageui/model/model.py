@@ -21,12 +21,14 @@ The Data Model and Backend
 ##############################################################################
 
 
+import os
 import logging
 
 
 from config import Config
 from trac_server import TracServer
 from git_repository import GitRepository
+from rebuild_estimate import BuildTimes
 
 
 class Model:
@@ -38,11 +40,19 @@ class Model:
         self.trac = TracServer(c.trac_server_hostname,
                                c.trac_server_anonymous_xmlrpc)
         self.trac.database.load(c.sageui_directory)
-        self.repo = GitRepository(c.sage_root)
+        self.repo = GitRepository(c.sage_root, cache_dir=self.git_cache_directory)
+        self.build_times = BuildTimes()
+        self.build_times.load(c.sageui_directory)
     
 
+    @property
+    def git_cache_directory(self):
+        return os.path.join(self.config.sageui_directory, 'git_cache')
+
     def terminate(self):
         self.trac.database.save(self.config.sageui_directory)
+        self.build_times.save(self.config.sageui_directory)
+        self.repo.close()
 
     def sage_installation(self, sage_root):
         from sage_installation import SageInstallation
@@ -56,11 +66,77 @@ class Model:
         
     def checkout_branch(self, branch_name, ticket_number=None):
         logging.info('checking out {} {}'.format(str(branch_name), str(ticket_number)))
-        return self.repo.checkout_branch(branch_name, ticket_number)
+        return self.repo.checkout_branch(branch_name, ticket_number,
+                                         timeout=self.config.git_network_timeout,
+                                         preserve_mtimes=self.config.git_preserve_mtimes)
+
+    def checkout_branch_async(self, branch_name, ticket_number=None, progress=None):
+        logging.info('checking out {} {}'.format(str(branch_name), str(ticket_number)))
+        if not self.config.git_worktrees:
+            return self.repo.checkout_branch_async(
+                branch_name, ticket_number, progress=progress,
+                timeout=self.config.git_network_timeout,
+                preserve_mtimes=self.config.git_preserve_mtimes)
+        d = self.repo.worktrees.create_async(branch_name, ticket_number, progress=progress,
+                                             timeout=self.config.git_network_timeout)
+        return d.add_callback(self._open_worktree)
+
+    def rebuild_estimate_async(self, branch_name, ticket_number=None):
+        """
+        Estimate the rebuild after checking out a branch
+
+        Only branches that exist locally or as remote-tracking branch
+        ``refs/remotes/trac/...`` are estimated. Nothing is fetched,
+        since this is called whenever a ticket is selected; branches
+        that were not downloaded yet are fetched by the checkout.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred` that will be
+        called back with the
+        :class:`~sageui.model.rebuild_estimate.RebuildEstimate`, or
+        with ``None`` if the branch was not downloaded yet or if
+        branches are checked out in their own worktree (which have
+        their own builds).
+        """
+        from git_async import GitDeferred
+        from git_commit import GitCommit
+        repo = self.repo
+        refs = repo.git.refs
+        if not self.config.git_worktrees:
+            branch = repo._new_branch(branch_name, ticket_number)
+            if refs.exists('refs/heads/' + branch.full_branch_name):
+                return repo.rebuild_estimate_async(branch.commit, self.build_times)
+            sha1 = refs.resolve('refs/remotes/trac/' + branch_name)
+            if sha1 is not None:
+                return repo.rebuild_estimate_async(GitCommit(repo, sha1), self.build_times)
+        d = GitDeferred()
+        d.callback(None)
+        return d
+
+    def _open_worktree(self, worktree):
+        """
+        Switch :attr:`repo` to ``worktree`` and return its current branch
+        """
+        if os.path.realpath(worktree.path) != os.path.realpath(self.work_tree):
+            self.repo.close()
+            self.repo = self.repo.worktrees.open(worktree)
+        return self.repo.current_branch()
+
+    @property
+    def work_tree(self):
+        """
+        The directory that the git and commandline windows work in
+        """
+        return self.repo.repo_path
+
+    def list_worktrees(self):
+        return self.repo.worktrees.list()
 
 
     ###################################################################
     # Handle configuration change
 
     def config_sage_changed(self):
-        self.repo = GitRepository(self.config.sage_root)
+        self.repo.close()
+        self.repo = GitRepository(self.config.sage_root, cache_dir=self.git_cache_directory)
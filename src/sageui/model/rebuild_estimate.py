@@ -0,0 +1,504 @@
+r"""
+Estimate the Rebuild after Switching Branches
+
+Checking out another branch changes the files in ``SAGE_ROOT``, and
+Sage has to be rebuilt. How long that takes depends on what changed:
+
+* Python files only need to be copied and byte-compiled,
+
+* every changed Cython/C source requires to recompile the extension
+  module and all modules that ``cimport`` or include it, directly or
+  through other ``.pxd``/``.pxi`` files,
+
+* changes to the build system (``module_list.py``, ``setup.py``,
+  Makefiles, packages) usually require a full ``make``,
+
+* documentation changes do not require a rebuild of the library.
+
+The :class:`RebuildEstimate` classifies the files that differ between
+two commits accordingly, lists the affected extension modules, and
+estimates the rebuild time. The time per extension module can be
+weighted by the :class:`BuildTimes` recorded in previous builds.
+
+EXAMPLES::
+
+    sage: import os
+    sage: repo = test.new_git_repo();  repo.git.silent.stash()
+    sage: def write(path, content):
+    ....:     path = os.path.join(repo.git.work_tree, path)
+    ....:     if not os.path.isdir(os.path.dirname(path)):
+    ....:         os.makedirs(os.path.dirname(path))
+    ....:     with open(path, 'w') as f:
+    ....:         f.write(content)
+    sage: write('src/sage/rings/integer.pyx', 'cdef class Integer: pass\n')
+    sage: write('src/sage/rings/integer.pxd', 'cdef class Integer: pass\n')
+    sage: write('src/sage/rings/rational.pyx', 'from sage.rings.integer cimport Integer\n')
+    sage: write('src/sage/rings/real.pxd', 'from .integer cimport Integer\n')
+    sage: write('src/sage/rings/real.pyx', 'pass\n')
+    sage: write('src/sage/rings/complex.pyx', 'cimport sage.rings.real as real\n')
+    sage: write('src/sage/rings/integer_ring.pyx', 'import sage.rings.integer\n'
+    ....:       'from sage.rings.integer_ring_base cimport Base\n')
+    sage: write('src/sage/misc/misc.py', 'pass\n')
+    sage: repo.git.silent.add('src')
+    sage: repo.git.silent.commit(message='add sources')
+    sage: old = repo.head
+    sage: write('src/sage/rings/integer.pxd', 'cdef class Integer:\n    cdef int x\n')
+    sage: write('src/sage/misc/misc.py', 'x = 1\n')
+    sage: repo.git.silent.commit(all=True, message='change sources')
+
+Going back to the old commit recompiles the changed module and the
+modules that ``cimport`` it, also through ``real.pxd``. A Python
+``import`` does not count::
+
+    sage: estimate = repo.rebuild_estimate(old)
+    sage: estimate
+    <RebuildEstimate: 1 Python, 1 Cython/C, 0 build system, 0 docs files>
+    sage: estimate.extension_modules
+    ['sage.rings.complex', 'sage.rings.integer', 'sage.rings.rational', 'sage.rings.real']
+    sage: estimate.summary()
+    'Rebuild 4 extension modules, about 2 minutes'
+
+Recorded build times replace the default guess per module::
+
+    sage: from sageui.model.rebuild_estimate import BuildTimes
+    sage: times = BuildTimes()
+    sage: times.record('sage.rings.rational', 300)
+    sage: repo.rebuild_estimate(old, times).summary()
+    'Rebuild 4 extension modules, about 7 minutes'
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import os
+import re
+import cPickle
+
+from git_error import GitError
+
+
+# The categories of changed files
+PYTHON, CYTHON, BUILD, DOCS, OTHER = 'python', 'cython', 'build', 'docs', 'other'
+
+_CATEGORY_NAMES = (
+    (PYTHON, 'Python'),
+    (CYTHON, 'Cython/C'),
+    (BUILD, 'build system'),
+    (DOCS, 'docs'),
+)
+
+_CYTHON_EXTENSIONS = ('.pyx', '.pxd', '.pxi', '.c', '.cc', '.cpp', '.h', '.hh', '.hpp')
+
+_BUILD_NAMES = ('module_list.py', 'setup.py', 'setup.cfg', 'Makefile', 'Makefile.am',
+                'Makefile.in', 'configure', 'configure.ac', 'deps')
+
+_BUILD_DIRECTORIES = ('build/', 'spkg/', 'm4/')
+
+_DOCS_DIRECTORIES = ('doc/', 'src/doc/', 'devel/sage/doc/')
+
+_DOCS_EXTENSIONS = ('.rst', '.txt')
+
+# Default guesses in seconds
+_PYTHON_SECONDS = 0.2
+_EXTENSION_SECONDS = 30
+_FULL_REBUILD_SECONDS = 2 * 3600
+
+
+def classify(path):
+    """
+    Return the category of a file in the Sage tree
+
+    INPUT:
+
+    - ``path`` -- string. The path relative to ``SAGE_ROOT``.
+
+    OUTPUT:
+
+    One of the constants ``PYTHON``, ``CYTHON``, ``BUILD``, ``DOCS``,
+    or ``OTHER``.
+
+    EXAMPLES::
+
+        sage: from sageui.model.rebuild_estimate import classify
+        sage: [classify(path) for path in ['src/sage/all.py', 'src/sage/rings/integer.pyx',
+        ....:     'src/module_list.py', 'build/pkgs/pari/package-version.txt',
+        ....:     'src/doc/en/index.rst', 'COPYING.txt', 'foo.png']]
+        ['python', 'cython', 'build', 'build', 'docs', 'docs', 'other']
+    """
+    basename = os.path.basename(path)
+    if basename in _BUILD_NAMES or path.startswith(_BUILD_DIRECTORIES):
+        return BUILD
+    if path.startswith(_DOCS_DIRECTORIES):
+        return DOCS
+    ext = os.path.splitext(basename)[1]
+    if ext == '.py':
+        return PYTHON
+    if ext in _CYTHON_EXTENSIONS:
+        return CYTHON
+    if ext in _DOCS_EXTENSIONS:
+        return DOCS
+    return OTHER
+
+
+def module_name(path):
+    """
+    Return the dotted module name of a source file or ``None``
+
+    EXAMPLES::
+
+        sage: from sageui.model.rebuild_estimate import module_name
+        sage: module_name('src/sage/rings/integer.pyx')
+        'sage.rings.integer'
+        sage: module_name('README.txt') is None
+        True
+    """
+    parts = path.split('/')
+    try:
+        start = parts.index('sage')
+    except ValueError:
+        return None
+    parts = parts[start:]
+    parts[-1] = os.path.splitext(parts[-1])[0]
+    return '.'.join(parts)
+
+
+class BuildTimes(object):
+    """
+    The build times of the extension modules
+
+    The time to compile an extension module varies between a few
+    seconds and several minutes. Recorded times are used instead of
+    the default guess in :class:`RebuildEstimate`.
+    """
+
+    def __init__(self):
+        self._data = dict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def record(self, module, seconds):
+        """
+        Record the time to compile an extension module
+
+        INPUT:
+
+        - ``module`` -- string. The dotted module name.
+
+        - ``seconds`` -- number.
+        """
+        self._data[module] = seconds
+
+    def get(self, module, default=None):
+        """
+        Return the recorded seconds or ``default``
+        """
+        return self._data.get(module, default)
+
+    def save(self, directory_name):
+        filename = os.path.join(directory_name, 'build_times.pickle')
+        try:
+            with open(filename, 'wb') as pickle:
+                cPickle.dump(self._data, pickle)
+            return True
+        except (IOError, OSError, cPickle.PicklingError, TypeError):
+            return False
+
+    def load(self, directory_name):
+        filename = os.path.join(directory_name, 'build_times.pickle')
+        try:
+            with open(filename, 'rb') as pickle:
+                self._data = cPickle.load(pickle)
+            return True
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError, TypeError):
+            self._data = dict()
+            return False
+
+
+# The Cython sources that can be cimported or included
+_CYTHON_SOURCES = ('*.pyx', '*.pxd', '*.pxi')
+
+# Lines of Cython sources that make them depend on other files, for git grep -E
+_DEPENDENCY_PATTERN = (
+    '^[[:space:]]*(cimport[[:space:]]|from[[:space:]]+[.[:alnum:]_]+[[:space:]]+cimport[[:space:]]'
+    '|include[[:space:]]|cdef[[:space:]]+extern[[:space:]]+from[[:space:]])')
+
+_CIMPORT = re.compile(r'^\s*cimport\s+(.*)$')
+_FROM_CIMPORT = re.compile(r'^\s*from\s+([.\w]+)\s+cimport\s+(.*)$')
+_INCLUDE = re.compile(r'''^\s*(?:include|cdef\s+extern\s+from)\s+['"]([^'"]+)['"]''')
+
+
+def _imported_names(text):
+    """
+    Return the dotted names in the list of a ``cimport`` statement
+
+    EXAMPLES::
+
+        sage: from sageui.model.rebuild_estimate import _imported_names
+        sage: _imported_names('(a.b as c, d,  # comment')
+        ['a.b', 'd']
+    """
+    text = text.split('#', 1)[0].replace('(', ' ').replace(')', ' ')
+    result = []
+    for item in text.split(','):
+        words = item.split()
+        if words:
+            result.append(words[0])
+    return result
+
+
+def _absolute_module(name, path):
+    """
+    Resolve a relative module name in a ``cimport`` of the file ``path``
+
+    EXAMPLES::
+
+        sage: from sageui.model.rebuild_estimate import _absolute_module
+        sage: _absolute_module('.integer', 'src/sage/rings/real.pxd')
+        'sage.rings.integer'
+        sage: _absolute_module('..misc.misc', 'src/sage/rings/real.pxd')
+        'sage.misc.misc'
+        sage: _absolute_module('sage.rings.integer', 'foo.pyx')
+        'sage.rings.integer'
+    """
+    if not name.startswith('.'):
+        return name
+    this = module_name(path)
+    if this is None:
+        return None
+    level = len(name) - len(name.lstrip('.'))
+    package = this.split('.')[:-level]
+    rest = name.lstrip('.')
+    return '.'.join(package + [rest] if rest else package)
+
+
+class CythonDependencies(object):
+    """
+    The ``cimport`` and ``include`` graph of the Cython sources
+
+    You should not construct this yourself, use
+    :meth:`GitRepository.rebuild_estimate
+    <sageui.model.git_repository.GitRepository.rebuild_estimate>`.
+
+    EXAMPLES::
+
+        sage: from sageui.model.rebuild_estimate import CythonDependencies
+        sage: deps = CythonDependencies()
+        sage: deps.add('src/sage/a.pxd', 'from sage.b cimport B')
+        sage: deps.add('src/sage/c.pyx', 'cimport sage.a')
+        sage: deps.add('src/sage/d.pyx', 'include "sage/e.pxi"')
+        sage: deps.add('src/sage/f.pyx', 'import sage.b')
+        sage: sorted(deps.affected_modules(['src/sage/b.pxd', 'src/sage/e.pxi']))
+        ['sage.a', 'sage.b', 'sage.c', 'sage.d']
+    """
+
+    def __init__(self):
+        # module name -> set of files that cimport it
+        self._modules = dict()
+        # included file -> set of files that include it
+        self._files = dict()
+
+    @classmethod
+    def parse(cls, output, commit=None):
+        """
+        Construct the graph from the output of ``git grep``
+
+        INPUT:
+
+        - ``output`` -- string. The lines of ``git grep`` matching
+          :data:`_DEPENDENCY_PATTERN`.
+
+        - ``commit`` -- the commit that was searched or ``None``.
+        """
+        result = cls()
+        prefix = '' if commit is None else str(commit) + ':'
+        for line in output.splitlines():
+            if prefix and line.startswith(prefix):
+                line = line[len(prefix):]
+            try:
+                path, text = line.split(':', 1)
+            except ValueError:
+                continue
+            result.add(path, text)
+        return result
+
+    def add(self, path, line):
+        """
+        Add the dependencies of a line of the Cython file ``path``
+        """
+        match = _FROM_CIMPORT.match(line)
+        if match is not None:
+            package = _absolute_module(match.group(1), path)
+            if package is None:
+                return
+            # the names can be submodules of the package or declarations in it
+            names = [package] + [package + '.' + name for name in _imported_names(match.group(2))]
+            for name in names:
+                self._modules.setdefault(name, set()).add(path)
+            return
+        match = _CIMPORT.match(line)
+        if match is not None:
+            for name in _imported_names(match.group(1)):
+                name = _absolute_module(name, path)
+                if name is not None:
+                    self._modules.setdefault(name, set()).add(path)
+            return
+        match = _INCLUDE.match(line)
+        if match is not None:
+            included = match.group(1)
+            self._files.setdefault(included, set()).add(path)
+            relative = os.path.normpath(os.path.join(os.path.dirname(path), included))
+            self._files.setdefault(relative, set()).add(path)
+
+    def dependents(self, path):
+        """
+        Return the files that directly cimport or include ``path``
+        """
+        result = set()
+        if path.endswith('.pxd'):
+            result.update(self._modules.get(module_name(path), ()))
+        for included, files in self._files.iteritems():
+            if path == included or path.endswith('/' + included):
+                result.update(files)
+        return result
+
+    def affected_modules(self, paths):
+        """
+        Return the extension modules that must be recompiled if ``paths`` change
+
+        INPUT:
+
+        - ``paths`` -- list of strings. The changed Cython/C sources.
+
+        OUTPUT:
+
+        Set of dotted module names.
+        """
+        modules = set()
+        seen = set(paths)
+        queue = list(paths)
+        while queue:
+            path = queue.pop()
+            name = module_name(path)
+            if name is not None and os.path.splitext(path)[1] in ('.pyx', '.pxd'):
+                modules.add(name)
+            for dependent in self.dependents(path):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    queue.append(dependent)
+        return modules
+
+
+def dependency_query(commit):
+    """
+    Return the arguments of the ``git grep`` for :meth:`CythonDependencies.parse`
+    """
+    return ['-I', '-E', '-e', _DEPENDENCY_PATTERN, str(commit), '--'] + list(_CYTHON_SOURCES)
+
+
+def cython_dependencies_async(git, commit):
+    """
+    Find the :class:`CythonDependencies` of the sources at ``commit``
+
+    OUTPUT:
+
+    A :class:`~sageui.model.git_async.GitDeferred` that will be
+    called back with the :class:`CythonDependencies`.
+    """
+    def no_match(error):
+        if isinstance(error, GitError) and error.exit_code == 1:
+            return ''
+        raise error
+    d = git.run_async('grep', dependency_query(commit))
+    d.add_errback(no_match)
+    return d.add_callback(lambda output: CythonDependencies.parse(output, commit))
+
+
+def _format_seconds(seconds):
+    if seconds < 60:
+        return 'less than a minute'
+    if seconds < 3600:
+        n, unit = int(round(seconds / 60.0)), 'minute'
+    else:
+        n, unit = int(round(seconds / 3600.0)), 'hour'
+    return 'about {0} {1}{2}'.format(n, unit, '' if n == 1 else 's')
+
+
+class RebuildEstimate(object):
+    """
+    The rebuild that is necessary after checking out another commit
+
+    You should not construct this yourself, use
+    :meth:`GitRepository.rebuild_estimate
+    <sageui.model.git_repository.GitRepository.rebuild_estimate>`.
+
+    INPUT:
+
+    - ``target`` -- a :class:`~sageui.model.git_commit.GitCommit`. The
+      commit that will be checked out.
+
+    - ``paths`` -- list of strings. The files that differ.
+
+    - ``dependencies`` -- a :class:`CythonDependencies`. The
+      dependencies between the Cython sources at ``target``.
+
+    - ``build_times`` -- a :class:`BuildTimes` or ``None`` (default).
+    """
+
+    def __init__(self, target, paths, dependencies, build_times=None):
+        self.target = target
+        self.files = dict((category, []) for category in (PYTHON, CYTHON, BUILD, DOCS, OTHER))
+        for path in paths:
+            self.files[classify(path)].append(path)
+        self.extension_modules = sorted(dependencies.affected_modules(self.files[CYTHON]))
+        self.full_rebuild = bool(self.files[BUILD])
+        if self.full_rebuild:
+            self.seconds = _FULL_REBUILD_SECONDS
+        else:
+            if build_times is None:
+                build_times = BuildTimes()
+            self.seconds = _PYTHON_SECONDS * len(self.files[PYTHON]) + sum(
+                build_times.get(name, _EXTENSION_SECONDS) for name in self.extension_modules)
+
+    @property
+    def requires_compilation(self):
+        """
+        Whether any extension module has to be compiled
+        """
+        return self.full_rebuild or bool(self.extension_modules)
+
+    def __repr__(self):
+        counts = ', '.join('{0} {1}'.format(len(self.files[category]), name)
+                           for category, name in _CATEGORY_NAMES)
+        return '<RebuildEstimate: {0} files>'.format(counts)
+
+    def summary(self):
+        """
+        Return a one-line description for the user
+        """
+        if self.full_rebuild:
+            return 'Full rebuild, the build system changed, {0}'.format(
+                _format_seconds(self.seconds))
+        n = len(self.extension_modules)
+        if n > 0:
+            return 'Rebuild {0} extension module{1}, {2}'.format(
+                n, '' if n == 1 else 's', _format_seconds(self.seconds))
+        if self.files[PYTHON]:
+            return 'Only Python files changed, no compilation'
+        return 'No rebuild needed'
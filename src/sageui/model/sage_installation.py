@@ -23,7 +23,7 @@ Query data about an existing Sage install
 
 import os
 import subprocess
-from sageui.misc.cached_property import cached_property
+from sageui.misc.cached_property import cached_property, dependent_cached_property
 
 class SageInstallation(object):
     
@@ -55,7 +55,21 @@ class SageInstallation(object):
         assert self.is_usable
         return os.path.isdir(os.path.join(self.sage_root, '.git'))
 
-    @cached_property
+    def generation(self, dependency):
+        """
+        Return a token that changes whenever ``dependency`` changes
+
+        The only dependency is ``'version'``, which changes when Sage
+        is upgraded or another branch is checked out.
+        """
+        assert dependency == 'version'
+        try:
+            st = os.stat(os.path.join(self.sage_root, 'VERSION.txt'))
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    @dependent_cached_property('version')
     def version(self):
         assert self.is_usable
         try:
@@ -29,6 +29,7 @@ import cPickle
 import os
 
 from trac_ticket import TracTicket, TracTicket_class
+from diagnostics import diagnostics
 
 
 
@@ -36,6 +37,17 @@ class TracDatabase(object):
 
     def __init__(self):
         self._data = dict()
+        diagnostics.register('trac tickets', self)
+
+    def statistics(self):
+        """
+        Return the number of tickets
+
+        OUTPUT:
+
+        Dictionary.
+        """
+        return {'size': len(self._data)}
 
     def save(self, directory_name):
         filename = os.path.join(directory_name,
@@ -41,6 +41,8 @@ EXAMPLES::
 
 from datetime import datetime
 
+from diagnostics import diagnostics
+
 def make_time(time):
     """
     Convert xmlrpc DateTime objects to datetime.datetime
@@ -117,6 +119,7 @@ def TracTicket(ticket_number, server_proxy):
     return ticket
 
 
+@diagnostics.track
 class TracTicket_class(object):
     
     def __init__(self, number, ctime, mtime, data, change_log=None):
@@ -25,12 +25,26 @@ about data nor about the gui, it just ties the two together.
 ##############################################################################
 
 
+import logging
+
 from model.trac_error import TracError
+from model.git_error import GitCancelledError
 
 
 class Presenter(object):
 
     def __init__(self, view_class, model_class):
+        self._pending_changes = None
+        self._pending_checkout = None
+        self._pending_untracked = None
+        self._pending_estimate = None
+        # ((branch_name, ticket_number), deferred) of the last estimate
+        self._estimate = None
+        # the estimate that a checkout is waiting for
+        self._checkout_estimate = None
+        # watcher events that arrived while the changes were computed
+        self._missed_paths = set()
+        self._missed_index = False
         self.view = view_class(self)
         self.model = model_class(self)
         if self.model.config.sage_root is None:
@@ -60,7 +74,7 @@ class Presenter(object):
     # The window containing the commandline terminal
 
     def show_commandline_window(self):
-        return self.view.show_commandline_window(self.model.config.sage_root, 'sage')
+        return self.view.show_commandline_window(self.model.work_tree, 'sage')
 
     def hide_commandline_window(self):
         self.view.hide_commandline_window()
@@ -71,27 +85,225 @@ class Presenter(object):
     # The git window
 
     def show_git_window(self):
-        return self.view.show_git_window(self.model.config.sage_root)
+        self.model.repo.watch(self.git_repository_changed)
+        return self.view.show_git_window(self.model.work_tree)
 
     def hide_git_window(self):
+        self.model.repo.unwatch()
         self.view.hide_git_window()
         if not self.view.have_open_window():
             self.terminate()
 
     def show_current_branch(self):
-        local_branches = self.model.list_branches()
-        current_branch = self.model.current_branch()
-        self.view.set_git_branches(local_branches, current_branch)
+        overview = self.model.repo.overview(untracked=False)
+        current_branch = overview.current_branch
+        self.view.set_git_branches(overview.branches, current_branch, overview.history)
+        if current_branch is not None:
+            self._pending_changes = None
+            self._forget_missed_changes()
+            self.model.repo.base_commit = current_branch.commit
+            self.view.set_git_base_commit(current_branch.commit, overview.changes)
+            self.scan_untracked()
+
+    def scan_untracked(self):
+        """
+        Add the untracked files to the displayed changes as they are found
+        """
+        if self._pending_untracked is not None:
+            self._pending_untracked.cancel()
+        d = self.model.repo.scan_untracked_async(self.view.update_git_changed_files)
+        self._pending_untracked = d
+        def done(result):
+            if self._pending_untracked is d:
+                self._pending_untracked = None
+            return result
+        d.add_both(done)
+        d.add_errback(self._git_error)
+
+    def git_repository_changed(self, event):
+        """
+        Update the git window after the repository changed on disk
+
+        INPUT:
+
+        - ``event`` -- a :class:`~sageui.model.git_watcher.GitWatcherEvent`.
+        """
+        if self._pending_checkout is not None:
+            return   # everything is redisplayed when the checkout is finished
+        if event.refs or event.head or event.paths is None:
+            self.show_current_branch()
+        elif self._pending_changes is not None:
+            # the pending changes might predate the event, update when they arrive
+            self._missed_index = self._missed_index or event.index
+            self._missed_paths.update(event.paths)
+        else:
+            self._update_changes(event.index, event.paths)
+
+    def _update_changes(self, index, paths):
+        """
+        Update the displayed changes after a change of the index or of some files
+        """
+        # staging can change the state of any file, edits only that of the paths
+        if index:
+            delta = self.model.repo.update_changes(untracked=False)
+            self.view.update_git_changed_files(delta)
+            self.scan_untracked()
+        elif paths:
+            delta = self.model.repo.update_changes(sorted(paths))
+            self.view.update_git_changed_files(delta)
+
+    def _forget_missed_changes(self):
+        self._missed_paths = set()
+        self._missed_index = False
+
+    def estimate_rebuild(self, branch_name, ticket_number=None):
+        """
+        Start estimating the rebuild after checking out a branch
+
+        Called when a branch or ticket is selected, so that the
+        estimate is usually known when the checkout is requested.
+
+        OUTPUT:
+
+        A :class:`~sageui.model.git_async.GitDeferred` that will be
+        called back with the
+        :class:`~sageui.model.rebuild_estimate.RebuildEstimate` or
+        ``None``, also if the estimate failed. It is shared with
+        later calls for the same branch, so callbacks must return
+        their argument.
+        """
+        key = (branch_name, ticket_number)
+        if self._estimate is not None and self._estimate[0] == key:
+            return self._estimate[1]
+        if self._pending_estimate not in (None, self._checkout_estimate):
+            self._pending_estimate.cancel()
+        d = self.model.rebuild_estimate_async(branch_name, ticket_number)
+        self._pending_estimate = d
+        self._estimate = (key, d)
+        def failed(error):
+            logging.info('cannot estimate the rebuild: %s', error)
+            if self._estimate is not None and self._estimate[1] is d:
+                self._estimate = None   # try again next time
+            return None
+        def done(estimate):
+            if self._pending_estimate is d:
+                self._pending_estimate = None
+            if estimate is None and self._estimate is not None and self._estimate[1] is d:
+                self._estimate = None   # maybe the branch is downloaded next time
+            return estimate
+        return d.add_errback(failed).add_callback(done)
 
     def checkout_branch(self, branch_name, ticket_number=None):
-        branch = self.model.checkout_branch(branch_name, ticket_number)
+        """
+        Check out a branch after showing the rebuild estimate
+
+        If the checkout requires compiling extension modules, the user
+        is asked to confirm it first.
+        """
+        self.cancel_git()
+        d = self.estimate_rebuild(branch_name, ticket_number)
+        self._checkout_estimate = d
+        self.view.set_git_busy(True)
+        def estimated(estimate):
+            if self._checkout_estimate is not d:
+                return estimate   # cancelled
+            self._checkout_estimate = None
+            self.view.set_git_busy(False)
+            self.view.set_git_rebuild_estimate(estimate)
+            if estimate is None or not estimate.requires_compilation:
+                self._start_checkout(branch_name, ticket_number, estimate)
+                return estimate
+            def confirmed(ok):
+                if ok:
+                    self._start_checkout(branch_name, ticket_number, estimate)
+                else:
+                    self.show_current_branch()
+            self.view.new_confirm_dialog(
+                self.view.git_window, 'Check out {0}?'.format(branch_name),
+                estimate.summary(), confirmed).show()
+            return estimate
+        d.add_callback(estimated)
+
+    def _start_checkout(self, branch_name, ticket_number, estimate):
+        repo = self.model.repo
+        d = self.model.checkout_branch_async(branch_name, ticket_number,
+                                             progress=self.view.set_git_progress)
+        self._pending_checkout = d
+        self._estimate = None   # the estimate is relative to the current head
+        self.view.set_git_busy(True)
+        def done(result):
+            if self._pending_checkout is d:
+                self._pending_checkout = None
+                self.view.set_git_busy(False)
+            return result
+        d.add_both(done)
+        def finished(branch):
+            if self.model.repo is not repo:
+                self.worktree_changed()
+            self._checkout_branch_finished(branch)
+            self.view.set_git_rebuild_estimate(estimate)
+        d.add_callbacks(finished, self._git_error)
+
+    def worktree_changed(self):
+        """
+        Show the work tree that the branch was checked out in
+
+        Called when the branch was checked out in its own worktree,
+        see :meth:`Config.git_worktrees
+        <sageui.model.config.Config.git_worktrees>`.
+        """
+        self.model.repo.watch(self.git_repository_changed)
+        self.view.set_git_work_tree(self.model.work_tree)
+
+    def cancel_git(self):
+        """
+        Stop downloading a branch
+        """
+        if self._checkout_estimate is not None:
+            # the estimate itself goes on, it is kept for the next time
+            self._checkout_estimate = None
+            self.view.set_git_busy(False)
+        if self._pending_checkout is not None:
+            self._pending_checkout.cancel()
+
+    def _checkout_branch_finished(self, branch):
         branches = self.model.list_branches()
         self.view.set_git_branches(branches, branch)
+        self.base_commit_selected(branch.commit)
 
     def base_commit_selected(self, base_commit):
         repo = self.model.repo
         repo.base_commit = base_commit
-        self.view.set_git_base_commit(repo.base_commit, repo.changes())
+        d = repo.changes_async(untracked=False)
+        self._pending_changes = d
+        self._forget_missed_changes()
+        def finished(changes):
+            if self._pending_changes is not d:
+                return   # user has already selected another base commit
+            self._pending_changes = None
+            self.view.set_git_base_commit(base_commit, changes)
+            self.scan_untracked()
+            index, paths = self._missed_index, self._missed_paths
+            self._forget_missed_changes()
+            self._update_changes(index, paths)
+        def failed(error):
+            if self._pending_changes is d:
+                self._pending_changes = None
+                self._forget_missed_changes()
+            self._git_error(error)
+        d.add_callbacks(finished, failed)
+
+    def refresh_git(self, base_commit):
+        """
+        Redisplay the changes, the work tree might have been edited
+        """
+        self.model.repo.git.cache.touch_worktree()
+        self.base_commit_selected(base_commit)
+
+    def _git_error(self, error):
+        if isinstance(error, GitCancelledError) and error.timeout is None:
+            return   # the user cancelled, nothing to report
+        self.show_error(self.view.git_window, 'Git error', str(error))
 
     def git_file_selected(self, git_file):
         self.view.set_git_file(git_file)
@@ -142,6 +354,8 @@ class Presenter(object):
         ticket = self.model.trac.get_current_ticket()
         self.view.trac_window.set_current_ticket(ticket)
         self.view.trac_window.display_ticket(ticket)
+        if ticket is not None and ticket.get_branch():
+            self.estimate_rebuild(ticket.get_branch(), ticket.get_number())
     
     def load_ticket(self, ticket_number, use_cache=False):
         if not (use_cache and self.model.trac.is_cached(ticket_number)):
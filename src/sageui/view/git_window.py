@@ -35,6 +35,7 @@ import pango
 from window import Window
 from buildable import Buildable
 from diff_viewer_widget import DiffViewerWidget
+from history_model import HistoryModel
 
 import logging
 
@@ -44,18 +45,19 @@ class GitWindow(Buildable, Window):
     def __init__(self, presenter, glade_file):
         self.presenter = presenter
         Buildable.__init__(self, ['git_window',
-                                  'git_tool_remote', 'git_tool_refresh', 
+                                  'git_tool_remote', 'git_tool_refresh', 'git_tool_stop',
                                   'git_tool_branch', 'git_tool_ticket',
                                   'git_branch_entry', 'git_branch_store',
                                   'git_files_view', 'git_files_store',
                                   'git_base_view', 'git_base_store',
-                                  'git_diff'])
+                                  'git_diff', 'git_statusbar'])
         builder = self.get_builder(glade_file)
         Window.__init__(self, builder, 'git_window')
         self.toolbar_remote = builder.get_object('git_tool_remote')
         self.toolbar_branch = builder.get_object('git_tool_branch')
         self.toolbar_ticket = builder.get_object('git_tool_ticket')
         self.toolbar_refresh = builder.get_object('git_tool_refresh')
+        self.toolbar_stop = builder.get_object('git_tool_stop')
         self.branch_entry = builder.get_object('git_branch_entry')
         self.branch_store = builder.get_object('git_branch_store')
         self._init_branch(self.branch_entry, self.branch_store)
@@ -66,11 +68,14 @@ class GitWindow(Buildable, Window):
         self.base_store = builder.get_object('git_base_store')
         self._init_base(self.base_view, self.base_store)
         self.diff = builder.get_object('git_diff')
+        self.statusbar = builder.get_object('git_statusbar')
+        self.statusbar_context = self.statusbar.get_context_id('git')
         builder.connect_signals(self)
         self.repo_path = None
         self._branch_entry_ignore_next_change = False
         self._base_view_ignore_next_change = False
         self.set_ticket_number(None)
+        self.set_busy(False)
 
     def _init_branch(self, view, store):
         branch = view.get_cells()[0]
@@ -84,6 +89,10 @@ class GitWindow(Buildable, Window):
         view.set_entry_text_column(1)
 
     def _init_base(self, view, store):
+        # in list mode, only the visible rows of the history are loaded
+        view.set_name('git_base_view')
+        gtk.rc_parse_string('style "sageui-list-combo" { GtkComboBox::appears-as-list = 1 }\n'
+                            'widget "*.git_base_view" style "sageui-list-combo"')
         name = gtk.CellRendererText()
         view.pack_start(name, expand=True)
         view.add_attribute(name, 'text', 0)  
@@ -120,7 +129,7 @@ class GitWindow(Buildable, Window):
             return
         self.repo_path = repo_path
         self.branch_store.clear()
-        self.base_store.clear()
+        self.set_bases_list(None)
         self.diff.get_buffer().set_text('')
 
     def set_branches(self, local_branches, current_branch=None):
@@ -149,14 +158,29 @@ class GitWindow(Buildable, Window):
             number.set_label(number_string)
             self.toolbar_ticket.set_sensitive(True)
 
-    def set_bases_list(self, git_commit_list=None):
+    def set_status(self, text=None):
+        self.statusbar.pop(self.statusbar_context)
+        if text is not None:
+            self.statusbar.push(self.statusbar_context, text)
+
+    def set_busy(self, busy):
+        self.toolbar_stop.set_sensitive(busy)
+        if not busy:
+            self.set_status(None)
+
+    def set_bases_list(self, history=None):
+        """
+        Set the choices for the base commit
+
+        INPUT:
+
+        - ``history`` -- a :class:`~sageui.model.git_history.GitHistory`,
+          a list of commits, or ``None``.
+        """
         self.base_view.set_model(None)
-        self.base_store.clear()
-        if git_commit_list is None:
+        if history is None:
             return
-        for c in git_commit_list:
-            #print c, c.title, c.sha1
-            self.base_store.append([c.title, c.short_sha1, c])
+        self.base_store = HistoryModel(history)
         self.base_view.set_model(self.base_store)
         self._base_view_ignore_next_change = True
         self.base_view.set_active(0)
@@ -164,22 +188,41 @@ class GitWindow(Buildable, Window):
     def set_base(self, git_commit):
         pass
 
+    def _files_row(self, git_file):
+        strikethrough = False
+        background = None
+        if git_file.type == 'staged':
+            background = 'Pale Green'
+        if git_file.type == 'unstaged':
+            background = 'Orange Red'
+        if git_file.type == 'untracked':
+            strikethrough = True
+        return [git_file.name, background, strikethrough, git_file]
+
     def set_changed_files(self, git_file_status_list):
         self.files_view.set_model(None)
         self.files_store.clear()
         for git_file in git_file_status_list:
-            name = git_file.name
-            strikethrough = False
-            background = None
-            if git_file.type == 'staged':
-                background = 'Pale Green'
-            if git_file.type == 'unstaged':
-                background = 'Orange Red'
-            if git_file.type == 'untracked':
-                strikethrough = True
-            self.files_store.append([name, background, strikethrough, git_file])
+            self.files_store.append(self._files_row(git_file))
         self.files_view.set_model(self.files_store)
-            
+
+    def update_changed_files(self, delta):
+        store = self.files_store
+        rows = dict((row[0], row.iter) for row in store)
+        for git_file in delta.removed + delta.changed:
+            it = rows.pop(git_file.name, None)
+            if it is not None:
+                store.remove(it)
+        # merge the sorted additions into the sorted rows in one pass
+        it = store.get_iter_first()
+        for git_file in sorted(delta.added + delta.changed, key=lambda f: f.name):
+            while it is not None and store.get_value(it, 0) < git_file.name:
+                it = store.iter_next(it)
+            if it is None:
+                store.append(self._files_row(git_file))
+            else:
+                store.insert_before(it, self._files_row(git_file))
+
     def set_diff(self, git_file=None):
         if git_file is None:
             self.diff.clear()
@@ -244,9 +287,12 @@ class GitWindow(Buildable, Window):
         self.presenter.load_ticket(self.ticket_number, use_cache=True)
         self.presenter.show_trac_window()
 
+    def on_git_tool_stop_clicked(self, widget, data=None):
+        self.presenter.cancel_git()
+
     def on_git_tool_refresh_clicked(self, widget, data=None):
         n = self.base_view.get_active()
         if n == -1: 
             return
         commit = self.base_store[n][2]
-        self.presenter.base_commit_selected(commit)
+        self.presenter.refresh_git(commit)
@@ -0,0 +1,118 @@
+"""
+Tree Model for the Commit History
+
+A :class:`gtk.TreeModel` that serves the rows of a (lazily loaded)
+commit history, see :mod:`sageui.model.git_history`. Rows are only
+constructed when GTK asks for them, that is, when they are scrolled
+into view. The columns are the same as those of the
+``git_base_store`` list store: title, short SHA-1, and the commit.
+
+The model only has the rows that are already loaded, GTK measures
+all of them. When the last row is shown, the next page is loaded
+and its rows are inserted.
+"""
+
+##############################################################################
+#  SageUI: A graphical user interface to Sage, Trac, and Git.
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+
+import gtk
+import gobject
+
+
+class HistoryModel(gtk.GenericTreeModel):
+
+    _column_types = (str, str, gobject.TYPE_PYOBJECT)
+
+    def __init__(self, history):
+        gtk.GenericTreeModel.__init__(self)
+        self.history = history
+        if hasattr(history, 'loaded'):
+            history[:1]   # load the first page
+            self._length = history.loaded
+            self._complete = False
+        else:
+            self._length = len(history)
+            self._complete = True
+        self._grow_pending = False
+
+    def _grow(self):
+        """
+        Insert the rows of the next page of the history
+        """
+        self._grow_pending = False
+        n = self._length
+        self.history[n:n+1]
+        loaded = self.history.loaded
+        if loaded <= n:
+            self._complete = True
+        for i in range(n, loaded):
+            self._length = i + 1
+            self.row_inserted((i,), self.get_iter((i,)))
+        return False
+
+    def on_get_flags(self):
+        return gtk.TREE_MODEL_LIST_ONLY | gtk.TREE_MODEL_ITERS_PERSIST
+
+    def on_get_n_columns(self):
+        return len(self._column_types)
+
+    def on_get_column_type(self, n):
+        return self._column_types[n]
+
+    def on_get_iter(self, path):
+        if path[0] < self._length:
+            return path[0]
+
+    def on_get_path(self, rowref):
+        return (rowref,)
+
+    def on_get_value(self, rowref, column):
+        if rowref == self._length - 1 and not (self._complete or self._grow_pending):
+            # not while GTK is asking for values
+            self._grow_pending = True
+            gobject.idle_add(self._grow)
+        commit = self.history[rowref]
+        if column == 0:
+            return commit.title
+        elif column == 1:
+            return commit.short_sha1
+        return commit
+
+    def on_iter_next(self, rowref):
+        if rowref + 1 < self._length:
+            return rowref + 1
+
+    def on_iter_children(self, parent):
+        if parent is None and self._length > 0:
+            return 0
+
+    def on_iter_has_child(self, rowref):
+        return False
+
+    def on_iter_n_children(self, rowref):
+        if rowref is None:
+            return self._length
+        return 0
+
+    def on_iter_nth_child(self, parent, n):
+        if parent is None and n < self._length:
+            return n
+
+    def on_iter_parent(self, child):
+        return None
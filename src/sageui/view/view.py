@@ -125,7 +125,16 @@ class View(object):
         self.git_window.hide()
         self._open_windows.remove(self.git_window)
 
-    def set_git_branches(self, local_branches, current_branch=None):
+    def set_git_work_tree(self, repo_path):
+        """
+        Switch the git window to another worktree
+
+        A running commandline window is not restarted, the next one
+        runs Sage in the new work tree.
+        """
+        self.git_window.set_repo(repo_path)
+
+    def set_git_branches(self, local_branches, current_branch=None, history=None):
         assert (current_branch) is None or (current_branch in local_branches)
         self.git_window.set_branches(local_branches, current_branch)
         if current_branch is None:
@@ -133,9 +142,10 @@ class View(object):
             self.git_window.set_ticket_number(None)
             self.git_window.set_diff(None)
         else:
-            self.git_window.set_bases_list(current_branch.commit.get_history())
+            if history is None:
+                history = current_branch.commit.history()
+            self.git_window.set_bases_list(history)
             self.git_window.set_ticket_number(current_branch.ticket_number)
-            self.presenter.base_commit_selected(current_branch.commit)
 
     def set_git_base_commit(self, base_commit, changed_files):
         self.git_window.set_base(base_commit)
@@ -145,6 +155,19 @@ class View(object):
     def set_git_file(self, git_file):
         self.git_window.set_diff(git_file)
 
+    def update_git_changed_files(self, delta):
+        self.git_window.update_changed_files(delta)
+
+    def set_git_progress(self, progress):
+        self.git_window.set_status(progress.text)
+
+    def set_git_busy(self, busy):
+        self.git_window.set_busy(busy)
+
+    def set_git_rebuild_estimate(self, estimate):
+        if estimate is not None:
+            self.git_window.set_status(estimate.summary())
+
     ###################################################################
     # The about dialog
 
@@ -202,6 +225,14 @@ class View(object):
         self._modal_dialog = dlg
         return dlg
         
+    def new_confirm_dialog(self, parent, title, text, callback):
+        from confirm_dialog import ConfirmDialog
+        dlg = ConfirmDialog(self.presenter, self.glade_file, title, text, callback)
+        dlg.window.set_transient_for(parent.window)
+        assert self._modal_dialog is None
+        self._modal_dialog = dlg
+        return dlg
+
     def new_setup_assistant(self, parent, sage_root, callback):
         from setup_assistant import SetupAssistant
         dlg = SetupAssistant(self.presenter, self.glade_file, sage_root, callback)
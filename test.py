@@ -51,6 +51,10 @@ def test_trac_model():
     
 
 
+def test_misc():
+    testmod('sageui.misc.lru_cache')
+
+
 def test_git_model():
     testmod('sageui.model.git_error')
     from sageui.test.test_builder import TestBuilder
@@ -59,6 +63,24 @@ def test_git_model():
     testmod('sageui.model.git_commit', globs={'test':test})
     testmod('sageui.model.git_branch', globs={'test':test})
     testmod('sageui.model.git_repository', globs={'test':test})
+    testmod('sageui.model.git_cat_file', globs={'test':test})
+    testmod('sageui.model.git_async', globs={'test':test})
+    testmod('sageui.model.git_records', globs={'test':test})
+    testmod('sageui.model.git_refs', globs={'test':test})
+    testmod('sageui.model.git_cache', globs={'test':test})
+    testmod('sageui.model.git_stats', globs={'test':test})
+    testmod('sageui.model.git_replay', globs={'test':test})
+    testmod('sageui.model.git_watcher', globs={'test':test})
+    testmod('sageui.model.git_changes', globs={'test':test})
+    testmod('sageui.model.git_untracked', globs={'test':test})
+    testmod('sageui.model.git_diff_cache', globs={'test':test})
+    testmod('sageui.model.git_branch_snapshot', globs={'test':test})
+    testmod('sageui.model.git_history', globs={'test':test})
+    testmod('sageui.model.git_commit_graph', globs={'test':test})
+    testmod('sageui.model.git_worktree', globs={'test':test})
+    testmod('sageui.model.rebuild_estimate', globs={'test':test})
+    testmod('sageui.model.git_mtime', globs={'test':test})
+    testmod('sageui.model.diagnostics', globs={'test':test})
     #repo = sageui.model.git_repository.GitRepository(repo_path, verbose=True)
     #repo.git._user_email_set = False
     #testmod('sageui.model.git_interface', globs={'git':repo.git})
@@ -66,6 +88,7 @@ def test_git_model():
 
 def run_doctests():
     test_trac_model()
+    test_misc()
     test_git_model()
 
 if __name__ == '__main__':